@@ -0,0 +1,43 @@
+"""Background archiving of decided reviews.
+
+Reviews approved or rejected more than ARCHIVE_AFTER_DAYS ago are moved from reviews into
+reviews_archive in batches, so the working table (new-review pages, the sheet sync diff) only holds
+open and recent rows. Archived reviews still count in the client/platform stats and are read only by
+queries that ask for the history (include_archived) and by the sync, for sheet rows it does not find
+among the working reviews."""
+import os
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Age (days since the decision) after which a review is archived
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "30"))
+# Reviews moved per statement (each batch is its own short transaction)
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "1000"))
+# Seconds between archiving runs (0 = never archive)
+ARCHIVE_INTERVAL = int(os.getenv("ARCHIVE_INTERVAL", "3600"))
+
+
+async def archive_once(repo, older_than_days: int = ARCHIVE_AFTER_DAYS, batch_size: int = ARCHIVE_BATCH_SIZE) -> int:
+    """Archive all reviews that are due, batch by batch. Returns the number of reviews moved."""
+    total = 0
+    while True:
+        moved = await repo.archive_decided_reviews(older_than_days, batch_size)
+        total += moved
+        if moved < batch_size:
+            return total
+
+
+async def run_archiver(repo, interval: int = ARCHIVE_INTERVAL):
+    """Archive due reviews every `interval` seconds."""
+    if interval <= 0:
+        return
+    while True:
+        try:
+            moved = await archive_once(repo)
+            if moved:
+                logger.info("Archived %s decided reviews", moved)
+        except Exception as e:
+            logger.error(f"Failed to archive reviews: {e}")
+        await asyncio.sleep(interval)
@@ -0,0 +1,72 @@
+"""Bulk client provisioning from a CSV file uploaded by the admin.
+
+Each line holds a client number, a password and optionally the spreadsheet the client belongs to
+(the N of SPREADSHEET_ID_N, or one of the configured spreadsheet IDs). A header line is allowed and
+',' or ';' may be used as the delimiter. parse_clients_csv() validates the file and returns the valid
+rows with a report line for every rejected one; database.import_clients() then loads the rows with
+COPY and upserts them in one transaction."""
+import csv
+import io
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+# Uploaded files above this size are refused
+MAX_IMPORT_FILE_SIZE = 1024 * 1024
+
+
+@dataclass
+class ClientRow:
+    """A validated line of the import file."""
+    line: int
+    number: int
+    password: str
+    spreadsheet_id: Optional[str] = None
+
+
+def decode_upload(content: bytes) -> str:
+    """Decode an uploaded file: UTF-8 (with or without BOM), falling back to Windows-1251 (Excel)."""
+    try:
+        return content.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        return content.decode("cp1251")
+
+
+def parse_clients_csv(text: str, spreadsheet_ids: List[str]) -> Tuple[List[ClientRow], List[Tuple[int, str]]]:
+    """Validate the lines of an import file. Returns (valid rows, [(line, error)])."""
+    first_line = text.split("\n", 1)[0]
+    delimiter = ";" if first_line.count(";") > first_line.count(",") else ","
+    rows: List[ClientRow] = []
+    errors: List[Tuple[int, str]] = []
+    seen = {}
+    for line_no, fields in enumerate(csv.reader(io.StringIO(text), delimiter=delimiter), start=1):
+        fields = [f.strip() for f in fields]
+        if not any(fields):
+            continue
+        number_text = fields[0]
+        if line_no == 1 and not number_text.isdigit():
+            # Header line
+            continue
+        if not number_text.isdigit() or int(number_text) <= 0:
+            errors.append((line_no, f"некорректный номер клиента «{number_text}»"))
+            continue
+        number = int(number_text)
+        password = fields[1] if len(fields) > 1 else ""
+        if not password:
+            errors.append((line_no, f"клиент {number}: не указан пароль"))
+            continue
+        spreadsheet = fields[2] if len(fields) > 2 else ""
+        spreadsheet_id = None
+        if spreadsheet:
+            if spreadsheet.isdigit() and 1 <= int(spreadsheet) <= len(spreadsheet_ids):
+                spreadsheet_id = spreadsheet_ids[int(spreadsheet) - 1]
+            elif spreadsheet in spreadsheet_ids:
+                spreadsheet_id = spreadsheet
+            else:
+                errors.append((line_no, f"клиент {number}: неизвестная таблица «{spreadsheet}»"))
+                continue
+        if number in seen:
+            errors.append((line_no, f"клиент {number} уже указан в строке {seen[number]}"))
+            continue
+        seen[number] = line_no
+        rows.append(ClientRow(line_no, number, password, spreadsheet_id))
+    return rows, errors
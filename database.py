@@ -1,73 +1,328 @@
 import os
+import asyncio
+import logging
 import asyncpg
+from collections import OrderedDict
+from dataclasses import dataclass
 from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set, Tuple
 
-# Global connection pool
-pool: asyncpg.Pool = None
+import db_pool
+import migrations
+from review_dates import parse_review_date
 
-async def init_db():
-    """Initialize the database connection pool and ensure tables exist."""
-    global pool
+logger = logging.getLogger(__name__)
+
+# The repository (owner of the connection pool), created by init_db()
+repository: "Optional[Repository]" = None
+# Connection parameters of the pool, reused by the dedicated LISTEN connection
+_db_params: dict = {}
+# Apply pending migrations in init_db (set to 0 to run them only with `python setup_db.py migrate`)
+AUTO_MIGRATE = os.getenv("DB_AUTO_MIGRATE", "1") != "0"
+
+# Chat -> authorized client cache (bounded LRU). Values are (id, number) records, or None for chats
+# without an authorized client. Changes of clients are announced on AUTH_CHANNEL by a trigger.
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
+AUTH_CHANNEL = "client_auth_changed"
+_auth_cache: "OrderedDict[int, object]" = OrderedDict()
+# Bumped on every invalidation, so a lookup that raced with a change does not cache a stale result
+_auth_cache_generation = 0
+
+# Columns shared by reviews and reviews_archive
+_REVIEW_COLUMNS = ("id, client_id, platform_id, review_text, review_date_raw, review_date, manager_comment, "
+                   "status, photo_link, decided_at, duplicate_of")
+# Working and archived reviews together, for the (rare) queries that need the whole history
+_ALL_REVIEWS = (f"(SELECT {_REVIEW_COLUMNS} FROM reviews "
+                f"UNION ALL SELECT {_REVIEW_COLUMNS} FROM reviews_archive)")
+
+# Trigram similarity (0..1) from which a new review is flagged as a near-duplicate of an earlier one of
+# the same platform. Values below pg_trgm.similarity_threshold (0.3) behave like 0.3.
+DUPLICATE_SIMILARITY = float(os.getenv("DUPLICATE_SIMILARITY", "0.6"))
+# Markers around the matched words in search snippets (escaped and turned into <b> by the handler)
+SEARCH_MATCH_START = "⟦"
+SEARCH_MATCH_END = "⟧"
+
+@dataclass
+class NewReview:
+    """A review to be inserted with Repository.bulk_create_reviews()."""
+    client_id: int
+    platform_id: int
+    text: str
+    date: Optional[str] = None
+    manager_comment: str = ""
+    status: str = "new"
+    photo_link: Optional[str] = None
+
+
+class Repository:
+    """Owns the connection pool and is the only path to PostgreSQL.
+
+    Created once by init_db() and passed to the components that need it. Besides acquire(), it offers
+    set-based methods for loops over many rows (sheet import and sync); the module-level helpers below
+    are single-row operations on top of the same pool."""
+
+    def __init__(self, pool: asyncpg.Pool):
+        self.pool = pool
+
+    def acquire(self):
+        """Acquire a pooled connection (use as `async with repo.acquire() as conn`); usage is recorded in db_pool.metrics."""
+        return db_pool.acquire(self.pool)
+
+    async def close(self):
+        await self.pool.close()
+
+    async def get_clients_by_numbers(self, numbers: Iterable[int]) -> Dict[int, asyncpg.Record]:
+        """Clients (id, number, authorized, telegram_id, spreadsheet_id) by client number; unknown numbers are missing."""
+        async with self.acquire() as conn:
+            rows = await conn.fetch(
+                "SELECT id, number, authorized, telegram_id, spreadsheet_id FROM clients WHERE number = ANY($1::int[]);",
+                list(numbers)
+            )
+        return {r["number"]: r for r in rows}
+
+    async def get_client_spreadsheet_ids(self) -> List[str]:
+        """Spreadsheets assigned to clients individually (clients.spreadsheet_id, set by the bulk import)."""
+        async with self.acquire() as conn:
+            rows = await conn.fetch(
+                "SELECT DISTINCT spreadsheet_id FROM clients WHERE spreadsheet_id IS NOT NULL;"
+            )
+        return [r["spreadsheet_id"] for r in rows]
+
+    async def upsert_platforms(self, client_id: int, platforms: Dict[int, Optional[str]]) -> Dict[int, int]:
+        """Make sure the client has the given platforms ({number: url}). Returns {number: platform_id}.
+
+        Missing platforms are created; an existing platform only gets a URL if it had none."""
+        if not platforms:
+            return {}
+        numbers = list(platforms)
+        urls = [platforms[n] for n in numbers]
+        async with self.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute("""
+                    INSERT INTO platforms(client_id, number, url)
+                    SELECT $1, n, u FROM unnest($2::int[], $3::text[]) AS t(n, u)
+                    ON CONFLICT (client_id, number) DO UPDATE SET url = EXCLUDED.url
+                    WHERE platforms.url IS NULL AND EXCLUDED.url IS NOT NULL;
+                """, client_id, numbers, urls)
+                rows = await conn.fetch(
+                    "SELECT number, id FROM platforms WHERE client_id=$1 AND number = ANY($2::int[]);",
+                    client_id, numbers
+                )
+        return {r["number"]: r["id"] for r in rows}
+
+    async def bulk_create_reviews(self, reviews: List[NewReview]) -> int:
+        """Insert many reviews with a single statement. Returns the number inserted.
+
+        Each review is checked against the earlier reviews of its platform and near-duplicates are
+        flagged in duplicate_of. Rows of the same batch cannot see each other in that statement, so a
+        second statement then compares the still unflagged rows with the earlier rows of the batch.
+        Both use the trigram `%` operator with pg_trgm.similarity_threshold set to DUPLICATE_SIMILARITY
+        for the transaction, so the platform-scoped trigram indexes find the candidates."""
+        if not reviews:
+            return 0
+        async with self.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute("SELECT set_config('pg_trgm.similarity_threshold', $1, true);",
+                                   str(DUPLICATE_SIMILARITY))
+                rows = await conn.fetch("""
+                    INSERT INTO reviews(client_id, platform_id, review_text, review_date_raw, review_date,
+                                        manager_comment, status, photo_link, duplicate_of)
+                    SELECT n.*, find_duplicate_review(n.platform_id, n.review_text, $9)
+                    FROM unnest($1::int[], $2::int[], $3::text[], $4::text[], $5::timestamptz[],
+                                $6::text[], $7::text[], $8::text[])
+                        AS n(client_id, platform_id, review_text, review_date_raw, review_date,
+                             manager_comment, status, photo_link)
+                    RETURNING id, duplicate_of;
+                """,
+                    [r.client_id for r in reviews], [r.platform_id for r in reviews], [r.text for r in reviews],
+                    [r.date for r in reviews], [parse_review_date(r.date) for r in reviews],
+                    [r.manager_comment for r in reviews], [r.status for r in reviews], [r.photo_link for r in reviews],
+                    DUPLICATE_SIMILARITY
+                )
+                duplicate_of = {r["id"]: r["duplicate_of"] for r in rows}
+                unflagged = [r["id"] for r in rows if r["duplicate_of"] is None]
+                if len(rows) > 1 and unflagged:
+                    batch_flagged = await conn.fetch("""
+                        UPDATE reviews r SET duplicate_of = d.earlier_id
+                        FROM (
+                            SELECT later.id, (
+                                SELECT earlier.id FROM reviews earlier
+                                WHERE earlier.platform_id = later.platform_id
+                                  AND earlier.review_text % later.review_text
+                                  AND earlier.id = ANY($1::int[]) AND earlier.id < later.id
+                                ORDER BY similarity(earlier.review_text, later.review_text) DESC, earlier.id
+                                LIMIT 1
+                            ) AS earlier_id
+                            FROM reviews later
+                            WHERE later.id = ANY($2::int[])
+                        ) d
+                        WHERE r.id = d.id AND d.earlier_id IS NOT NULL
+                        RETURNING r.id, r.duplicate_of;
+                    """, [r["id"] for r in rows], unflagged)
+                    duplicate_of.update((r["id"], r["duplicate_of"]) for r in batch_flagged)
+        flagged = [(review_id, original) for review_id, original in duplicate_of.items() if original is not None]
+        if flagged:
+            logger.info("%s of %s imported reviews look like duplicates: %s", len(flagged), len(rows),
+                        ", ".join(f"{review_id}~{original}" for review_id, original in flagged))
+        return len(rows)
+
+    async def bulk_update_statuses(self, changes: List[Tuple[int, str, Optional[str]]]) -> int:
+        """Set (review_id, status, manager_comment) for many reviews with a single statement.
+
+        A None comment leaves the stored comment unchanged. Returns the number of reviews updated."""
+        if not changes:
+            return 0
+        async with self.acquire() as conn:
+            result = await conn.execute("""
+                UPDATE reviews r SET status = c.status, manager_comment = COALESCE(c.manager_comment, r.manager_comment)
+                FROM unnest($1::int[], $2::text[], $3::text[]) AS c(id, status, manager_comment)
+                WHERE r.id = c.id;
+            """, [c[0] for c in changes], [c[1] for c in changes], [c[2] for c in changes])
+        return int(result.split()[-1])
+
+    async def get_client_reviews(self, client_id: int) -> List[asyncpg.Record]:
+        """Working (not archived) reviews of a client with their platform number (for the sheet sync)."""
+        async with self.acquire() as conn:
+            return await conn.fetch("""
+                SELECT r.id, p.number AS plat_num, r.review_text, r.review_date_raw, r.manager_comment, r.status,
+                       r.photo_link, r.duplicate_of
+                FROM reviews r
+                JOIN platforms p ON r.platform_id = p.id
+                WHERE r.client_id=$1;
+            """, client_id)
+
+    async def list_reviews_by_window(self, client_id: int, since: Optional[datetime] = None,
+                                     until: Optional[datetime] = None, limit: int = 50,
+                                     before: Optional[Tuple[datetime, int]] = None,
+                                     include_archived: bool = False) -> List[asyncpg.Record]:
+        """Reviews of a client dated in [since, until), newest first.
+
+        Pages with a keyset: pass the (review_date, id) of the last row as `before` to get the next page.
+        Reviews whose date could not be parsed have no review_date and are not listed. Archived
+        reviews are only included with include_archived."""
+        source = _ALL_REVIEWS if include_archived else "reviews"
+        async with self.acquire() as conn:
+            return await conn.fetch(f"""
+                SELECT r.id, p.number AS platform_number, r.review_text, r.review_date, r.review_date_raw,
+                       r.status, r.photo_link
+                FROM {source} r
+                JOIN platforms p ON r.platform_id = p.id
+                WHERE r.client_id = $1 AND r.review_date IS NOT NULL
+                  AND ($2::timestamptz IS NULL OR r.review_date >= $2)
+                  AND ($3::timestamptz IS NULL OR r.review_date < $3)
+                  AND ($4::timestamptz IS NULL OR (r.review_date, r.id) < ($4, $5::int))
+                ORDER BY r.review_date DESC, r.id DESC
+                LIMIT $6;
+            """, client_id, since, until, before[0] if before else None, before[1] if before else None, limit)
+
+    async def count_reviews_by_window(self, since: datetime, until: datetime, client_id: Optional[int] = None,
+                                      status: Optional[str] = None, include_archived: bool = False) -> int:
+        """Number of reviews dated in [since, until), optionally of one client and/or with one status."""
+        source = _ALL_REVIEWS if include_archived else "reviews"
+        async with self.acquire() as conn:
+            return await conn.fetchval(f"""
+                SELECT COUNT(*) FROM {source} r
+                WHERE review_date >= $1 AND review_date < $2
+                  AND ($3::int IS NULL OR client_id = $3)
+                  AND ($4::text IS NULL OR status = $4);
+            """, since, until, client_id, status)
+
+    async def find_archived_reviews(self, client_id: int,
+                                    keys: Iterable[Tuple[int, str, str]]) -> Set[Tuple[int, str, str]]:
+        """Which of the sheet keys (platform number, text, raw date) belong to archived reviews of the client."""
+        keys = list(keys)
+        if not keys:
+            return set()
+        async with self.acquire() as conn:
+            rows = await conn.fetch("""
+                SELECT k.plat_num, k.review_text, k.review_date_raw
+                FROM unnest($2::int[], $3::text[], $4::text[]) AS k(plat_num, review_text, review_date_raw)
+                WHERE EXISTS (
+                    SELECT 1 FROM reviews_archive a JOIN platforms p ON p.id = a.platform_id
+                    WHERE a.client_id = $1 AND p.number = k.plat_num AND a.review_text = k.review_text
+                      AND COALESCE(a.review_date_raw, '') = k.review_date_raw
+                );
+            """, client_id, [k[0] for k in keys], [k[1] for k in keys], [k[2] for k in keys])
+        return {(r["plat_num"], r["review_text"], r["review_date_raw"]) for r in rows}
+
+    async def archive_decided_reviews(self, older_than_days: int, limit: int = 1000) -> int:
+        """Move up to `limit` reviews decided more than `older_than_days` ago into reviews_archive.
+
+        Reviews with a queued or running photo upload stay. Returns the number of reviews moved."""
+        async with self.acquire() as conn:
+            result = await conn.execute(f"""
+                WITH moved AS (
+                    DELETE FROM reviews r
+                    WHERE r.id IN (
+                        SELECT c.id FROM reviews c
+                        WHERE c.status IN ('approved', 'rejected')
+                          AND c.decided_at < NOW() - make_interval(days => $1)
+                          AND NOT EXISTS (SELECT 1 FROM photo_upload_jobs j
+                                          WHERE j.review_id = c.id AND j.status IN ('queued', 'running'))
+                        ORDER BY c.decided_at
+                        LIMIT $2
+                        FOR UPDATE SKIP LOCKED
+                    )
+                    RETURNING {_REVIEW_COLUMNS}
+                )
+                INSERT INTO reviews_archive({_REVIEW_COLUMNS})
+                SELECT {_REVIEW_COLUMNS} FROM moved;
+            """, older_than_days, limit)
+        return int(result.split()[-1])
+
+    async def get_authorized_clients(self) -> List[asyncpg.Record]:
+        """Clients (id, number, telegram_id) that are logged in to the bot."""
+        async with self.acquire() as conn:
+            return await conn.fetch("SELECT id, number, telegram_id FROM clients WHERE authorized=True;")
+
+    async def get_new_counts(self, client_ids: List[int]) -> List[asyncpg.Record]:
+        """New review counts (client_id, platform_id, platform_number, new_count) of the clients' platforms."""
+        if not client_ids:
+            return []
+        async with self.acquire() as conn:
+            return await conn.fetch("""
+                SELECT p.client_id, p.id AS platform_id, p.number AS platform_number, pc.new_reviews AS new_count
+                FROM platforms p
+                JOIN platform_review_counters pc ON pc.platform_id = p.id
+                WHERE p.client_id = ANY($1::int[]);
+            """, client_ids)
+
+
+def acquire():
+    """Acquire a pooled connection from the repository (use as `async with acquire() as conn`)."""
+    return repository.acquire()
+
+async def init_db() -> Repository:
+    """Create the repository with its connection pool and apply pending schema migrations."""
+    global repository
     # Read database configuration from environment
     db_host = os.getenv("DB_HOST", "localhost")
     db_port = os.getenv("DB_PORT", "5432")
     db_name = os.getenv("DB_NAME", "")
     db_user = os.getenv("DB_USER", "")
     db_password = os.getenv("DB_PASSWORD", "")
-    # Create connection pool
-    pool = await asyncpg.create_pool(
-        host=db_host,
-        port=int(db_port),
-        user=db_user,
-        password=db_password,
-        database=db_name
-    )
-    # Create tables if they do not exist
-    async with pool.acquire() as conn:
-        await conn.execute("""
-        CREATE TABLE IF NOT EXISTS clients (
-            id SERIAL PRIMARY KEY,
-            number INTEGER UNIQUE NOT NULL,
-            password TEXT NOT NULL,
-            authorized BOOLEAN DEFAULT FALSE,
-            telegram_id BIGINT
-        );
-        CREATE TABLE IF NOT EXISTS platforms (
-            id SERIAL PRIMARY KEY,
-            client_id INTEGER NOT NULL REFERENCES clients(id) ON DELETE CASCADE,
-            number INTEGER NOT NULL,
-            url TEXT,
-            UNIQUE(client_id, number)
-        );
-        CREATE TABLE IF NOT EXISTS reviews (
-            id SERIAL PRIMARY KEY,
-            client_id INTEGER NOT NULL REFERENCES clients(id) ON DELETE CASCADE,
-            platform_id INTEGER NOT NULL REFERENCES platforms(id) ON DELETE CASCADE,
-            review_text TEXT NOT NULL,
-            review_date TEXT,
-            manager_comment TEXT,
-            status TEXT NOT NULL,
-            photo_link TEXT
-        );
-        CREATE TABLE IF NOT EXISTS photo_packs (
-            id SERIAL PRIMARY KEY,
-            client_id INTEGER NOT NULL REFERENCES clients(id) ON DELETE CASCADE,
-            platform_id INTEGER NOT NULL REFERENCES platforms(id) ON DELETE CASCADE,
-            folder_link TEXT,
-            created_at TIMESTAMP NOT NULL DEFAULT NOW(),
-            synced BOOLEAN NOT NULL DEFAULT FALSE
-        );
-        """)
+    _db_params.update(host=db_host, port=int(db_port), user=db_user, password=db_password, database=db_name)
+    # Bring the schema up to date (see migrations.py)
+    if AUTO_MIGRATE:
+        # Dedicated connection without the pool's command timeout: index builds may take a while
+        conn = await asyncpg.connect(**_db_params)
+        try:
+            await migrations.migrate(conn)
+        finally:
+            await conn.close()
+    # Create connection pool (after migrating, so new connections can prepare the hot statements)
+    repository = Repository(await db_pool.create_pool(**_db_params))
+    return repository
 
 async def is_clients_empty() -> bool:
     """Check if the clients table is empty (no clients imported yet)."""
-    async with pool.acquire() as conn:
+    async with acquire() as conn:
         result = await conn.fetchval("SELECT COUNT(*) FROM clients;")
         return result == 0
 
 async def create_client(number: int, password: str) -> int:
     """Create a new client with the given number and password. Returns client ID."""
-    async with pool.acquire() as conn:
+    async with acquire() as conn:
         # Insert client (authorized False by default)
         client_id = await conn.fetchval(
             "INSERT INTO clients(number, password) VALUES($1, $2) RETURNING id;",
@@ -75,17 +330,53 @@ async def create_client(number: int, password: str) -> int:
         )
         return client_id
 
+async def import_clients(rows) -> List[asyncpg.Record]:
+    """Create or update many clients (client_import.ClientRow) in one transaction.
+
+    The rows are loaded with COPY into a temporary staging table and upserted from there: new numbers
+    are created, existing clients get the new password (and spreadsheet, if given). Returns
+    (line, number, created) for every row."""
+    async with acquire() as conn:
+        async with conn.transaction():
+            await conn.execute("""
+                CREATE TEMP TABLE client_import (
+                    line INTEGER NOT NULL,
+                    number INTEGER NOT NULL,
+                    password TEXT NOT NULL,
+                    spreadsheet_id TEXT
+                ) ON COMMIT DROP;
+            """)
+            await conn.copy_records_to_table(
+                "client_import",
+                records=[(r.line, r.number, r.password, r.spreadsheet_id) for r in rows],
+                columns=["line", "number", "password", "spreadsheet_id"]
+            )
+            return await conn.fetch("""
+                WITH upserted AS (
+                    INSERT INTO clients(number, password, spreadsheet_id)
+                    SELECT number, password, spreadsheet_id FROM client_import
+                    ON CONFLICT (number) DO UPDATE SET
+                        password = EXCLUDED.password,
+                        spreadsheet_id = COALESCE(EXCLUDED.spreadsheet_id, clients.spreadsheet_id)
+                    RETURNING number, (xmax = 0) AS created
+                )
+                SELECT i.line, u.number, u.created
+                FROM upserted u JOIN client_import i ON i.number = u.number
+                ORDER BY i.line;
+            """)
+
 async def update_client_number(client_id: int, new_number: int):
     """Update the client number (identifier) for a given client."""
-    async with pool.acquire() as conn:
+    async with acquire() as conn:
         await conn.execute(
             "UPDATE clients SET number=$1 WHERE id=$2;",
             new_number, client_id
         )
+    invalidate_auth_cache(client_id=client_id)
 
 async def update_client_password(client_id: int, new_password: str):
     """Update the password for a given client."""
-    async with pool.acquire() as conn:
+    async with acquire() as conn:
         await conn.execute(
             "UPDATE clients SET password=$1 WHERE id=$2;",
             new_password, client_id
@@ -93,46 +384,88 @@ async def update_client_password(client_id: int, new_password: str):
 
 async def get_client_by_number(number: int):
     """Fetch a client record by client number."""
-    async with pool.acquire() as conn:
-        return await conn.fetchrow(
-            "SELECT id, password, authorized, telegram_id FROM clients WHERE number=$1;",
-            number
-        )
+    async with acquire() as conn:
+        return await db_pool.run_statement(conn, "client_by_number", "fetchrow", number)
 
 async def authorize_client(client_id: int, chat_id: int):
     """Set a client as authorized and store their Telegram chat ID."""
-    async with pool.acquire() as conn:
+    async with acquire() as conn:
         await conn.execute(
             "UPDATE clients SET authorized=True, telegram_id=$1 WHERE id=$2;",
             chat_id, client_id
         )
+    invalidate_auth_cache([chat_id], client_id=client_id)
 
 async def unauthorize_client(client_id: int):
     """Mark a client as unauthorized (logout)."""
-    async with pool.acquire() as conn:
+    async with acquire() as conn:
         await conn.execute(
             "UPDATE clients SET authorized=False, telegram_id=NULL WHERE id=$1;",
             client_id
         )
+    invalidate_auth_cache(client_id=client_id)
 
 async def get_authorized_client_by_chat(chat_id: int):
-    """Get the client (id, number) that is authorized for this Telegram chat, if any."""
-    async with pool.acquire() as conn:
-        return await conn.fetchrow(
-            "SELECT id, number FROM clients WHERE telegram_id=$1 AND authorized=True;",
-            chat_id
-        )
+    """Get the client (id, number) that is authorized for this Telegram chat, if any.
+
+    Served from an in-process LRU cache; the database is only queried on a miss."""
+    if chat_id in _auth_cache:
+        _auth_cache.move_to_end(chat_id)
+        return _auth_cache[chat_id]
+    generation = _auth_cache_generation
+    async with acquire() as conn:
+        row = await db_pool.run_statement(conn, "client_by_chat", "fetchrow", chat_id)
+    if generation == _auth_cache_generation:
+        _auth_cache[chat_id] = row
+        if len(_auth_cache) > AUTH_CACHE_SIZE:
+            _auth_cache.popitem(last=False)
+    return row
+
+def invalidate_auth_cache(chat_ids: list = None, client_id: int = None):
+    """Drop cached authorizations of the given chats and/or client (everything if neither is given)."""
+    global _auth_cache_generation
+    _auth_cache_generation += 1
+    if chat_ids is None and client_id is None:
+        _auth_cache.clear()
+        return
+    for chat_id in chat_ids or []:
+        _auth_cache.pop(chat_id, None)
+    if client_id is not None:
+        for chat_id in [c for c, row in _auth_cache.items() if row is not None and row["id"] == client_id]:
+            del _auth_cache[chat_id]
+
+def _on_auth_notification(connection, pid, channel, payload):
+    invalidate_auth_cache([int(chat_id) for chat_id in payload.split(",") if chat_id])
+
+async def listen_client_changes(retry_delay: float = 5):
+    """Keep a dedicated LISTEN connection and drop cached authorizations changed by any process."""
+    while True:
+        conn = None
+        try:
+            conn = await asyncpg.connect(**_db_params)
+            closed = asyncio.Event()
+            conn.add_termination_listener(lambda c: closed.set())
+            await conn.add_listener(AUTH_CHANNEL, _on_auth_notification)
+            # Changes made while we were not listening are unknown
+            invalidate_auth_cache()
+            await closed.wait()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Client change listener failed: {e}")
+        finally:
+            if conn is not None and not conn.is_closed():
+                await conn.close()
+        # Until the listener is back, other processes' changes would go unnoticed
+        invalidate_auth_cache()
+        await asyncio.sleep(retry_delay)
 
 async def get_client_stats(client_id: int) -> dict:
-    """Compute statistics for a client: number of platforms, total reviews, approved and new reviews."""
-    async with pool.acquire() as conn:
-        row = await conn.fetchrow("""
-            SELECT 
-                (SELECT COUNT(*) FROM platforms WHERE client_id=$1) AS platforms_count,
-                (SELECT COUNT(*) FROM reviews WHERE client_id=$1) AS total_reviews,
-                (SELECT COUNT(*) FROM reviews WHERE client_id=$1 AND status='approved') AS approved_reviews,
-                (SELECT COUNT(*) FROM reviews WHERE client_id=$1 AND status='new') AS new_reviews;
-        """, client_id)
+    """Statistics for a client: number of platforms, total reviews, approved and new reviews.
+
+    Read from client_review_counters (kept up to date by triggers), so the cost does not depend on the number of reviews."""
+    async with acquire() as conn:
+        row = await db_pool.run_statement(conn, "client_stats", "fetchrow", client_id)
         if row:
             return {
                 "platforms_count": row["platforms_count"],
@@ -140,86 +473,267 @@ async def get_client_stats(client_id: int) -> dict:
                 "approved_reviews": row["approved_reviews"],
                 "new_reviews": row["new_reviews"]
             }
-        return None
+        # No counters yet: the client has neither platforms nor reviews
+        return {"platforms_count": 0, "total_reviews": 0, "approved_reviews": 0, "new_reviews": 0}
 
-async def create_platform(client_id: int, platform_number: int, url: str) -> int:
-    """Create a platform record for a client. Returns platform ID."""
-    async with pool.acquire() as conn:
-        platform_id = await conn.fetchval(
-            "INSERT INTO platforms(client_id, number, url) VALUES($1, $2, $3) RETURNING id;",
-            client_id, platform_number, url
-        )
-        return platform_id
+async def iter_export_reviews(client_id: int = None, chunk_size: int = 2000):
+    """Yield the working and archived reviews of a client (or of all clients) for export.
 
-async def get_platform_id(client_id: int, platform_number: int):
-    """Fetch the platform id for a given client and platform number."""
-    async with pool.acquire() as conn:
-        return await conn.fetchval(
-            "SELECT id FROM platforms WHERE client_id=$1 AND number=$2;",
-            client_id, platform_number
-        )
-
-async def create_review(client_id: int, platform_id: int, text: str, date: str, manager_comment: str, status: str, photo_link: str = None):
-    """Create a new review record in the database."""
-    async with pool.acquire() as conn:
-        await conn.execute(
-            "INSERT INTO reviews(client_id, platform_id, review_text, review_date, manager_comment, status, photo_link) "
-            "VALUES($1, $2, $3, $4, $5, $6, $7);",
-            client_id, platform_id, text, date, manager_comment, status, photo_link
-        )
+    Rows are read through a server-side cursor, `chunk_size` at a time, so memory use does not depend
+    on the number of reviews. Use as `async for row in iter_export_reviews(...)`."""
+    async with acquire() as conn:
+        async with conn.transaction():
+            cursor = conn.cursor(f"""
+                SELECT r.id, c.number AS client_number, p.number AS platform_number, r.status,
+                       r.review_date, r.review_date_raw, r.review_text, r.manager_comment, r.photo_link,
+                       r.decided_at, r.archived
+                FROM (SELECT {_REVIEW_COLUMNS}, FALSE AS archived FROM reviews
+                      UNION ALL SELECT {_REVIEW_COLUMNS}, TRUE FROM reviews_archive) r
+                JOIN clients c ON c.id = r.client_id
+                JOIN platforms p ON p.id = r.platform_id
+                WHERE $1::int IS NULL OR r.client_id = $1
+                ORDER BY c.number, p.number, r.id;
+            """, client_id, prefetch=chunk_size)
+            async for row in cursor:
+                yield row
 
-async def update_review_status(review_id: int, new_status: str):
-    """Update the status of a review."""
-    async with pool.acquire() as conn:
-        await conn.execute(
-            "UPDATE reviews SET status=$1 WHERE id=$2;",
-            new_status, review_id
-        )
+async def iter_export_stats(chunk_size: int = 2000):
+    """Yield the review counts of every client (from the counters) for export."""
+    async with acquire() as conn:
+        async with conn.transaction():
+            cursor = conn.cursor("""
+                SELECT c.number AS client_number, c.authorized,
+                       COALESCE(cc.platforms_count, 0) AS platforms_count,
+                       COALESCE(cc.total_reviews, 0) AS total_reviews,
+                       COALESCE(cc.approved_reviews, 0) AS approved_reviews,
+                       COALESCE(cc.new_reviews, 0) AS new_reviews
+                FROM clients c
+                LEFT JOIN client_review_counters cc ON cc.client_id = c.id
+                ORDER BY c.number;
+            """, prefetch=chunk_size)
+            async for row in cursor:
+                yield row
 
-async def update_review_text(review_id: int, new_text: str):
-    """Update the text of a review."""
-    async with pool.acquire() as conn:
-        await conn.execute(
-            "UPDATE reviews SET review_text=$1 WHERE id=$2;",
-            new_text, review_id
-        )
+async def get_platform_id(client_id: int, platform_number: int):
+    """Fetch the platform id for a given client and platform number."""
+    async with acquire() as conn:
+        return await db_pool.run_statement(conn, "platform_id", "fetchval", client_id, platform_number)
 
 async def update_review_photo(review_id: int, folder_link: str):
     """Update a review to mark it approved and set its photo link."""
-    async with pool.acquire() as conn:
+    async with acquire() as conn:
         await conn.execute(
             "UPDATE reviews SET status='approved', photo_link=$1 WHERE id=$2;",
             folder_link, review_id
         )
 
-async def get_new_reviews(client_id: int, platform_id: int):
-    """Get all 'new' status reviews for a given client and platform."""
-    async with pool.acquire() as conn:
-        return await conn.fetch(
-            "SELECT id, review_text FROM reviews WHERE client_id=$1 AND platform_id=$2 AND status='new';",
-            client_id, platform_id
+async def apply_review_changes(client_id: int, updates: list, inserts: list):
+    """Apply a client's whole report in one transaction.
+
+    updates: dicts with review_id, status, text, photo_link, job_key (None = leave unchanged); each review
+    appears once. inserts: dicts with platform_number, date, text. A photo upload that is still running
+    is asked to write its link when it finishes; finished uploads give their link here.
+    Returns (updated, inserted): updated rows have id, old_text, review_text, status, photo_link;
+    inserted rows have id, platform_number, review_text (inserts for unknown platforms are skipped)."""
+    async with acquire() as conn:
+        async with conn.transaction():
+            job_keys = [u["job_key"] for u in updates if u.get("job_key")]
+            job_links = {}
+            if job_keys:
+                rows = await conn.fetch(
+                    "UPDATE photo_upload_jobs SET apply_on_finish=TRUE WHERE job_key = ANY($1::text[]) "
+                    "RETURNING job_key, status, folder_link;",
+                    job_keys
+                )
+                job_links = {r["job_key"]: r["folder_link"] for r in rows
+                             if r["status"] in ("done", "failed") and r["folder_link"]}
+            updated = []
+            if updates:
+                updated = await conn.fetch("""
+                    WITH u AS (
+                        SELECT * FROM unnest($1::int[], $2::text[], $3::text[], $4::text[])
+                            AS u(id, status, review_text, photo_link)
+                    ), old AS (
+                        SELECT r.id, r.review_text FROM reviews r JOIN u ON u.id = r.id
+                        WHERE r.client_id = $5 FOR UPDATE OF r
+                    )
+                    UPDATE reviews r SET
+                        status = COALESCE(u.status, r.status),
+                        review_text = COALESCE(u.review_text, r.review_text),
+                        photo_link = COALESCE(u.photo_link, r.photo_link)
+                    FROM u JOIN old ON old.id = u.id
+                    WHERE r.id = u.id
+                    RETURNING r.id, old.review_text AS old_text, r.review_text, r.status, r.photo_link;
+                """,
+                    [u["review_id"] for u in updates],
+                    [u.get("status") for u in updates],
+                    [u.get("text") for u in updates],
+                    [u.get("photo_link") or job_links.get(u.get("job_key")) for u in updates],
+                    client_id
+                )
+            inserted = []
+            if inserts:
+                inserted = await conn.fetch("""
+                    WITH ins AS (
+                        INSERT INTO reviews(client_id, platform_id, review_text, review_date_raw, review_date,
+                                            manager_comment, status, duplicate_of)
+                        SELECT $1, p.id, i.review_text, i.review_date_raw, i.review_date, '', 'pending',
+                               find_duplicate_review(p.id, i.review_text, $6)
+                        FROM unnest($2::int[], $3::text[], $4::text[], $5::timestamptz[]) WITH ORDINALITY
+                            AS i(platform_number, review_date_raw, review_text, review_date, seq)
+                        JOIN platforms p ON p.client_id = $1 AND p.number = i.platform_number
+                        ORDER BY i.seq
+                        RETURNING id, platform_id, review_text, duplicate_of
+                    )
+                    SELECT ins.id, p.number AS platform_number, ins.review_text, ins.duplicate_of
+                    FROM ins JOIN platforms p ON p.id = ins.platform_id
+                    ORDER BY ins.id;
+                """,
+                    client_id,
+                    [i["platform_number"] for i in inserts],
+                    [i["date"] for i in inserts],
+                    [i["text"] for i in inserts],
+                    [parse_review_date(i["date"]) for i in inserts],
+                    DUPLICATE_SIMILARITY
+                )
+            return updated, inserted
+
+async def search_reviews(query: str, client_id: Optional[int] = None, platform_id: Optional[int] = None,
+                         before_id: Optional[int] = None, limit: int = 10) -> List[asyncpg.Record]:
+    """Full-text search (Russian configuration) over working and archived reviews, newest first.
+
+    `query` uses web search syntax ("quoted phrase", -word, or). Results can be scoped to a client
+    or a platform and are paged by id: pass the id of the last row as before_id for the next page.
+    Each row has a `snippet` with the matched words between SEARCH_MATCH_START/SEARCH_MATCH_END.
+    The to_tsvector expression must match the one of the idx_*_text_fts indexes (migrations 9, 10)."""
+    async with acquire() as conn:
+        return await conn.fetch(f"""
+            WITH q AS (SELECT websearch_to_tsquery('russian', $1) AS query),
+            found AS (
+                SELECT * FROM (
+                    SELECT id, client_id, platform_id, status, review_date_raw, review_text, FALSE AS archived
+                    FROM reviews, q
+                    WHERE to_tsvector('russian', review_text) @@ q.query
+                      AND ($2::int IS NULL OR client_id = $2) AND ($3::int IS NULL OR platform_id = $3)
+                      AND ($4::int IS NULL OR id < $4)
+                    UNION ALL
+                    SELECT id, client_id, platform_id, status, review_date_raw, review_text, TRUE
+                    FROM reviews_archive, q
+                    WHERE to_tsvector('russian', review_text) @@ q.query
+                      AND ($2::int IS NULL OR client_id = $2) AND ($3::int IS NULL OR platform_id = $3)
+                      AND ($4::int IS NULL OR id < $4)
+                ) m
+                ORDER BY id DESC
+                LIMIT $5
+            )
+            SELECT f.id, c.number AS client_number, p.number AS platform_number, f.status, f.review_date_raw,
+                   f.archived,
+                   ts_headline('russian', f.review_text, q.query,
+                               'StartSel={SEARCH_MATCH_START}, StopSel={SEARCH_MATCH_END}, MaxWords=30, MinWords=10')
+                       AS snippet
+            FROM found f
+            CROSS JOIN q
+            JOIN clients c ON c.id = f.client_id
+            JOIN platforms p ON p.id = f.platform_id
+            ORDER BY f.id DESC;
+        """, query, client_id, platform_id, before_id, limit)
+
+async def find_similar_review(platform_id: int, text: str, threshold: float = DUPLICATE_SIMILARITY):
+    """Most similar earlier review (id, review_text, status, similarity) of the platform, or None."""
+    async with acquire() as conn:
+        return await conn.fetchrow(f"""
+            WITH d AS (SELECT find_duplicate_review($1, $2, $3) AS id)
+            SELECT r.id, r.review_text, r.status, similarity(r.review_text, $2) AS similarity
+            FROM d JOIN {_ALL_REVIEWS} r ON r.id = d.id;
+        """, platform_id, text, threshold)
+
+async def get_review_texts(review_ids: List[int]) -> Dict[int, str]:
+    """Texts of working or archived reviews by id."""
+    if not review_ids:
+        return {}
+    async with acquire() as conn:
+        rows = await conn.fetch(
+            f"SELECT id, review_text FROM {_ALL_REVIEWS} r WHERE id = ANY($1::int[]);", review_ids
         )
+    return {r["id"]: r["review_text"] for r in rows}
+
+async def get_new_review_ids(client_id: int, platform_id: int) -> list:
+    """Get the IDs of all 'new' status reviews for a given client and platform."""
+    async with acquire() as conn:
+        rows = await db_pool.run_statement(conn, "new_review_ids", "fetch", client_id, platform_id)
+        return [r["id"] for r in rows]
+
+async def get_new_reviews_page(client_id: int, platform_id: int, after_id: int = None,
+                               before_id: int = None, limit: int = 10):
+    """Get one keyset page of 'new' reviews for a platform, ordered by id.
+
+    Pass after_id to move forward or before_id to move backward; with neither, the first page is returned.
+    Returns (rows, has_prev, has_next)."""
+    if before_id is not None:
+        name, cursor = "new_reviews_page_prev", before_id
+    else:
+        name, cursor = "new_reviews_page_next", after_id or 0
+    async with acquire() as conn:
+        rows = await db_pool.run_statement(conn, name, "fetch", client_id, platform_id, cursor, limit)
+    if not rows:
+        return [], False, False
+    return rows, rows[0]["has_prev"], rows[0]["has_next"]
+
+async def get_pending_queue_page(after_id: int = None, before_id: int = None, limit: int = 10):
+    """Get one keyset page of the moderation queue: 'pending' reviews of all clients, ordered by id.
+
+    Pass after_id to move forward or before_id to move backward. Returns (rows, has_prev, has_next)."""
+    op, order, cursor = (">", "", after_id or 0) if before_id is None else ("<", "DESC", before_id)
+    async with acquire() as conn:
+        rows = await conn.fetch(f"""
+            WITH page AS (
+                SELECT id FROM reviews WHERE status='pending' AND id {op} $1 ORDER BY id {order} LIMIT $2
+            )
+            SELECT r.id, c.number AS client_number, p.number AS platform_number, r.review_text,
+                   r.review_date_raw, r.duplicate_of,
+                EXISTS(SELECT 1 FROM reviews x WHERE x.status='pending' AND x.id < (SELECT MIN(id) FROM page))
+                    AS has_prev,
+                EXISTS(SELECT 1 FROM reviews x WHERE x.status='pending' AND x.id > (SELECT MAX(id) FROM page))
+                    AS has_next
+            FROM page
+            JOIN reviews r ON r.id = page.id
+            JOIN clients c ON c.id = r.client_id
+            JOIN platforms p ON p.id = r.platform_id
+            ORDER BY r.id;
+        """, cursor, limit)
+    if not rows:
+        return [], False, False
+    return rows, rows[0]["has_prev"], rows[0]["has_next"]
+
+async def decide_pending_reviews(review_ids: List[int], status: str) -> List[asyncpg.Record]:
+    """Approve or reject pending reviews in one statement.
+
+    Reviews that are no longer pending are left alone. Returns the decided reviews with their
+    client and platform numbers (for writing the decision to the sheet)."""
+    async with acquire() as conn:
+        return await conn.fetch("""
+            WITH decided AS (
+                UPDATE reviews SET status = $2
+                WHERE id = ANY($1::int[]) AND status = 'pending'
+                RETURNING id, client_id, platform_id, review_text, status
+            )
+            SELECT d.id, c.number AS client_number, c.spreadsheet_id, p.number AS platform_number,
+                   d.review_text, d.status
+            FROM decided d
+            JOIN clients c ON c.id = d.client_id
+            JOIN platforms p ON p.id = d.platform_id
+            ORDER BY d.id;
+        """, review_ids, status)
 
 async def get_platforms_with_new_counts(client_id: int):
-    """Get all platforms for a client along with the count of new reviews on each."""
-    async with pool.acquire() as conn:
-        rows = await conn.fetch("""
-            SELECT p.number, p.url, COALESCE(r.new_count, 0) AS new_count
-            FROM platforms p
-            LEFT JOIN (
-                SELECT platform_id, COUNT(*) AS new_count
-                FROM reviews
-                WHERE client_id=$1 AND status='new'
-                GROUP BY platform_id
-            ) r ON p.id = r.platform_id
-            WHERE p.client_id=$1
-            ORDER BY p.number;
-        """, client_id)
+    """Get all platforms for a client along with the count of new reviews on each (from platform_review_counters)."""
+    async with acquire() as conn:
+        rows = await db_pool.run_statement(conn, "platforms_with_new_counts", "fetch", client_id)
         return rows
 
 async def create_photo_pack(client_id: int, platform_id: int, folder_link: str):
     """Record a photo pack upload (Google Drive folder link) for a platform."""
-    async with pool.acquire() as conn:
+    async with acquire() as conn:
         await conn.execute(
             "INSERT INTO photo_packs(client_id, platform_id, folder_link) VALUES($1, $2, $3);",
             client_id, platform_id, folder_link
@@ -227,16 +741,107 @@ async def create_photo_pack(client_id: int, platform_id: int, folder_link: str):
 
 async def get_unsynced_photo_packs(client_id: int):
     """Get all unsynced photo pack records for a client."""
-    async with pool.acquire() as conn:
+    async with acquire() as conn:
         return await conn.fetch(
-            "SELECT id, platform_id, folder_link FROM photo_packs WHERE client_id=$1 AND synced=False;",
+            "SELECT pp.id, pp.platform_id, p.number AS platform_number, pp.folder_link "
+            "FROM photo_packs pp JOIN platforms p ON p.id = pp.platform_id "
+            "WHERE pp.client_id=$1 AND pp.synced=False;",
             client_id
         )
 
 async def mark_photo_pack_synced(pack_id: int):
     """Mark a photo pack record as synced to Google Sheets."""
-    async with pool.acquire() as conn:
+    async with acquire() as conn:
         await conn.execute(
             "UPDATE photo_packs SET synced=True WHERE id=$1;",
             pack_id
         )
+
+async def enqueue_upload_job(job_key: str, chat_id: int, review_id: int, file_ids: list) -> bool:
+    """Queue a photo upload job for a review. Returns False if a job with this key already exists."""
+    async with acquire() as conn:
+        job_id = await conn.fetchval(
+            "INSERT INTO photo_upload_jobs(job_key, chat_id, review_id, file_ids) VALUES($1, $2, $3, $4) "
+            "ON CONFLICT (job_key) DO NOTHING RETURNING id;",
+            job_key, chat_id, review_id, file_ids
+        )
+        return job_id is not None
+
+async def enqueue_pack_upload_job(job_key: str, chat_id: int, client_id: int, platform_id: int, file_ids: list) -> bool:
+    """Queue the upload of a platform photo pack. Returns False if a job with this key already exists."""
+    async with acquire() as conn:
+        job_id = await conn.fetchval(
+            "INSERT INTO photo_upload_jobs(job_key, chat_id, client_id, platform_id, file_ids) "
+            "VALUES($1, $2, $3, $4, $5) ON CONFLICT (job_key) DO NOTHING RETURNING id;",
+            job_key, chat_id, client_id, platform_id, file_ids
+        )
+        return job_id is not None
+
+async def claim_upload_jobs(limit: int = 5, stale_after: int = 900):
+    """Take up to `limit` due upload jobs (or ones stuck in 'running' for stale_after seconds) and mark them running."""
+    async with acquire() as conn:
+        return await conn.fetch("""
+            UPDATE photo_upload_jobs SET status='running', attempts=attempts+1, locked_at=NOW()
+            WHERE id IN (
+                SELECT id FROM photo_upload_jobs
+                WHERE (status='queued' AND next_run_at <= NOW())
+                   OR (status='running' AND locked_at < NOW() - make_interval(secs => $2))
+                ORDER BY next_run_at
+                FOR UPDATE SKIP LOCKED
+                LIMIT $1
+            )
+            RETURNING id, job_key, chat_id, review_id, client_id, platform_id, file_ids, attempts, folder_id;
+        """, limit, float(stale_after))
+
+async def set_upload_job_folder(job_id: int, folder_id: str, folder_link: str):
+    """Remember the Drive folder of a job so retries upload into the same folder."""
+    async with acquire() as conn:
+        await conn.execute(
+            "UPDATE photo_upload_jobs SET folder_id=$1, folder_link=$2 WHERE id=$3;",
+            folder_id, folder_link, job_id
+        )
+
+async def retry_upload_job(job_id: int, file_ids: list, delay: int, error: str):
+    """Put a job back in the queue with the files that still have to be uploaded."""
+    async with acquire() as conn:
+        await conn.execute(
+            "UPDATE photo_upload_jobs SET status='queued', file_ids=$1, last_error=$2, locked_at=NULL, "
+            "next_run_at=NOW() + make_interval(secs => $3) WHERE id=$4;",
+            file_ids, error, float(delay), job_id
+        )
+
+async def finish_upload_job(job_id: int, status: str, error: str = None):
+    """Mark a job as 'done' or 'failed'. Returns (review_id, client_id, platform_id, folder_link, apply_on_finish)."""
+    async with acquire() as conn:
+        return await conn.fetchrow(
+            "UPDATE photo_upload_jobs SET status=$1, last_error=$2, locked_at=NULL WHERE id=$3 "
+            "RETURNING review_id, client_id, platform_id, folder_link, apply_on_finish;",
+            status, error, job_id
+        )
+
+async def find_uploaded_photo(file_unique_id: str = None, content_hash: str = None):
+    """Find an already uploaded photo by Telegram file_unique_id or by content hash (drive_file_id, folder_id)."""
+    async with acquire() as conn:
+        if file_unique_id is not None:
+            return await conn.fetchrow(
+                "SELECT drive_file_id, folder_id FROM photo_dedup WHERE file_unique_id=$1;",
+                file_unique_id
+            )
+        return await conn.fetchrow(
+            "SELECT drive_file_id, folder_id FROM photo_dedup WHERE content_hash=$1 LIMIT 1;",
+            content_hash
+        )
+
+async def record_uploaded_photo(file_unique_id: str, content_hash: str, drive_file_id: str, folder_id: str):
+    """Remember an uploaded photo for deduplication."""
+    async with acquire() as conn:
+        await conn.execute(
+            "INSERT INTO photo_dedup(file_unique_id, content_hash, drive_file_id, folder_id) "
+            "VALUES($1, $2, $3, $4) ON CONFLICT (file_unique_id) DO NOTHING;",
+            file_unique_id, content_hash, drive_file_id, folder_id
+        )
+
+async def forget_uploaded_photo(drive_file_id: str):
+    """Drop index entries pointing to a Drive file that no longer exists."""
+    async with acquire() as conn:
+        await conn.execute("DELETE FROM photo_dedup WHERE drive_file_id=$1;", drive_file_id)
@@ -0,0 +1,208 @@
+"""PostgreSQL connection pool: sizing and timeouts, prepared hot statements and usage metrics.
+
+Pool settings come from the environment (DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE, DB_COMMAND_TIMEOUT,
+DB_ACQUIRE_TIMEOUT, DB_MAX_INACTIVE_LIFETIME, DB_STATEMENT_CACHE_SIZE). Every new connection
+prepares the statements in HOT_STATEMENTS once; run_statement() executes them by name.
+
+`metrics` records how long callers wait for a connection, how many connections are in use and the
+latency of every statement (hot statements by name, other SQL by its first words), so the pool can
+be sized from data; log_metrics() writes a summary to the log periodically."""
+import os
+import re
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from time import perf_counter
+from typing import Dict
+
+import asyncpg
+
+logger = logging.getLogger(__name__)
+
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+# Seconds a single statement may run
+DB_COMMAND_TIMEOUT = float(os.getenv("DB_COMMAND_TIMEOUT", "30"))
+# Seconds a caller may wait for a free connection
+DB_ACQUIRE_TIMEOUT = float(os.getenv("DB_ACQUIRE_TIMEOUT", "10"))
+# Idle connections are closed after this many seconds (0 = never)
+DB_MAX_INACTIVE_LIFETIME = float(os.getenv("DB_MAX_INACTIVE_LIFETIME", "300"))
+# Ad-hoc statements cached (prepared) per connection by asyncpg
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "200"))
+
+# Statements on the hot path, prepared on every connection when it is opened
+HOT_STATEMENTS: Dict[str, str] = {
+    "client_by_chat": "SELECT id, number FROM clients WHERE telegram_id=$1 AND authorized=True;",
+    "client_by_number": "SELECT id, password, authorized, telegram_id FROM clients WHERE number=$1;",
+    "client_stats": (
+        "SELECT platforms_count, total_reviews, approved_reviews, new_reviews "
+        "FROM client_review_counters WHERE client_id=$1;"
+    ),
+    "platforms_with_new_counts": """
+        SELECT p.number, p.url, COALESCE(pc.new_reviews, 0) AS new_count
+        FROM platforms p
+        LEFT JOIN platform_review_counters pc ON pc.platform_id = p.id
+        WHERE p.client_id=$1
+        ORDER BY p.number;
+    """,
+    "platform_id": "SELECT id FROM platforms WHERE client_id=$1 AND number=$2;",
+    "new_review_ids": "SELECT id FROM reviews WHERE client_id=$1 AND platform_id=$2 AND status='new' ORDER BY id;",
+}
+# Pages of new reviews, moving forward (id > cursor) or backward (id < cursor)
+_NEW_REVIEWS_PAGE = """
+    WITH page AS (
+        SELECT id, review_text FROM reviews
+        WHERE platform_id=$2 AND status='new' AND client_id=$1 AND id {op} $3
+        ORDER BY id {order} LIMIT $4
+    )
+    SELECT p.id, p.review_text,
+        EXISTS(SELECT 1 FROM reviews r WHERE r.platform_id=$2 AND r.status='new' AND r.client_id=$1
+               AND r.id < (SELECT MIN(id) FROM page)) AS has_prev,
+        EXISTS(SELECT 1 FROM reviews r WHERE r.platform_id=$2 AND r.status='new' AND r.client_id=$1
+               AND r.id > (SELECT MAX(id) FROM page)) AS has_next
+    FROM page p
+    ORDER BY p.id;
+"""
+HOT_STATEMENTS["new_reviews_page_next"] = _NEW_REVIEWS_PAGE.format(op=">", order="")
+HOT_STATEMENTS["new_reviews_page_prev"] = _NEW_REVIEWS_PAGE.format(op="<", order="DESC")
+
+_names_by_sql = {sql: name for name, sql in HOT_STATEMENTS.items()}
+
+
+class PoolMetrics:
+    """Counters of pool usage since the process started."""
+
+    def __init__(self):
+        self.acquire_count = 0
+        self.acquire_wait_total = 0.0
+        self.acquire_wait_max = 0.0
+        self.acquire_timeouts = 0
+        self.in_use = 0
+        self.in_use_peak = 0
+        # statement name -> [count, total seconds, max seconds]
+        self.statements: Dict[str, list] = {}
+
+    def observe_acquire(self, wait: float):
+        self.acquire_count += 1
+        self.acquire_wait_total += wait
+        self.acquire_wait_max = max(self.acquire_wait_max, wait)
+        self.in_use += 1
+        self.in_use_peak = max(self.in_use_peak, self.in_use)
+
+    def observe_release(self):
+        self.in_use -= 1
+
+    def observe_statement(self, name: str, elapsed: float):
+        stats = self.statements.setdefault(name, [0, 0.0, 0.0])
+        stats[0] += 1
+        stats[1] += elapsed
+        stats[2] = max(stats[2], elapsed)
+
+    def snapshot(self, pool: asyncpg.Pool = None) -> dict:
+        """Current values; with the pool, also its size and idle connections."""
+        result = {
+            "acquire_count": self.acquire_count,
+            "acquire_wait_avg_ms": round(1000 * self.acquire_wait_total / self.acquire_count, 2)
+            if self.acquire_count else 0.0,
+            "acquire_wait_max_ms": round(1000 * self.acquire_wait_max, 2),
+            "acquire_timeouts": self.acquire_timeouts,
+            "in_use": self.in_use,
+            "in_use_peak": self.in_use_peak,
+            "statements": {
+                name: {"count": count, "avg_ms": round(1000 * total / count, 2), "max_ms": round(1000 * peak, 2)}
+                for name, (count, total, peak) in self.statements.items()
+            },
+        }
+        if pool is not None:
+            result["pool_size"] = pool.get_size()
+            result["pool_idle"] = pool.get_idle_size()
+        return result
+
+
+metrics = PoolMetrics()
+
+
+def _statement_name(sql: str) -> str:
+    """Name of a hot statement, or the first words of any other SQL."""
+    name = _names_by_sql.get(sql)
+    if name:
+        return name
+    return re.sub(r"\s+", " ", sql).strip()[:60]
+
+
+def _log_query(record):
+    metrics.observe_statement(_statement_name(record.query), record.elapsed)
+
+
+class ReviewsConnection(asyncpg.Connection):
+    """Pool connection that keeps the hot statements prepared."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared: Dict[str, asyncpg.prepared_stmt.PreparedStatement] = {}
+
+
+async def _init_connection(conn: ReviewsConnection):
+    """Prepare the hot statements and start timing ad-hoc queries on a new connection."""
+    conn.add_query_logger(_log_query)
+    for name, sql in HOT_STATEMENTS.items():
+        try:
+            conn.prepared[name] = await conn.prepare(sql)
+        except asyncpg.UndefinedTableError:
+            # Schema not migrated yet: the statement is prepared on first use instead
+            pass
+
+
+async def create_pool(**params) -> asyncpg.Pool:
+    """Create the connection pool with the configured size, timeouts and connection setup."""
+    return await asyncpg.create_pool(
+        **params,
+        min_size=DB_POOL_MIN_SIZE,
+        max_size=DB_POOL_MAX_SIZE,
+        command_timeout=DB_COMMAND_TIMEOUT,
+        max_inactive_connection_lifetime=DB_MAX_INACTIVE_LIFETIME,
+        statement_cache_size=DB_STATEMENT_CACHE_SIZE,
+        connection_class=ReviewsConnection,
+        init=_init_connection,
+    )
+
+
+@asynccontextmanager
+async def acquire(pool: asyncpg.Pool, timeout: float = DB_ACQUIRE_TIMEOUT):
+    """Acquire a connection from the pool, recording the wait and the number of connections in use."""
+    start = perf_counter()
+    try:
+        conn = await pool.acquire(timeout=timeout)
+    except asyncio.TimeoutError:
+        metrics.acquire_timeouts += 1
+        raise
+    metrics.observe_acquire(perf_counter() - start)
+    try:
+        yield conn
+    finally:
+        metrics.observe_release()
+        await pool.release(conn)
+
+
+async def run_statement(conn, name: str, method: str, *args):
+    """Run a hot statement by name with the given fetch method ("fetch", "fetchrow", "fetchval")."""
+    statement = conn.prepared.get(name)
+    if statement is None:
+        statement = conn.prepared[name] = await conn.prepare(HOT_STATEMENTS[name])
+    start = perf_counter()
+    try:
+        try:
+            return await getattr(statement, method)(*args)
+        except asyncpg.InvalidCachedStatementError:
+            # The schema changed under the prepared statement (e.g. a migration): prepare it again
+            statement = conn.prepared[name] = await conn.prepare(HOT_STATEMENTS[name])
+            return await getattr(statement, method)(*args)
+    finally:
+        metrics.observe_statement(name, perf_counter() - start)
+
+
+async def log_metrics(pool_getter, interval: float = 300):
+    """Log pool metrics every `interval` seconds. pool_getter returns the current pool."""
+    while True:
+        await asyncio.sleep(interval)
+        logger.info("DB pool metrics: %s", metrics.snapshot(pool_getter()))
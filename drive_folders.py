@@ -0,0 +1,192 @@
+"""Google Drive folder management for review photos.
+
+Folders form a tree under DRIVE_FOLDER_ID: "Клиент N" / "Платформа M" / "review_<id>" (or
+"Пак фото <time>" for an uploaded photo pack). Review, client and platform folder IDs are kept in
+the drive_folders table, so client and platform folders are created once and reused, and a review
+folder is never looked up by parsing reviews.photo_link. Link sharing ("anyone with the link can
+view") is granted once on the client folder and inherited by everything inside it, so a photo flow
+costs one folder creation (if the review has no folder yet) plus the uploads. Several folders are
+created with a single Drive HTTP batch request."""
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import google_sheets
+import database
+from drive_uploads import execute_drive_request
+
+logger = logging.getLogger(__name__)
+
+FOLDER_MIME_TYPE = "application/vnd.google-apps.folder"
+# Drive accepts at most 100 calls in one batch request
+BATCH_LIMIT = 100
+
+
+def folder_link(folder_id: str) -> str:
+    """Public link of a Drive folder."""
+    return f"https://drive.google.com/drive/folders/{folder_id}"
+
+
+def _batch_execute_sync(requests: list) -> list:
+    """Run Drive API requests as HTTP batches. Returns responses (or exceptions) in request order."""
+    responses = [None] * len(requests)
+    for start in range(0, len(requests), BATCH_LIMIT):
+        def callback(request_id, response, exception):
+            responses[int(request_id)] = exception if exception is not None else response
+        batch = google_sheets.drive_service.new_batch_http_request(callback=callback)
+        for i in range(start, min(start + BATCH_LIMIT, len(requests))):
+            batch.add(requests[i], request_id=str(i))
+        execute_drive_request(batch)
+    return responses
+
+
+async def batch_execute(requests: list) -> list:
+    """Run Drive API requests as HTTP batches off the event loop."""
+    if not requests:
+        return []
+    return await asyncio.to_thread(_batch_execute_sync, requests)
+
+
+class DriveFolderManager:
+    """Creates and caches the client / platform / review folder tree."""
+
+    def __init__(self, root_folder_id: str, repo: database.Repository):
+        self.root_folder_id = root_folder_id
+        self.repo = repo
+        # (scope, owner_id) -> folder_id, mirrors the drive_folders table
+        self._cache: Dict[Tuple[str, int], str] = {}
+        # Locks of folders being created; dropped once the folder is cached
+        self._locks: Dict[Tuple[str, int], asyncio.Lock] = {}
+
+    async def _lookup(self, keys: List[Tuple[str, int]]) -> Dict[Tuple[str, int], str]:
+        """Get known folder IDs for (scope, owner_id) keys from the cache and the DB."""
+        found = {k: self._cache[k] for k in keys if k in self._cache}
+        missing = [k for k in keys if k not in found]
+        if missing:
+            async with self.repo.acquire() as conn:
+                rows = await conn.fetch(
+                    "SELECT scope, owner_id, folder_id FROM drive_folders "
+                    "WHERE (scope, owner_id) IN (SELECT * FROM unnest($1::text[], $2::int[]));",
+                    [k[0] for k in missing], [k[1] for k in missing]
+                )
+            for r in rows:
+                key = (r["scope"], r["owner_id"])
+                self._cache[key] = found[key] = r["folder_id"]
+        return found
+
+    async def _remember(self, key: Tuple[str, int], folder_id: str) -> str:
+        """Store a created folder; if another process stored one first, return that one instead."""
+        async with self.repo.acquire() as conn:
+            stored = await conn.fetchval("""
+                INSERT INTO drive_folders(scope, owner_id, folder_id) VALUES($1, $2, $3)
+                ON CONFLICT (scope, owner_id) DO UPDATE SET scope=EXCLUDED.scope
+                RETURNING folder_id;
+            """, key[0], key[1], folder_id)
+        self._cache[key] = stored
+        return stored
+
+    async def _create_folders(self, specs: List[Tuple[str, str]]) -> List[str]:
+        """Create folders given as (name, parent_id) in one batch. Returns their IDs in order."""
+        service = google_sheets.drive_service
+        requests = [
+            service.files().create(body={"name": name, "mimeType": FOLDER_MIME_TYPE, "parents": [parent]},
+                                   fields="id")
+            for name, parent in specs
+        ]
+        responses = await batch_execute(requests)
+        for response in responses:
+            if isinstance(response, Exception):
+                raise response
+        return [response["id"] for response in responses]
+
+    async def _ensure(self, key: Tuple[str, int], name: str, parent_id: str, public: bool = False) -> str:
+        """Return the folder for a key, creating it under parent_id if it does not exist yet."""
+        known = await self._lookup([key])
+        if key in known:
+            return known[key]
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            folder_id = (await self._lookup([key])).get(key)
+            if folder_id is None:
+                (folder_id,) = await self._create_folders([(name, parent_id)])
+                if public:
+                    await asyncio.to_thread(execute_drive_request, google_sheets.drive_service.permissions().create(
+                        fileId=folder_id, body={"role": "reader", "type": "anyone"}
+                    ))
+                folder_id = await self._remember(key, folder_id)
+        # The folder is cached now, so later callers return before taking the lock
+        if self._locks.get(key) is lock:
+            del self._locks[key]
+        return folder_id
+
+    async def get_platform_folder(self, client_id: int, client_number: int,
+                                  platform_id: int, platform_number: int) -> str:
+        """Folder of a platform inside its (shared) client folder."""
+        client_folder = await self._ensure(("client", client_id), f"Клиент {client_number}",
+                                           self.root_folder_id, public=True)
+        return await self._ensure(("platform", platform_id), f"Платформа {platform_number}", client_folder)
+
+    async def create_pack_folders(self, platform_ids: List[int]) -> List[str]:
+        """Create one new photo pack folder per entry (inside the platform folder) with a single batch request."""
+        if not platform_ids:
+            return []
+        async with self.repo.acquire() as conn:
+            rows = await conn.fetch("""
+                SELECT p.id AS platform_id, p.number AS platform_number, c.id AS client_id, c.number AS client_number
+                FROM platforms p JOIN clients c ON p.client_id = c.id
+                WHERE p.id = ANY($1::int[]);
+            """, list(set(platform_ids)))
+        parents = {}
+        for r in rows:
+            parents[r["platform_id"]] = await self.get_platform_folder(r["client_id"], r["client_number"],
+                                                                       r["platform_id"], r["platform_number"])
+        stamp = datetime.now().strftime("%Y-%m-%d %H-%M-%S")
+        return await self._create_folders([(f"Пак фото {stamp}", parents[pid]) for pid in platform_ids])
+
+    async def get_review_folders(self, review_ids: List[int]) -> Dict[int, str]:
+        """Folder IDs of the given reviews, creating all missing ones with a single batch request."""
+        keys = [("review", rid) for rid in review_ids]
+        known = await self._lookup(keys)
+        result = {key[1]: folder_id for key, folder_id in known.items()}
+        missing = [rid for rid in review_ids if rid not in result]
+        if not missing:
+            return result
+        async with self.repo.acquire() as conn:
+            rows = await conn.fetch("""
+                SELECT r.id, r.photo_link, c.id AS client_id, c.number AS client_number,
+                       p.id AS platform_id, p.number AS platform_number
+                FROM reviews r
+                JOIN clients c ON r.client_id = c.id
+                JOIN platforms p ON r.platform_id = p.id
+                WHERE r.id = ANY($1::int[]);
+            """, missing)
+        specs = []
+        spec_reviews = []
+        for r in rows:
+            # Reviews linked to a folder before this table existed keep using it
+            legacy_id = _folder_id_from_link(r["photo_link"])
+            if legacy_id:
+                result[r["id"]] = await self._remember(("review", r["id"]), legacy_id)
+                continue
+            parent = await self.get_platform_folder(r["client_id"], r["client_number"],
+                                                    r["platform_id"], r["platform_number"])
+            specs.append((f"review_{r['id']}", parent))
+            spec_reviews.append(r["id"])
+        if specs:
+            created = await self._create_folders(specs)
+            for review_id, folder_id in zip(spec_reviews, created):
+                result[review_id] = await self._remember(("review", review_id), folder_id)
+        return result
+
+    async def get_review_folder(self, review_id: int) -> Optional[str]:
+        """Folder ID of one review (created if needed)."""
+        return (await self.get_review_folders([review_id])).get(review_id)
+
+
+def _folder_id_from_link(link: Optional[str]) -> Optional[str]:
+    """Extract the folder ID from a Drive folder link stored in reviews.photo_link."""
+    if link and "drive.google.com/drive/folders/" in link:
+        folder_id = link.rstrip("/").split("/")[-1].split("?")[0]
+        return folder_id or None
+    return None
@@ -0,0 +1,165 @@
+"""Concurrent upload of Telegram photos to Google Drive.
+
+Photos are downloaded from Telegram into memory and uploaded with MediaIoBaseUpload, so nothing
+touches the disk. Blocking Google API calls run in worker threads (each with its own HTTP
+connection, since httplib2 is not thread-safe) and at most `concurrency` photos are processed at
+once, so an album takes roughly as long as its slowest photo.
+
+Photos that were uploaded before (same Telegram file_unique_id, or same SHA-256 of the content,
+computed while downloading) are not uploaded again: they are copied on the Drive side, or skipped
+if the copy already sits in the target folder. get_dedup_stats() reports hits and misses."""
+import os
+import io
+import hashlib
+import asyncio
+import logging
+import mimetypes
+import threading
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+import httplib2
+from google_auth_httplib2 import AuthorizedHttp
+from googleapiclient.errors import HttpError
+from googleapiclient.http import MediaIoBaseUpload
+
+import google_sheets
+from database import find_uploaded_photo, record_uploaded_photo, forget_uploaded_photo
+
+logger = logging.getLogger(__name__)
+
+# Number of photos downloaded/uploaded at the same time
+DRIVE_UPLOAD_CONCURRENCY = int(os.getenv("DRIVE_UPLOAD_CONCURRENCY", "5"))
+# Resumable upload chunk size (must be a multiple of 256 KB)
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+_thread_local = threading.local()
+
+# Deduplication counters since start: hits by file_unique_id, hits by content hash, real uploads
+_dedup_stats = {"unique_id_hits": 0, "hash_hits": 0, "misses": 0}
+
+
+def get_dedup_stats() -> dict:
+    """Photo deduplication counters since the process started."""
+    return dict(_dedup_stats)
+
+
+class _HashingBuffer(io.BytesIO):
+    """In-memory download target that hashes the content as it is written."""
+
+    def __init__(self):
+        super().__init__()
+        self.sha256 = hashlib.sha256()
+
+    def write(self, data) -> int:
+        self.sha256.update(data)
+        return super().write(data)
+
+
+@dataclass
+class PhotoUploadResult:
+    """Outcome of uploading one photo."""
+    index: int
+    file_id: str
+    drive_file_id: Optional[str] = None
+    error: Optional[str] = None
+    # True if the photo was copied or skipped instead of uploaded
+    deduplicated: bool = False
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def _thread_http():
+    """Authorized HTTP client of the current worker thread."""
+    http = getattr(_thread_local, "http", None)
+    if http is None:
+        http = AuthorizedHttp(google_sheets.credentials, http=httplib2.Http())
+        _thread_local.http = http
+    return http
+
+
+def execute_drive_request(request):
+    """Execute a Drive API request (or batch) on the current thread's own connection. Blocking."""
+    return request.execute(http=_thread_http())
+
+
+def _upload_buffer_sync(buffer: io.BytesIO, name: str, mimetype: str, folder_id: str) -> str:
+    media = MediaIoBaseUpload(buffer, mimetype=mimetype, chunksize=UPLOAD_CHUNK_SIZE, resumable=True)
+    created = execute_drive_request(google_sheets.drive_service.files().create(
+        body={"name": name, "mimeType": mimetype, "parents": [folder_id]},
+        media_body=media,
+        fields="id"
+    ))
+    return created.get("id")
+
+
+def _copy_file_sync(drive_file_id: str, name: str, folder_id: str) -> str:
+    copied = execute_drive_request(google_sheets.drive_service.files().copy(
+        fileId=drive_file_id, body={"name": name, "parents": [folder_id]}, fields="id"
+    ))
+    return copied.get("id")
+
+
+async def _reuse_uploaded(found, name: str, folder_id: str) -> Optional[str]:
+    """Place an already uploaded photo into the folder. Returns None if the Drive file is gone."""
+    if found["folder_id"] == folder_id:
+        return found["drive_file_id"]
+    try:
+        return await asyncio.to_thread(_copy_file_sync, found["drive_file_id"], name, folder_id)
+    except HttpError as e:
+        if e.resp.status == 404:
+            await forget_uploaded_photo(found["drive_file_id"])
+            return None
+        raise
+
+
+async def upload_photo(bot, file_id: str, folder_id: str, name_prefix: str = "photo") -> Tuple[str, bool]:
+    """Stream one Telegram file into a Drive folder, reusing earlier uploads of the same photo.
+
+    Returns (drive_file_id, deduplicated)."""
+    file_info = await bot.get_file(file_id)
+    mimetype = mimetypes.guess_type(file_info.file_path)[0] or "image/jpeg"
+    extension = mimetypes.guess_extension(mimetype) or ".jpg"
+    name = f"{name_prefix}{extension}"
+    # Same Telegram file: no download needed
+    found = await find_uploaded_photo(file_unique_id=file_info.file_unique_id)
+    if found:
+        reused = await _reuse_uploaded(found, name, folder_id)
+        if reused:
+            _dedup_stats["unique_id_hits"] += 1
+            return reused, True
+    buffer = _HashingBuffer()
+    await bot.download_file(file_info.file_path, destination=buffer)
+    content_hash = buffer.sha256.hexdigest()
+    # Same content sent as a different Telegram file (e.g. re-sent or forwarded)
+    found = await find_uploaded_photo(content_hash=content_hash)
+    if found:
+        reused = await _reuse_uploaded(found, name, folder_id)
+        if reused:
+            _dedup_stats["hash_hits"] += 1
+            await record_uploaded_photo(file_info.file_unique_id, content_hash, reused, folder_id)
+            return reused, True
+    _dedup_stats["misses"] += 1
+    drive_file_id = await asyncio.to_thread(_upload_buffer_sync, buffer, name, mimetype, folder_id)
+    await record_uploaded_photo(file_info.file_unique_id, content_hash, drive_file_id, folder_id)
+    return drive_file_id, False
+
+
+async def upload_photos(bot, file_ids: List[str], folder_id: str,
+                        concurrency: int = DRIVE_UPLOAD_CONCURRENCY) -> List[PhotoUploadResult]:
+    """Upload photos into a Drive folder with bounded concurrency. Returns one result per photo, in order."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def upload_one(index: int, file_id: str) -> PhotoUploadResult:
+        async with semaphore:
+            try:
+                drive_file_id, deduplicated = await upload_photo(bot, file_id, folder_id,
+                                                                 name_prefix=f"photo_{index:03d}")
+                return PhotoUploadResult(index, file_id, drive_file_id=drive_file_id, deduplicated=deduplicated)
+            except Exception as e:
+                logger.error(f"Failed to upload photo {file_id}: {e}")
+                return PhotoUploadResult(index, file_id, error=str(e))
+
+    return list(await asyncio.gather(*(upload_one(i, fid) for i, fid in enumerate(file_ids, start=1))))
@@ -0,0 +1,139 @@
+"""CSV/XLSX export of reviews and review counts for admins.
+
+Rows come from a server-side cursor (database.iter_export_reviews / iter_export_stats) and are
+written to a temporary file chunk by chunk in a worker thread, so memory use stays bounded however
+many reviews are exported. CSV files use ';' and a UTF-8 BOM so Excel opens them as is; XLSX files
+are written with openpyxl in write-only mode. Files larger than Telegram accepts are zipped."""
+import os
+import csv
+import asyncio
+import tempfile
+import zipfile
+from contextlib import aclosing
+from datetime import datetime
+
+from database import iter_export_reviews, iter_export_stats
+
+# Rows fetched from the cursor and written to the file at a time
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "2000"))
+# Files above this size are zipped before sending (bots may send documents up to 50 MB)
+MAX_DOCUMENT_SIZE = 45 * 1024 * 1024
+
+REVIEW_COLUMNS = [
+    ("id", "ID"),
+    ("client_number", "Клиент"),
+    ("platform_number", "Платформа"),
+    ("status", "Статус"),
+    ("review_date", "Дата"),
+    ("review_date_raw", "Дата (как в таблице)"),
+    ("review_text", "Текст отзыва"),
+    ("manager_comment", "Комментарий менеджера"),
+    ("photo_link", "Фото"),
+    ("decided_at", "Дата решения"),
+    ("archived", "В архиве"),
+]
+STATS_COLUMNS = [
+    ("client_number", "Клиент"),
+    ("authorized", "Авторизован"),
+    ("platforms_count", "Платформ"),
+    ("total_reviews", "Всего отзывов"),
+    ("approved_reviews", "Согласовано"),
+    ("new_reviews", "Новых"),
+]
+
+
+def _cell(value):
+    """Value as written to the file: dates in ISO format, booleans as да/нет, None as empty."""
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "да" if value else "нет"
+    if isinstance(value, datetime):
+        return value.isoformat(sep=" ", timespec="seconds")
+    return value
+
+
+class _CsvWriter:
+    def __init__(self, path: str, header: list):
+        self.file = open(path, "w", encoding="utf-8-sig", newline="")
+        self.writer = csv.writer(self.file, delimiter=";")
+        self.writer.writerow(header)
+
+    def write(self, rows: list):
+        self.writer.writerows(rows)
+
+    def close(self):
+        self.file.close()
+
+
+class _XlsxWriter:
+    def __init__(self, path: str, header: list):
+        from openpyxl import Workbook  # only needed for XLSX exports
+        self.path = path
+        self.workbook = Workbook(write_only=True)
+        self.sheet = self.workbook.create_sheet("Export")
+        self.sheet.append(header)
+
+    def write(self, rows: list):
+        for row in rows:
+            self.sheet.append(row)
+
+    def close(self):
+        self.workbook.save(self.path)
+
+
+async def _write_export(rows, columns: list, path: str, fmt: str) -> int:
+    """Write rows from an async iterator to `path` in chunks. Returns the number of rows written.
+
+    The iterator is closed on the way out, so a failing writer releases the cursor's connection at once."""
+    header = [title for _, title in columns]
+    writer_class = _XlsxWriter if fmt == "xlsx" else _CsvWriter
+    async with aclosing(rows):
+        writer = await asyncio.to_thread(writer_class, path, header)
+        count = 0
+        chunk = []
+        try:
+            async for row in rows:
+                chunk.append([_cell(row[name]) for name, _ in columns])
+                if len(chunk) >= EXPORT_CHUNK_SIZE:
+                    await asyncio.to_thread(writer.write, chunk)
+                    count += len(chunk)
+                    chunk = []
+            if chunk:
+                await asyncio.to_thread(writer.write, chunk)
+                count += len(chunk)
+        finally:
+            await asyncio.to_thread(writer.close)
+    return count
+
+
+def _zip_file(path: str, name: str) -> str:
+    zip_path = path + ".zip"
+    with zipfile.ZipFile(zip_path, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.write(path, arcname=name)
+    os.remove(path)
+    return zip_path
+
+
+async def export_to_file(kind: str, fmt: str = "csv", client_id: int = None, client_number: int = None):
+    """Export reviews (kind="reviews", of one client or all) or counts (kind="stats") to a temporary file.
+
+    Returns (path, file name, row count); the caller removes the file when it has been sent."""
+    if kind == "stats":
+        rows, columns, base = iter_export_stats(EXPORT_CHUNK_SIZE), STATS_COLUMNS, "stats"
+    else:
+        rows, columns = iter_export_reviews(client_id, EXPORT_CHUNK_SIZE), REVIEW_COLUMNS
+        base = f"reviews_client_{client_number}" if client_number is not None else "reviews_all"
+    name = f"{base}_{datetime.now().strftime('%Y-%m-%d_%H-%M')}.{fmt}"
+    fd, path = tempfile.mkstemp(suffix=f".{fmt}")
+    os.close(fd)
+    try:
+        count = await _write_export(rows, columns, path, fmt)
+        if os.path.getsize(path) > MAX_DOCUMENT_SIZE:
+            path = await asyncio.to_thread(_zip_file, path, name)
+            name += ".zip"
+    except Exception:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+    return path, name, count
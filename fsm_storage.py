@@ -0,0 +1,177 @@
+"""PostgreSQL-backed FSM storage for aiogram.
+
+States and data live in the fsm_storage table (JSONB) on the shared asyncpg pool, so sessions survive
+restarts and can be shared by several bot processes. Within one update all reads and writes of a key are
+served from an in-process unit of work and written back with a single upsert when the update is done
+(see StorageFlushMiddleware). Sessions that were not touched for `ttl` seconds are treated as empty and
+removed by run_expiry()."""
+import json
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Mapping, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StorageKey, StateType, DefaultKeyBuilder, KeyBuilder
+
+import database
+
+logger = logging.getLogger(__name__)
+
+
+class _UnitOfWork:
+    """Entries loaded or written while processing one update."""
+
+    def __init__(self):
+        self.entries: Dict[str, dict] = {}
+        self.closed = False
+
+
+_current_unit: ContextVar[Optional[_UnitOfWork]] = ContextVar("fsm_storage_unit", default=None)
+
+
+class PostgresStorage(BaseStorage):
+    """FSM storage on the asyncpg pool from database.py with per-update write coalescing."""
+
+    def __init__(self, ttl: int = 7 * 24 * 3600, key_builder: Optional[KeyBuilder] = None):
+        self.ttl = ttl
+        self.key_builder = key_builder or DefaultKeyBuilder()
+
+    def _active_unit(self) -> Optional[_UnitOfWork]:
+        unit = _current_unit.get()
+        if unit is None or unit.closed:
+            return None
+        return unit
+
+    async def _load(self, key: StorageKey) -> dict:
+        """Return the cached entry for a key, reading it from the DB on first access."""
+        str_key = self.key_builder.build(key)
+        unit = self._active_unit()
+        if unit is not None and str_key in unit.entries:
+            return unit.entries[str_key]
+        async with database.acquire() as conn:
+            row = await conn.fetchrow(
+                "SELECT state, data, updated_at < NOW() - make_interval(secs => $2) AS stale "
+                "FROM fsm_storage WHERE key=$1 AND updated_at > NOW() - make_interval(secs => $3);",
+                str_key, self.ttl / 2, float(self.ttl)
+            )
+        entry = {
+            "key": str_key,
+            "state": row["state"] if row else None,
+            "data": json.loads(row["data"]) if row else {},
+            # Sessions past half of their TTL are rewritten at the end of the update to refresh updated_at
+            "dirty": bool(row and row["stale"]),
+        }
+        if unit is not None:
+            unit.entries[str_key] = entry
+        return entry
+
+    async def _store(self, entry: dict):
+        """Mark an entry as changed; outside of an update it is written immediately."""
+        entry["dirty"] = True
+        if self._active_unit() is None:
+            await self._write([entry])
+
+    async def _write(self, entries: list):
+        """Upsert changed entries and delete emptied ones using one statement each."""
+        upserts = [e for e in entries if e["dirty"] and (e["state"] is not None or e["data"])]
+        deletes = [e["key"] for e in entries if e["dirty"] and e["state"] is None and not e["data"]]
+        if not upserts and not deletes:
+            return
+        async with database.acquire() as conn:
+            if upserts:
+                await conn.execute("""
+                    INSERT INTO fsm_storage(key, state, data, updated_at)
+                    SELECT k, s, d::jsonb, NOW() FROM unnest($1::text[], $2::text[], $3::text[]) AS t(k, s, d)
+                    ON CONFLICT (key) DO UPDATE SET state=EXCLUDED.state, data=EXCLUDED.data, updated_at=NOW();
+                """, [e["key"] for e in upserts], [e["state"] for e in upserts],
+                    [json.dumps(e["data"], ensure_ascii=False) for e in upserts])
+            if deletes:
+                await conn.execute("DELETE FROM fsm_storage WHERE key = ANY($1::text[]);", deletes)
+        for e in entries:
+            e["dirty"] = False
+
+    async def flush(self, unit: _UnitOfWork):
+        """Write back everything changed during an update."""
+        unit.closed = True
+        await self._write(list(unit.entries.values()))
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        entry = await self._load(key)
+        entry["state"] = state.state if isinstance(state, State) else state
+        await self._store(entry)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        entry = await self._load(key)
+        return entry["state"]
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        entry = await self._load(key)
+        entry["data"] = dict(data)
+        await self._store(entry)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        entry = await self._load(key)
+        return dict(entry["data"])
+
+    async def update_data(self, key: StorageKey, data: Mapping[str, Any]) -> Dict[str, Any]:
+        entry = await self._load(key)
+        entry["data"].update(data)
+        await self._store(entry)
+        return dict(entry["data"])
+
+    async def expire_idle(self) -> int:
+        """Delete sessions that were not updated within the TTL. Returns the number of removed rows."""
+        async with database.acquire() as conn:
+            result = await conn.execute(
+                "DELETE FROM fsm_storage WHERE updated_at < NOW() - make_interval(secs => $1);",
+                float(self.ttl)
+            )
+        return int(result.split()[-1])
+
+    async def run_expiry(self, interval: int = 3600):
+        """Periodically remove idle sessions (run as a background task)."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                removed = await self.expire_idle()
+                if removed:
+                    logger.info("Expired %s idle FSM sessions", removed)
+            except Exception as e:
+                logger.error(f"FSM session expiry failed: {e}")
+
+    async def close(self) -> None:
+        # The pool is owned by database.py
+        pass
+
+
+@asynccontextmanager
+async def batched_writes(storage: BaseStorage):
+    """Coalesce storage access of a block into one write-back, as is done for every update.
+
+    Meant for background tasks that touch FSM state outside of update handling; a no-op for other storages."""
+    if not isinstance(storage, PostgresStorage):
+        yield
+        return
+    unit = _UnitOfWork()
+    token = _current_unit.set(unit)
+    try:
+        yield
+    finally:
+        _current_unit.reset(token)
+        await storage.flush(unit)
+
+
+class StorageFlushMiddleware(BaseMiddleware):
+    """Outer update middleware that opens a unit of work and writes it back once the update is handled.
+
+    Must run before aiogram's FSMContextMiddleware so the initial state read is part of the unit."""
+
+    def __init__(self, storage: PostgresStorage):
+        self.storage = storage
+
+    async def __call__(self, handler, event, data):
+        async with batched_writes(self.storage):
+            return await handler(event, data)
@@ -9,8 +9,8 @@ from googleapiclient.discovery import build
 from googleapiclient.http import MediaFileUpload
 from tenacity import retry, stop_after_attempt, wait_exponential
 
-# Импортируем необходимые функции и переменную pool из database.py
-from database import pool, create_platform, update_review_status, update_review_text
+# Доступ к базе данных — через репозиторий, который создаёт init_db() и передаёт main.py
+from database import NewReview, get_review_texts
 
 # Globals for Google API clients
 credentials = None
@@ -56,8 +56,12 @@ def connect_to_sheet(sheet_id: str):
     sheets_cache[sheet_id] = sheet_obj
     return sheet_obj
 
-def get_client_spreadsheet(client_number: int):
-    """Determine which Google Spreadsheet file contains the given client number."""
+def get_client_spreadsheet(client_number: int, spreadsheet_id: str = None):
+    """Determine which Google Spreadsheet file contains the given client number.
+
+    An explicit spreadsheet_id (clients.spreadsheet_id, set by the bulk import) wins over the number ranges."""
+    if spreadsheet_id:
+        return connect_to_sheet(spreadsheet_id)
     # Map ranges: 1-99 -> first spreadsheet, 100-199 -> second, 200-299 -> third
     if 1 <= client_number <= 99:
         idx = 0
@@ -71,9 +75,9 @@ def get_client_spreadsheet(client_number: int):
         return connect_to_sheet(spreadsheet_ids[idx])
     return None
 
-def find_client_sheet(client_number: int):
-    """Find the worksheet for a specific client by their number."""
-    ss = get_client_spreadsheet(client_number)
+def find_client_sheet(client_number: int, spreadsheet_id: str = None):
+    """Find the worksheet for a specific client by their number (and clients.spreadsheet_id, if set)."""
+    ss = get_client_spreadsheet(client_number, spreadsheet_id)
     if not ss:
         return None
     title_str = f"Клиент {client_number}"
@@ -143,9 +147,94 @@ def get_platform_insertion_index(worksheet, platform_key: str):
             insert_index = j + 1
     return insert_index
 
-async def import_initial_data():
+def parse_review_row(row) -> tuple:
+    """Split a review row of a client sheet into (date, manager_comment, status, text, photo_link)."""
+    # row format: [ (maybe empty colA), date, manager_comment, status, review_text, photo_link, ... ]
+    date_str = row[1].strip() if len(row) > 1 else ""
+    manager_comment = row[2].strip() if len(row) > 2 else ""
+    status_cell = row[3].strip() if len(row) > 3 else ""
+    review_text = row[4].strip() if len(row) > 4 else ""
+    photo_link = row[5].strip() if len(row) > 5 else ""
+    # Determine status value
+    if manager_comment != "" and status_cell == "":
+        # Manager responded but status not set, treat as approved
+        status = "approved"
+    elif status_cell in ("🟢", "Согласован"):
+        status = "approved"
+    elif status_cell in ("🚫", "Отклонен"):
+        status = "rejected"
+    elif status_cell == "⚠️":
+        status = "pending"
+    else:
+        status = "new"
+    return date_str, manager_comment, status, review_text, photo_link
+
+def get_sheet_platform_urls(sheet_platforms: dict, reviews_by_platform: dict) -> dict:
+    """Platform numbers of a client sheet with their URLs ({number: url or None})."""
+    platforms = {}
+    for plat_key, url in sheet_platforms.items():
+        m = re.search(r"(\d+)", plat_key)
+        if m:
+            platforms[int(m.group(1))] = url
+    # Platforms that only have a reviews section are created without URL
+    for plat_key in reviews_by_platform:
+        m = re.search(r"ПЛАТФОРМА\s+(\d+)", plat_key, re.IGNORECASE)
+        if m:
+            platforms.setdefault(int(m.group(1)), None)
+    return platforms
+
+# Status cells written for decisions made in the bot (read back by parse_review_row)
+STATUS_MARKS = {"approved": "🟢", "rejected": "🚫"}
+
+def write_review_decisions(decisions) -> int:
+    """Set the status cells of decided reviews (client_number, platform_number, review_text, status).
+
+    Rows are matched by platform section and text among the rows still marked ⚠️. All tabs of a
+    spreadsheet are read with one batch request and written with another. Blocking; returns the
+    number of cells updated."""
+    by_spreadsheet = {}
+    for d in decisions:
+        ss = get_client_spreadsheet(d["client_number"], d.get("spreadsheet_id"))
+        if ss:
+            by_spreadsheet.setdefault(ss.id, (ss, []))[1].append(d)
+    updated = 0
+    for ss, items in by_spreadsheet.values():
+        titles = {}
+        for ws in ss.worksheets():
+            match = re.match(r"Клиент\s+(\d+)", ws.title.strip(), re.IGNORECASE)
+            if match:
+                titles[int(match.group(1))] = ws.title
+        numbers = sorted({d["client_number"] for d in items if d["client_number"] in titles})
+        if not numbers:
+            continue
+        ranges = [f"'{titles[n]}'!A:F" for n in numbers]
+        value_ranges = ss.values_batch_get(ranges).get("valueRanges", [])
+        data = []
+        for number, value_range in zip(numbers, value_ranges):
+            rows = value_range.get("values", [])
+            used = set()
+            for d in items:
+                if d["client_number"] != number:
+                    continue
+                platform_key = f"ПЛАТФОРМА {d['platform_number']}"
+                current_platform = None
+                for i, row in enumerate(rows, start=1):
+                    if row and row[0].strip().upper().startswith("ПЛАТФОРМА"):
+                        current_platform = row[0].strip().upper()
+                        continue
+                    if (current_platform == platform_key and i not in used and len(row) > 4
+                            and row[4].strip() == d["review_text"] and parse_review_row(row)[2] == "pending"):
+                        used.add(i)
+                        data.append({"range": f"'{titles[number]}'!D{i}", "values": [[STATUS_MARKS[d["status"]]]]})
+                        break
+        if data:
+            ss.values_batch_update({"valueInputOption": "USER_ENTERED", "data": data})
+            updated += len(data)
+    return updated
+
+async def import_initial_data(repo):
     """Import clients, platforms, and reviews from Google Sheets into the database on first run."""
-    from database import create_client, create_platform, create_review  # import here to avoid circular dependency
+    from database import create_client  # import here to avoid circular dependency
     for sheet_id in spreadsheet_ids:
         sheet_obj = connect_to_sheet(sheet_id)
         for worksheet in sheet_obj.worksheets():
@@ -156,105 +245,74 @@ async def import_initial_data():
                 continue
             client_number = int(match.group(1))
             # Create client with a placeholder password if not exists in DB
-            client_record = await create_client(client_number, "")  # password set empty (to be updated by admin)
-            client_id = client_record  # create_client returns new client_id
-            # Import platforms
-            platforms = get_platforms_from_sheet(worksheet)
-            platform_id_map = {}
-            for plat_key, url in platforms.items():
-                # Extract platform number from key "ПЛАТФОРМА X"
-                m = re.search(r"(\d+)", plat_key)
-                if not m:
-                    continue
-                plat_num = int(m.group(1))
-                platform_id = await create_platform(client_id, plat_num, url)
-                platform_id_map[plat_num] = platform_id
-            # Import reviews for each platform section
+            client_id = await create_client(client_number, "")  # password set empty (to be updated by admin)
+            # Import platforms in one statement
             reviews_by_platform = get_platform_reviews_from_sheet(worksheet)
+            platform_id_map = await repo.upsert_platforms(
+                client_id, get_sheet_platform_urls(get_platforms_from_sheet(worksheet), reviews_by_platform)
+            )
+            # Import reviews of all platform sections in one statement
+            new_reviews = []
             for plat_key, rows in reviews_by_platform.items():
                 m = re.search(r"ПЛАТФОРМА\s+(\d+)", plat_key, re.IGNORECASE)
                 if not m:
                     continue
-                plat_num = int(m.group(1))
-                platform_id = platform_id_map.get(plat_num)
-                if platform_id is None:
-                    # If platform link was not in top section, create platform without URL
-                    platform_id = await create_platform(client_id, plat_num, None)
-                    platform_id_map[plat_num] = platform_id
+                platform_id = platform_id_map.get(int(m.group(1)))
                 for row in rows:
-                    # row format: [ (maybe empty colA), date, manager_comment, status, review_text, photo_link, ... ]
-                    date_str = row[1].strip() if len(row) > 1 else ""
-                    manager_comment = row[2].strip() if len(row) > 2 else ""
-                    status_cell = row[3].strip() if len(row) > 3 else ""
-                    review_text = row[4].strip() if len(row) > 4 else ""
-                    photo_link = row[5].strip() if len(row) > 5 else ""
-                    # Determine status value
-                    if manager_comment != "" and status_cell == "":
-                        # Manager responded but status not set, treat as approved
-                        status = "approved"
-                    elif status_cell in ("🟢", "Согласован"):
-                        status = "approved"
-                    elif status_cell in ("🚫", "Отклонен"):
-                        status = "rejected"
-                    elif status_cell == "⚠️":
-                        status = "pending"
-                    else:
-                        status = "new"
-                    # Insert review into database
-                    await create_review(client_id, platform_id, review_text, date_str, manager_comment, status, photo_link or None)
+                    date_str, manager_comment, status, review_text, photo_link = parse_review_row(row)
+                    new_reviews.append(NewReview(client_id, platform_id, review_text, date_str, manager_comment,
+                                                 status, photo_link or None))
+            await repo.bulk_create_reviews(new_reviews)
     print("Initial data import from Google Sheets completed.")
 
-async def sync_with_google():
+async def sync_with_google(repo, bot):
     """Continuous synchronization: add new reviews, update status changes, and export new bot entries to Google Sheets every minute."""
-    from database import (get_platforms_with_new_counts, get_new_reviews, get_client_by_number,
-                          get_authorized_client_by_chat, get_unsynced_photo_packs,
-                          mark_photo_pack_synced, create_review)  # avoid circular imports at top
+    from database import get_unsynced_photo_packs, mark_photo_pack_synced  # avoid circular imports at top
     # Structures to track notification state
     last_count_per_platform = {}   # {(client_id, platform_id): last_new_count}
     pending_notifications = {}    # {(client_id, platform_id): {"timestamp": time, "diff": diff}}
+    archived_keys = {}            # {client_id: set of sheet keys known to be archived reviews}
     while True:
         # Sync every 60 seconds
         await asyncio.sleep(60)
-        # Synchronize data for each client in Google Sheets
-        for sheet_id in spreadsheet_ids:
+        # Synchronize data for each client in Google Sheets: the configured spreadsheets and the ones
+        # assigned to clients individually by the bulk import
+        sync_sheet_ids = list(spreadsheet_ids)
+        try:
+            sync_sheet_ids += [s for s in await repo.get_client_spreadsheet_ids() if s not in sync_sheet_ids]
+        except Exception as e:
+            print(f"Error loading client spreadsheets: {e}")
+        for sheet_id in sync_sheet_ids:
             sheet_obj = None
             try:
                 sheet_obj = connect_to_sheet(sheet_id)
             except Exception:
                 continue  # if sheet not accessible, skip this iteration
+            client_sheets = []
             for worksheet in sheet_obj.worksheets():
-                title = worksheet.title.strip()
-                match = re.match(r"Клиент\s+(\d+)", title, re.IGNORECASE)
-                if not match:
-                    continue
-                client_number = int(match.group(1))
+                match = re.match(r"Клиент\s+(\d+)", worksheet.title.strip(), re.IGNORECASE)
+                if match:
+                    client_sheets.append((int(match.group(1)), worksheet))
+            # Look up all clients of this spreadsheet at once
+            clients_by_number = await repo.get_clients_by_numbers([number for number, _ in client_sheets])
+            for client_number, worksheet in client_sheets:
                 # Check if client exists in DB
-                client_row = await get_client_by_number(client_number)
+                client_row = clients_by_number.get(client_number)
                 if not client_row:
                     continue
+                # A client with its own spreadsheet is synced only from that one
+                own_sheet_id = client_row["spreadsheet_id"]
+                if own_sheet_id and own_sheet_id != sheet_id:
+                    continue
+                if not own_sheet_id and sheet_id not in spreadsheet_ids:
+                    continue
                 client_id = client_row["id"]
-                # Fetch platform data from sheet and DB
+                # Fetch platform data from sheet and make sure all platforms exist in DB (one statement)
                 sheet_platforms = get_platforms_from_sheet(worksheet)
                 reviews_by_platform = get_platform_reviews_from_sheet(worksheet)
-                # Ensure all platforms from sheet exist in DB
-                platform_ids = {}
-                for plat_key, url in sheet_platforms.items():
-                    m = re.search(r"(\d+)", plat_key)
-                    if not m:
-                        continue
-                    plat_num = int(m.group(1))
-                    # Find or create platform in DB
-                    async with pool.acquire() as conn:
-                        platform_id = await conn.fetchval(
-                            "SELECT id FROM platforms WHERE client_id=$1 AND number=$2;",
-                            client_id, plat_num
-                        )
-                        if not platform_id:
-                            platform_id = await conn.fetchval(
-                                "INSERT INTO platforms(client_id, number, url) VALUES($1, $2, $3) RETURNING id;",
-                                client_id, plat_num, url
-                            )
-                    platform_ids[plat_num] = platform_id
+                platform_ids = await repo.upsert_platforms(
+                    client_id, get_sheet_platform_urls(sheet_platforms, reviews_by_platform)
+                )
                 # Now synchronize reviews:
                 # Build sets for sheet and DB reviews for comparison
                 sheet_review_set = set()
@@ -264,76 +322,59 @@ async def sync_with_google():
                     if not m:
                         continue
                     plat_num = int(m.group(1))
-                    platform_id = platform_ids.get(plat_num)
-                    if platform_id is None:
-                        # Create platform if missing
-                        platform_id = await create_platform(client_id, plat_num, None)
-                        platform_ids[plat_num] = platform_id
                     for row in rows:
-                        date_str = row[1].strip() if len(row) > 1 else ""
-                        manager_comment = row[2].strip() if len(row) > 2 else ""
-                        status_cell = row[3].strip() if len(row) > 3 else ""
-                        review_text = row[4].strip() if len(row) > 4 else ""
-                        photo_link = row[5].strip() if len(row) > 5 else ""
-                        # Determine sheet status in terms of DB values
-                        if manager_comment != "" and status_cell == "":
-                            sheet_status = "approved"
-                        elif status_cell in ("🟢", "Согласован"):
-                            sheet_status = "approved"
-                        elif status_cell in ("🚫", "Отклонен"):
-                            sheet_status = "rejected"
-                        elif status_cell == "⚠️":
-                            sheet_status = "pending"
-                        else:
-                            sheet_status = "new"
+                        date_str, manager_comment, sheet_status, review_text, photo_link = parse_review_row(row)
                         # Only consider actual review entries with text
                         if review_text:
                             key = (plat_num, review_text, date_str)
                             sheet_review_set.add(key)
                             sheet_reviews_data[key] = (sheet_status, manager_comment, photo_link)
                 # Fetch all reviews from DB for this client
-                async with pool.acquire() as conn:
-                    db_rows = await conn.fetch("""
-                        SELECT p.number as plat_num, r.review_text, r.review_date, r.manager_comment, r.status, r.photo_link
-                        FROM reviews r 
-                        JOIN platforms p ON r.platform_id = p.id
-                        WHERE r.client_id=$1;
-                    """, client_id)
+                db_rows = await repo.get_client_reviews(client_id)
                 db_review_set = set()
                 db_reviews_data = {}
+                duplicate_of = {}  # key -> id of the earlier review it looks like
                 for r in db_rows:
-                    plat_num = r["plat_num"]
-                    text = r["review_text"]
-                    date_str = r["review_date"] or ""
-                    status = r["status"]
-                    m_comment = r["manager_comment"] or ""
-                    photo_link = r["photo_link"] or ""
-                    key = (plat_num, text, date_str)
+                    key = (r["plat_num"], r["review_text"], r["review_date_raw"] or "")
                     db_review_set.add(key)
-                    db_reviews_data[key] = (status, m_comment, photo_link)
-                # Find new reviews in sheet (to add to DB)
-                new_sheet_reviews = sheet_review_set - db_review_set
-                for key in new_sheet_reviews:
+                    db_reviews_data[key] = (r["status"], r["manager_comment"] or "", r["photo_link"] or "", r["id"])
+                    if r["duplicate_of"]:
+                        duplicate_of[key] = r["duplicate_of"]
+                # Sheet rows missing from the working reviews may be archived ones: look only those up
+                known_archived = archived_keys.setdefault(client_id, set())
+                unknown = sheet_review_set - db_review_set - known_archived
+                known_archived |= await repo.find_archived_reviews(client_id, unknown)
+                # Find new reviews in sheet (to add to DB) and insert them in one statement
+                new_reviews = []
+                for key in unknown - known_archived:
                     plat_num, text, date_str = key
                     sheet_status, m_comment, photo_link = sheet_reviews_data.get(key, ("new", "", ""))
-                    platform_id = platform_ids.get(plat_num)
-                    # Insert into DB
-                    await create_review(client_id, platform_id, text, date_str, m_comment, sheet_status, photo_link or None)
+                    new_reviews.append(NewReview(client_id, platform_ids.get(plat_num), text, date_str, m_comment,
+                                                 sheet_status, photo_link or None))
+                await repo.bulk_create_reviews(new_reviews)
                 # Find reviews added via bot that need exporting to sheet
                 new_bot_reviews = db_review_set - sheet_review_set
+                duplicate_texts = await get_review_texts(
+                    [duplicate_of[key] for key in new_bot_reviews if key in duplicate_of]
+                )
                 for key in new_bot_reviews:
                     plat_num, text, date_str = key
-                    status, m_comment, photo_link = db_reviews_data.get(key, (None, "", ""))
+                    status, m_comment, photo_link, _ = db_reviews_data.get(key, (None, "", "", None))
                     # Only export those that are pending or new in DB (i.e., likely added via bot)
                     if status in ("pending", "new"):
-                        platform_id = platform_ids.get(plat_num)
                         platform_label = f"ПЛАТФОРМА {plat_num}".upper()
                         # Determine insertion row index in sheet for this platform section
                         insert_idx = get_platform_insertion_index(worksheet, platform_label)
                         # Compose row values
                         # If added via bot, mark as "Внесено клиентом" with ⚠️ status
+                        label = "Внесено клиентом"
+                        original = duplicate_texts.get(duplicate_of.get(key))
+                        if original:
+                            # Near-duplicate of an earlier review: show the managers which one
+                            short = original if len(original) <= 80 else original[:80] + "…"
+                            label += f" (возможный дубль: «{short}»)"
                         new_row = [
-                            "Внесено клиентом",
+                            label,
                             datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
                             "",
                             "⚠️",
@@ -345,63 +386,23 @@ async def sync_with_google():
                         except Exception as e:
                             print(f"Error exporting review to sheet for client {client_number}: {e}")
                         # (We keep status in DB as pending; admin can handle it later)
-                # Reflect status changes from sheet to DB
+                # Reflect status changes from sheet to DB (one statement for all changed reviews)
+                status_changes = []
                 for key in sheet_review_set.intersection(db_review_set):
                     sheet_status, sheet_m_comment, sheet_photo = sheet_reviews_data.get(key, (None, "", ""))
-                    db_status, db_m_comment, db_photo = db_reviews_data.get(key, (None, "", ""))
+                    db_status, db_m_comment, db_photo, review_id = db_reviews_data.get(key, (None, "", "", None))
                     if not sheet_status or not db_status:
                         continue
-                    # If status on sheet is now approved or rejected, update DB if it was new/pending
+                    # If status on sheet is now approved or rejected, update DB if it was new/pending;
+                    # a manager comment from the sheet is stored if we had none
                     if sheet_status in ("approved", "rejected") and db_status in ("new", "pending"):
-                        # Find the review ID in DB
-                        plat_num, text, date_str = key
-                        platform_id = platform_ids.get(plat_num)
-                        async with pool.acquire() as conn:
-                            review_id = await conn.fetchval("""
-                                SELECT r.id FROM reviews r 
-                                JOIN platforms p ON r.platform_id=p.id
-                                WHERE r.client_id=$1 AND p.number=$2 AND r.review_text=$3 AND COALESCE(r.review_date, '')=$4;
-                            """, client_id, plat_num, text, date_str)
-                        if review_id:
-                            new_status_val = "approved" if sheet_status == "approved" else "rejected"
-                            await update_review_status(review_id, new_status_val)
-                            # If manager comment exists and we had none, update that too (optional, for record)
-                            if sheet_m_comment and not db_m_comment:
-                                async with pool.acquire() as conn:
-                                    await conn.execute(
-                                        "UPDATE reviews SET manager_comment=$1 WHERE id=$2;",
-                                        sheet_m_comment, review_id
-                                    )
-                    # If a manager comment is present on sheet and DB status still 'new', mark as approved
-                    if sheet_status == "approved" and db_status == "new":
-                        plat_num, text, date_str = key
-                        platform_id = platform_ids.get(plat_num)
-                        async with pool.acquire() as conn:
-                            review_id = await conn.fetchval("""
-                                SELECT r.id FROM reviews r 
-                                JOIN platforms p ON r.platform_id=p.id
-                                WHERE r.client_id=$1 AND p.number=$2 AND r.review_text=$3 AND COALESCE(r.review_date, '')=$4;
-                            """, client_id, plat_num, text, date_str)
-                        if review_id:
-                            await update_review_status(review_id, "approved")
+                        comment = sheet_m_comment if sheet_m_comment and not db_m_comment else None
+                        status_changes.append((review_id, sheet_status, comment))
+                await repo.bulk_update_statuses(status_changes)
                 # Handle any unsynced photo packs for this client
                 packs = await get_unsynced_photo_packs(client_id)
                 for pack in packs:
-                    pack_id = pack["id"]
-                    platform_id = pack["platform_id"]
-                    folder_link = pack["folder_link"]
-                    # Determine platform number from platform_id
-                    plat_num = None
-                    for num, pid in platform_ids.items():
-                        if pid == platform_id:
-                            plat_num = num
-                            break
-                    if plat_num is None:
-                        # Fetch platform number from DB if not in map
-                        async with pool.acquire() as conn:
-                            plat_num = await conn.fetchval(
-                                "SELECT number FROM platforms WHERE id=$1;", platform_id
-                            )
+                    plat_num = pack["platform_number"]
                     platform_label = f"ПЛАТФОРМА {plat_num}".upper() if plat_num is not None else None
                     if platform_label:
                         insert_idx = get_platform_insertion_index(worksheet, platform_label)
@@ -410,69 +411,54 @@ async def sync_with_google():
                     pack_row = [
                         "Добавленный ПАК с фото клиентом для всей платформы",
                         datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                        "", "", "", folder_link
+                        "", "", "", pack["folder_link"]
                     ]
                     try:
                         worksheet.insert_row(pack_row, index=insert_idx)
-                        await mark_photo_pack_synced(pack_id)
+                        await mark_photo_pack_synced(pack["id"])
                     except Exception as e:
                         print(f"Error syncing photo pack for client {client_number}: {e}")
         # After syncing data, handle notification checks for authorized clients
-        async with pool.acquire() as conn:
-            auth_clients = await conn.fetch("SELECT id, number, telegram_id FROM clients WHERE authorized=True;")
-        for client in auth_clients:
-            client_id = client["id"]
-            chat_id = client["telegram_id"]
-            # Get current count of new reviews per platform from DB
-            new_counts = {}
-            async with pool.acquire() as conn:
-                rows = await conn.fetch("""
-                    SELECT platform_id, COUNT(*) AS cnt 
-                    FROM reviews WHERE client_id=$1 AND status='new'
-                    GROUP BY platform_id;
-                """, client_id)
-            for r in rows:
-                new_counts[r["platform_id"]] = r["cnt"]
-            # For each platform of this client
-            for platform_id, new_count in new_counts.items():
-                key = (client_id, platform_id)
-                last_count = last_count_per_platform.get(key, 0)
-                diff = new_count - last_count
-                if diff > 0:
-                    pending = pending_notifications.get(key)
-                    current_time = asyncio.get_event_loop().time()
-                    if not pending:
-                        pending_notifications[key] = {"timestamp": current_time, "diff": diff}
-                    else:
-                        # Update diff if more new reviews
-                        pending["diff"] = diff
-                        # If 10 minutes have passed since first detection, send notification
-                        if current_time - pending["timestamp"] >= 600:
-                            updated_diff = diff
-                            if updated_diff > 0:
-                                # Determine platform number or name for message
-                                plat_num = None
-                                async with pool.acquire() as conn:
-                                    plat_num = await conn.fetchval(
-                                        "SELECT number FROM platforms WHERE id=$1;", platform_id
-                                    )
-                                platform_label = f"ПЛАТФОРМА {plat_num}" if plat_num else "платформе"
-                                # Send notification to client
-                                try:
-                                    from main import bot  # import bot for sending
-                                    await bot.send_message(
-                                        chat_id,
-                                        f"На {platform_label} появилось {updated_diff} новых отзывов.",
-                                        disable_web_page_preview=True,
-                                        reply_markup=None
-                                    )
-                                except Exception as e:
-                                    print(f"Failed to send notification to client {client_id}: {e}")
-                                # Clear pending and update last count
-                                pending_notifications.pop(key, None)
-                                last_count_per_platform[key] = new_count
+        auth_clients = await repo.get_authorized_clients()
+        chat_by_client = {client["id"]: client["telegram_id"] for client in auth_clients}
+        # Current count of new reviews per platform of all these clients, from the counters (one query)
+        for row in await repo.get_new_counts(list(chat_by_client)):
+            client_id = row["client_id"]
+            platform_id = row["platform_id"]
+            new_count = row["new_count"]
+            chat_id = chat_by_client[client_id]
+            key = (client_id, platform_id)
+            last_count = last_count_per_platform.get(key, 0)
+            diff = new_count - last_count
+            if diff > 0:
+                pending = pending_notifications.get(key)
+                current_time = asyncio.get_event_loop().time()
+                if not pending:
+                    pending_notifications[key] = {"timestamp": current_time, "diff": diff}
                 else:
-                    # No new reviews or negative diff => clear pending if any
-                    if (client_id, platform_id) in pending_notifications:
-                        pending_notifications.pop(key, None)
-                    last_count_per_platform[key] = new_count
+                    # Update diff if more new reviews
+                    pending["diff"] = diff
+                    # If 10 minutes have passed since first detection, send notification
+                    if current_time - pending["timestamp"] >= 600:
+                        updated_diff = diff
+                        if updated_diff > 0:
+                            plat_num = row["platform_number"]
+                            platform_label = f"ПЛАТФОРМА {plat_num}" if plat_num else "платформе"
+                            # Send notification to client
+                            try:
+                                await bot.send_message(
+                                    chat_id,
+                                    f"На {platform_label} появилось {updated_diff} новых отзывов.",
+                                    disable_web_page_preview=True,
+                                    reply_markup=None
+                                )
+                            except Exception as e:
+                                print(f"Failed to send notification to client {client_id}: {e}")
+                            # Clear pending and update last count
+                            pending_notifications.pop(key, None)
+                            last_count_per_platform[key] = new_count
+            else:
+                # No new reviews or negative diff => clear pending if any
+                if (client_id, platform_id) in pending_notifications:
+                    pending_notifications.pop(key, None)
+                last_count_per_platform[key] = new_count
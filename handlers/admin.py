@@ -1,269 +1,393 @@
-
 # handlers/admin.py
-"""Обработчики для команд и колбэков панели администратора.
+"""Обработчики панели администратора.
+
+Клиенты хранятся только в PostgreSQL: поиск по номеру идёт по уникальному индексу, изменения сразу
+видны всем процессам бота, файлового хранилища (clients.json) больше нет. Здесь же поиск отзывов
+(/search), выгрузка (/export) и массовый импорт клиентов из CSV; очередь модерации — в
+handlers/moderation.py."""
+import os
+import re
+import html
+import logging
 
-Позволяют администратору создавать новых клиентов, изменять номер/пароль клиента и просматривать статистику клиентов."""
 from aiogram import Router, types, F
-from aiogram.filters import Command
-from aiogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton
+from aiogram.filters import Command, CommandObject
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
+from aiogram.types import FSInputFile
+from keyboards import get_auth_keyboard, get_admin_menu_keyboard, get_search_page_keyboard
+from database import get_client_by_number, create_client, update_client_number, update_client_password, get_client_stats
+from database import get_platform_id, search_reviews, SEARCH_MATCH_START, SEARCH_MATCH_END
+from database import import_clients
+from client_import import MAX_IMPORT_FILE_SIZE, decode_upload, parse_clients_csv
 
-from config import ADMIN_ID
-from utils import clients, save_clients, find_client_key, clear_all_messages, send_and_track
-from keyboards import get_auth_keyboard, get_admin_menu_keyboard
-from database import get_client_stats
+router = Router()
+logger = logging.getLogger(__name__)
 
-admin_router = Router()
+# Number of results shown per page of /search
+SEARCH_PAGE_SIZE = 10
+# Optional scope before the query: "12" (client) or "12:3" (client and platform)
+SEARCH_SCOPE = re.compile(r"^(\d+)(?::(\d+))?$")
+STATUS_LABELS = {"new": "новый", "pending": "на проверке", "approved": "согласован", "rejected": "отклонён"}
 
 class AdminStates(StatesGroup):
     """Состояния, используемые в сценариях панели администратора."""
     WaitingForCreateClientNumber = State()
     WaitingForCreateClientPassword = State()
     WaitingForEditClientNumber = State()
-    WaitingForEditAction = State()
     WaitingForNewClientNumber = State()
-    WaitingForNewClientPassword = State()
+    WaitingForEditPasswordClient = State()
+    WaitingForNewPassword = State()
     WaitingForViewStats = State()
+    WaitingForClientsFile = State()
 
-@admin_router.message(Command("admin"))
-async def admin_command(message: Message, state: FSMContext):
+def is_admin(chat_id, bot) -> bool:
+    """Проверить, что чат принадлежит администратору (ADMIN_ID)."""
+    return str(chat_id) == str(bot.admin_id)
+
+@router.message(Command("admin"))
+async def admin_command(message: types.Message, state: FSMContext):
     """Точка входа в панель администратора через команду /admin."""
-    chat_id = message.chat.id
-    await clear_all_messages(chat_id, state)
-    if str(chat_id) != ADMIN_ID:
-        await send_and_track(chat_id, "У вас нет доступа в административную панель.", state)
+    if not is_admin(message.chat.id, message.bot):
+        await message.answer("У вас нет доступа в административную панель.")
         return
-    await send_and_track(chat_id,
-                         "<b>Административная панель</b>\nВыберите нужное действие:",
-                         state,
-                         reply_markup=get_admin_menu_keyboard())
+    await state.clear()
+    await message.answer(
+        "<b>Административная панель</b>\nВыберите нужное действие:",
+        reply_markup=get_admin_menu_keyboard()
+    )
 
-@admin_router.callback_query(F.data == "admin_create_client")
-async def admin_create_client(callback: types.CallbackQuery, state: FSMContext):
-    """Обработчик нажатия кнопки 'Создать клиента' в админ-меню."""
-    chat_id = callback.message.chat.id
-    await clear_all_messages(chat_id, state)
-    if str(chat_id) != ADMIN_ID:
+@router.callback_query(F.data == "admin_create_client")
+async def admin_create_client_callback(callback: types.CallbackQuery, state: FSMContext):
+    """Администратор выбрал создание нового клиента."""
+    if not is_admin(callback.message.chat.id, callback.bot):
         await callback.answer("Доступ запрещен", show_alert=True)
         return
-    try:
-        await callback.message.edit_reply_markup(reply_markup=None)
-    except Exception:
-        pass
     await callback.answer()
-    await send_and_track(chat_id, "Введите номер нового клиента:", state, reply_markup=get_auth_keyboard())
+    # Prompt for new client number
+    await callback.message.edit_text("Введите новый номер клиента:", reply_markup=get_auth_keyboard())
     await state.set_state(AdminStates.WaitingForCreateClientNumber)
 
-@admin_router.message(AdminStates.WaitingForCreateClientNumber)
-async def process_create_client_number(message: Message, state: FSMContext):
-    """Обработать ввод номера клиента для создания нового клиента."""
-    chat_id = message.chat.id
-    await clear_all_messages(chat_id, state)
-    if not message.text or not message.text.strip().isdigit():
-        await send_and_track(chat_id, "Введите корректный номер (целое число).", state,
-                              reply_markup=get_auth_keyboard())
+@router.message(AdminStates.WaitingForCreateClientNumber)
+async def process_create_client_number(message: types.Message, state: FSMContext):
+    """Обработать ввод номера нового клиента."""
+    num_text = message.text.strip() if message.text else ""
+    if not num_text.isdigit():
+        await message.answer("Пожалуйста, введите корректный номер клиента (целое число).", reply_markup=get_auth_keyboard())
         return
-    num = message.text.strip()
-    if find_client_key(num):
-        await send_and_track(chat_id, "Клиент с таким номером уже существует.", state,
-                              reply_markup=get_auth_keyboard())
+    new_num = int(num_text)
+    # Check if client already exists
+    record = await get_client_by_number(new_num)
+    if record:
+        await message.answer("Клиент с таким номером уже существует.", reply_markup=get_auth_keyboard())
         await state.clear()
         return
-    # Временно сохраняем новый номер и переходим к запросу пароля
-    await state.update_data(new_client_number=num)
-    await send_and_track(chat_id, "Введите пароль для нового клиента:", state, reply_markup=get_auth_keyboard())
+    # Store the new client number and prompt for password
+    await state.update_data(new_client_number=new_num)
+    await message.answer("Введите пароль для нового клиента:", reply_markup=get_auth_keyboard())
     await state.set_state(AdminStates.WaitingForCreateClientPassword)
 
-@admin_router.message(AdminStates.WaitingForCreateClientPassword)
-async def process_create_client_password(message: Message, state: FSMContext):
-    """Завершить создание нового клиента, сохранив введённый пароль."""
-    chat_id = message.chat.id
-    await clear_all_messages(chat_id, state)
-    password = message.text.strip()
+@router.message(AdminStates.WaitingForCreateClientPassword)
+async def process_create_client_password(message: types.Message, state: FSMContext):
+    """Создать нового клиента с введённым паролем."""
     data = await state.get_data()
-    num = data.get("new_client_number")
-    if not num:
-        await send_and_track(chat_id, "Ошибка. Повторите создание клиента.", state,
-                              reply_markup=get_auth_keyboard())
+    new_num = data.get("new_client_number")
+    password = message.text.strip() if message.text else ""
+    if new_num is None or password == "":
+        await message.answer("Ошибка при создании клиента. Попробуйте заново.", reply_markup=get_auth_keyboard())
         await state.clear()
         return
-    key = f"КЛИЕНТ {num}(new)"
-    clients[key] = {"password": password, "authorized": False, "telegram_id": None}
-    save_clients(clients)
-    await send_and_track(chat_id, f"Клиент {key} успешно создан.", state,
-                          reply_markup=get_admin_menu_keyboard())
+    # Create client in DB
+    await create_client(new_num, password)
+    await message.answer(f"Клиент {new_num} успешно создан.", reply_markup=get_admin_menu_keyboard())
     await state.clear()
 
-@admin_router.callback_query(F.data == "admin_edit_client")
-async def admin_edit_client(callback: types.CallbackQuery, state: FSMContext):
-    """Обработчик нажатия 'Редактировать клиента' в админ-меню."""
-    chat_id = callback.message.chat.id
-    await clear_all_messages(chat_id, state)
-    if str(chat_id) != ADMIN_ID:
+@router.callback_query(F.data == "admin_edit_client")
+async def admin_edit_client_callback(callback: types.CallbackQuery, state: FSMContext):
+    """Администратор выбрал смену номера существующего клиента."""
+    if not is_admin(callback.message.chat.id, callback.bot):
         await callback.answer("Доступ запрещен", show_alert=True)
         return
-    try:
-        await callback.message.edit_reply_markup(reply_markup=None)
-    except Exception:
-        pass
     await callback.answer()
-    await send_and_track(chat_id, "Введите номер клиента для редактирования:", state,
-                          reply_markup=get_auth_keyboard())
+    await callback.message.edit_text("Введите текущий номер клиента для редактирования:", reply_markup=get_auth_keyboard())
     await state.set_state(AdminStates.WaitingForEditClientNumber)
 
-@admin_router.message(AdminStates.WaitingForEditClientNumber)
-async def process_edit_client_number(message: Message, state: FSMContext):
-    """Обработать ввод номера клиента для редактирования (смена номера или пароля)."""
-    chat_id = message.chat.id
-    await clear_all_messages(chat_id, state)
-    if not message.text or not message.text.strip().isdigit():
-        await send_and_track(chat_id, "Введите корректный номер (целое число).", state,
-                              reply_markup=get_auth_keyboard())
+@router.message(AdminStates.WaitingForEditClientNumber)
+async def process_edit_client_number(message: types.Message, state: FSMContext):
+    """Обработать ввод номера клиента, которого нужно изменить."""
+    num_text = message.text.strip() if message.text else ""
+    if not num_text.isdigit():
+        await message.answer("Введите корректный номер (целое число).", reply_markup=get_auth_keyboard())
+        return
+    old_num = int(num_text)
+    client_record = await get_client_by_number(old_num)
+    if not client_record:
+        await message.answer("Клиент с таким номером не найден.", reply_markup=get_auth_keyboard())
+        await state.clear()
+        return
+    # Store the client ID to edit
+    await state.update_data(edit_client_id=client_record["id"], edit_client_number=old_num)
+    # Prompt for new number
+    await message.answer("Введите новый номер клиента:", reply_markup=get_auth_keyboard())
+    await state.set_state(AdminStates.WaitingForNewClientNumber)
+
+@router.message(AdminStates.WaitingForNewClientNumber)
+async def process_new_client_number(message: types.Message, state: FSMContext):
+    """Обработать ввод нового номера клиента."""
+    num_text = message.text.strip() if message.text else ""
+    if not num_text.isdigit():
+        await message.answer("Пожалуйста, введите корректный номер (целое число).", reply_markup=get_auth_keyboard())
         return
-    num = message.text.strip()
-    key = find_client_key(num)
-    if not key:
-        await send_and_track(chat_id, "Клиент с таким номером не найден.", state,
-                              reply_markup=get_auth_keyboard())
+    new_num = int(num_text)
+    data = await state.get_data()
+    old_client_id = data.get("edit_client_id")
+    old_number = data.get("edit_client_number")
+    if old_client_id is None:
+        await message.answer("Ошибка. Повторите операцию.", reply_markup=get_auth_keyboard())
         await state.clear()
         return
-    # Сохраняем ключ (идентификатор) клиента для редактирования и предлагаем выбор действия
-    await state.update_data(edit_client_key=key)
-    options_keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="Сменить номер клиента", callback_data="admin_edit_number")],
-        [InlineKeyboardButton(text="Сменить пароль клиента", callback_data="admin_edit_password")],
-        [InlineKeyboardButton(text="В главное меню", callback_data="back_to_main_menu")]
-    ])
-    await send_and_track(chat_id, "Выберите действие:", state, reply_markup=options_keyboard)
-    await state.set_state(AdminStates.WaitingForEditAction)
+    # Check if new number is not already taken by another client
+    existing = await get_client_by_number(new_num)
+    if existing:
+        await message.answer("Клиент с новым номером уже существует.", reply_markup=get_auth_keyboard())
+        await state.clear()
+        return
+    # Update the client's number in DB
+    await update_client_number(old_client_id, new_num)
+    await message.answer(f"Номер клиента изменён с {old_number} на {new_num}.", reply_markup=get_admin_menu_keyboard())
+    await state.clear()
 
-@admin_router.callback_query(F.data == "admin_edit_number")
-async def admin_edit_number(callback: types.CallbackQuery, state: FSMContext):
-    """Обработчик выбора смены номера клиента."""
-    chat_id = callback.message.chat.id
-    await clear_all_messages(chat_id, state)
-    if str(chat_id) != ADMIN_ID:
+@router.callback_query(F.data == "admin_edit_password")
+async def admin_edit_password_callback(callback: types.CallbackQuery, state: FSMContext):
+    """Администратор выбрал смену пароля клиента."""
+    if not is_admin(callback.message.chat.id, callback.bot):
         await callback.answer("Доступ запрещен", show_alert=True)
         return
-    try:
-        await callback.message.edit_reply_markup(reply_markup=None)
-    except Exception:
-        pass
     await callback.answer()
-    await send_and_track(chat_id, "Введите новый номер клиента:", state, reply_markup=get_auth_keyboard())
-    await state.set_state(AdminStates.WaitingForNewClientNumber)
+    await callback.message.edit_text("Введите номер клиента для изменения пароля:", reply_markup=get_auth_keyboard())
+    await state.set_state(AdminStates.WaitingForEditPasswordClient)
 
-@admin_router.message(AdminStates.WaitingForNewClientNumber)
-async def process_new_client_number(message: Message, state: FSMContext):
-    """Обработать ввод нового номера клиента при редактировании."""
-    chat_id = message.chat.id
-    await clear_all_messages(chat_id, state)
-    if not message.text or not message.text.strip().isdigit():
-        await send_and_track(chat_id, "Введите корректный номер (целое число).", state,
-                              reply_markup=get_auth_keyboard())
+@router.message(AdminStates.WaitingForEditPasswordClient)
+async def process_edit_password_client(message: types.Message, state: FSMContext):
+    """Обработать ввод номера клиента для смены пароля."""
+    num_text = message.text.strip() if message.text else ""
+    if not num_text.isdigit():
+        await message.answer("Введите корректный номер клиента.", reply_markup=get_auth_keyboard())
         return
-    new_num = message.text.strip()
-    data = await state.get_data()
-    old_key = data.get("edit_client_key")
-    if not old_key:
-        await send_and_track(chat_id, "Ошибка. Повторите операцию.", state,
-                              reply_markup=get_auth_keyboard())
+    client_num = int(num_text)
+    client_record = await get_client_by_number(client_num)
+    if not client_record:
+        await message.answer("Клиент с таким номером не найден.", reply_markup=get_auth_keyboard())
         await state.clear()
         return
-    if find_client_key(new_num):
-        await send_and_track(chat_id, "Клиент с новым номером уже существует.", state,
-                              reply_markup=get_auth_keyboard())
+    # Store client ID to change password
+    await state.update_data(password_client_id=client_record["id"], password_client_number=client_num)
+    await message.answer("Введите новый пароль для клиента:", reply_markup=get_auth_keyboard())
+    await state.set_state(AdminStates.WaitingForNewPassword)
+
+@router.message(AdminStates.WaitingForNewPassword)
+async def process_new_password(message: types.Message, state: FSMContext):
+    """Сохранить новый пароль клиента в базе данных."""
+    data = await state.get_data()
+    client_id = data.get("password_client_id")
+    client_num = data.get("password_client_number")
+    new_password = message.text.strip() if message.text else ""
+    if client_id is None or new_password == "":
+        await message.answer("Ошибка. Повторите операцию.", reply_markup=get_auth_keyboard())
         await state.clear()
         return
-    new_key = f"КЛИЕНТ {new_num}(new)"
-    # Переименовываем ключ клиента в словаре (смена номера)
-    clients[new_key] = clients.pop(old_key)
-    save_clients(clients)
-    await send_and_track(chat_id, f"Номер клиента изменён с {old_key} на {new_key}.", state,
-                          reply_markup=get_admin_menu_keyboard())
+    await update_client_password(client_id, new_password)
+    await message.answer(f"Пароль для клиента {client_num} успешно изменён.", reply_markup=get_admin_menu_keyboard())
     await state.clear()
 
-@admin_router.callback_query(F.data == "admin_edit_password")
-async def admin_edit_password(callback: types.CallbackQuery, state: FSMContext):
-    """Обработчик выбора смены пароля клиента."""
-    chat_id = callback.message.chat.id
-    await clear_all_messages(chat_id, state)
-    if str(chat_id) != ADMIN_ID:
+@router.callback_query(F.data == "admin_import_clients")
+async def admin_import_clients_callback(callback: types.CallbackQuery, state: FSMContext):
+    """Администратор выбрал массовое создание клиентов из CSV-файла."""
+    if not is_admin(callback.message.chat.id, callback.bot):
         await callback.answer("Доступ запрещен", show_alert=True)
         return
-    try:
-        await callback.message.edit_reply_markup(reply_markup=None)
-    except Exception:
-        pass
     await callback.answer()
-    await send_and_track(chat_id, "Введите новый пароль для клиента:", state, reply_markup=get_auth_keyboard())
-    await state.set_state(AdminStates.WaitingForNewClientPassword)
+    await callback.message.edit_text(
+        "Отправьте CSV-файл со строками вида <code>номер;пароль;таблица</code>.\n"
+        "Таблица необязательна: номер N из SPREADSHEET_ID_N или ID таблицы. "
+        "Существующим клиентам будет установлен новый пароль.",
+        reply_markup=get_auth_keyboard()
+    )
+    await state.set_state(AdminStates.WaitingForClientsFile)
 
-@admin_router.message(AdminStates.WaitingForNewClientPassword)
-async def process_new_client_password(message: Message, state: FSMContext):
-    """Обработать ввод нового пароля и сохранить его для выбранного клиента."""
-    chat_id = message.chat.id
-    await clear_all_messages(chat_id, state)
-    password = message.text.strip()
-    data = await state.get_data()
-    key = data.get("edit_client_key")
-    if not key:
-        await send_and_track(chat_id, "Ошибка. Повторите операцию.", state,
-                              reply_markup=get_auth_keyboard())
+@router.message(AdminStates.WaitingForClientsFile)
+async def process_clients_file(message: types.Message, state: FSMContext):
+    """Проверить загруженный CSV, создать/обновить клиентов одной транзакцией и сообщить результат по каждой строке."""
+    document = message.document
+    if not document:
+        await message.answer("Пожалуйста, отправьте CSV-файл документом.", reply_markup=get_auth_keyboard())
+        return
+    if document.file_size and document.file_size > MAX_IMPORT_FILE_SIZE:
+        await message.answer("Файл слишком большой (максимум 1 МБ).", reply_markup=get_admin_menu_keyboard())
         await state.clear()
         return
-    clients[key]["password"] = password
-    save_clients(clients)
-    await send_and_track(chat_id, f"Пароль для клиента {key} успешно изменён.", state,
-                          reply_markup=get_admin_menu_keyboard())
+    from google_sheets import spreadsheet_ids  # import here to avoid circular
+    content = await message.bot.download(document)
+    rows, errors = parse_clients_csv(decode_upload(content.read()), spreadsheet_ids)
+    results = await import_clients(rows) if rows else []
+    report = {line: f"строка {line}: ошибка — {error}" for line, error in errors}
+    for r in results:
+        action = "создан" if r["created"] else "обновлён"
+        report[r["line"]] = f"строка {r['line']}: клиент {r['number']} {action}"
+    created = sum(1 for r in results if r["created"])
+    summary = (f"<b>Импорт клиентов</b>\nСоздано: {created}, обновлено: {len(results) - created}, "
+               f"ошибок: {len(errors)}\n\n")
+    text = summary + "\n".join(html.escape(report[line]) for line in sorted(report))
+    parts = re.findall(r".{1,4000}(?:\n|$)", text, flags=re.DOTALL)
+    for i, part in enumerate(parts):
+        await message.answer(part, reply_markup=get_admin_menu_keyboard() if i == len(parts) - 1 else None)
     await state.clear()
 
-@admin_router.callback_query(F.data == "admin_view_stats")
-async def admin_view_stats(callback: types.CallbackQuery, state: FSMContext):
-    """Обработчик нажатия 'Просмотреть статистику' в админ-меню."""
-    chat_id = callback.message.chat.id
-    await clear_all_messages(chat_id, state)
-    if str(chat_id) != ADMIN_ID:
+@router.callback_query(F.data == "admin_view_stats")
+async def admin_view_stats_callback(callback: types.CallbackQuery, state: FSMContext):
+    """Администратор выбрал просмотр статистики клиента."""
+    if not is_admin(callback.message.chat.id, callback.bot):
         await callback.answer("Доступ запрещен", show_alert=True)
         return
-    try:
-        await callback.message.edit_reply_markup(reply_markup=None)
-    except Exception:
-        pass
     await callback.answer()
-    await send_and_track(chat_id, "Введите номер клиента для просмотра статистики:", state,
-                          reply_markup=get_auth_keyboard())
+    await callback.message.edit_text("Введите номер клиента для просмотра статистики:", reply_markup=get_auth_keyboard())
     await state.set_state(AdminStates.WaitingForViewStats)
 
-@admin_router.message(AdminStates.WaitingForViewStats)
-async def process_view_stats(message: Message, state: FSMContext):
-    """Обработать ввод номера клиента и вывести его статистику."""
-    chat_id = message.chat.id
-    await clear_all_messages(chat_id, state)
-    if not message.text or not message.text.strip().isdigit():
-        await send_and_track(chat_id, "Введите корректный номер (целое число).", state,
-                              reply_markup=get_auth_keyboard())
+@router.message(AdminStates.WaitingForViewStats)
+async def process_view_stats(message: types.Message, state: FSMContext):
+    """Получить и показать статистику указанного клиента."""
+    num_text = message.text.strip() if message.text else ""
+    if not num_text.isdigit():
+        await message.answer("Введите корректный номер (целое число).", reply_markup=get_auth_keyboard())
         return
-    num = message.text.strip()
-    key = find_client_key(num)
-    if not key:
-        await send_and_track(chat_id, "Клиент с таким номером не найден.", state,
-                              reply_markup=get_auth_keyboard())
+    client_num = int(num_text)
+    client_record = await get_client_by_number(client_num)
+    if not client_record:
+        await message.answer("Клиент с таким номером не найден.", reply_markup=get_auth_keyboard())
         await state.clear()
         return
-    stats = get_client_stats(key)
+    stats = await get_client_stats(client_record["id"])
     if not stats:
-        await send_and_track(chat_id, "Статистика не найдена. Обратитесь к администратору.", state,
-                              reply_markup=get_auth_keyboard())
+        await message.answer("Таблица клиента не найдена. Обратитесь к администратору.")
         await state.clear()
         return
     stat_text = (
-        f"<b>Статистика клиента {key}</b>\n"
+        f"<b>Статистика клиента {client_num}</b>\n"
         f"Общее количество отзывов: {stats['total_reviews']}\n"
         f"Согласованных отзывов: {stats['approved_reviews']}\n"
         f"Новых отзывов: {stats['new_reviews']}"
     )
-    await send_and_track(chat_id, stat_text, state, reply_markup=get_admin_menu_keyboard())
+    await message.answer(stat_text, reply_markup=get_admin_menu_keyboard())
     await state.clear()
 
+@router.message(Command("search"))
+async def search_command(message: types.Message, command: CommandObject, state: FSMContext):
+    """Полнотекстовый поиск отзывов: /search [клиент[:платформа]] слова."""
+    if not is_admin(message.chat.id, message.bot):
+        return
+    words = (command.args or "").split()
+    client_id = platform_id = None
+    scope = SEARCH_SCOPE.match(words[0]) if len(words) > 1 else None
+    if scope:
+        words = words[1:]
+        client_record = await get_client_by_number(int(scope.group(1)))
+        if not client_record:
+            await message.answer("Клиент с таким номером не найден.")
+            return
+        client_id = client_record["id"]
+        if scope.group(2):
+            platform_id = await get_platform_id(client_id, int(scope.group(2)))
+            if not platform_id:
+                await message.answer("У клиента нет платформы с таким номером.")
+                return
+    if not words:
+        await message.answer(
+            "Использование: /search [клиент[:платформа]] текст\n"
+            "Например: /search быстрая доставка или /search 12:3 \"вежливый курьер\""
+        )
+        return
+    # Page cursors: the before_id of every page shown so far (None for the first page)
+    await state.update_data(search_query=" ".join(words), search_client_id=client_id,
+                            search_platform_id=platform_id, search_cursors=[None])
+    await show_search_page(message, state)
+
+@router.callback_query(F.data.in_({"search_page_next", "search_page_prev"}))
+async def search_page_callback(callback: types.CallbackQuery, state: FSMContext):
+    """Перейти на следующую или предыдущую страницу результатов поиска."""
+    await callback.answer()
+    try:
+        await callback.message.edit_reply_markup(reply_markup=None)
+    except:
+        pass
+    data = await state.get_data()
+    cursors = data.get("search_cursors")
+    if not cursors or not data.get("search_query"):
+        await callback.message.answer("Поиск устарел. Повторите команду /search.")
+        return
+    if callback.data == "search_page_next":
+        cursors.append(data.get("search_next_cursor"))
+    elif len(cursors) > 1:
+        cursors.pop()
+    await state.update_data(search_cursors=cursors)
+    await show_search_page(callback.message, state)
+
+async def show_search_page(message: types.Message, state: FSMContext):
+    """Выполнить сохранённый поиск от текущего курсора и отправить одну страницу результатов."""
+    data = await state.get_data()
+    cursors = data["search_cursors"]
+    rows = await search_reviews(data["search_query"], data.get("search_client_id"), data.get("search_platform_id"),
+                                before_id=cursors[-1], limit=SEARCH_PAGE_SIZE + 1)
+    has_next = len(rows) > SEARCH_PAGE_SIZE
+    rows = rows[:SEARCH_PAGE_SIZE]
+    if not rows:
+        await message.answer("Ничего не найдено.")
+        return
+    await state.update_data(search_next_cursor=rows[-1]["id"])
+    lines = [f"<b>Результаты поиска</b> (страница {len(cursors)}):"]
+    for r in rows:
+        snippet = html.escape(r["snippet"]).replace(SEARCH_MATCH_START, "<b>").replace(SEARCH_MATCH_END, "</b>")
+        status = STATUS_LABELS.get(r["status"], r["status"])
+        archived = ", в архиве" if r["archived"] else ""
+        date = f", {html.escape(r['review_date_raw'])}" if r["review_date_raw"] else ""
+        lines.append(f"\n#{r['id']} · Клиент {r['client_number']} · Платформа {r['platform_number']} "
+                     f"({status}{archived}{date})\n{snippet}")
+    await message.answer("\n".join(lines), disable_web_page_preview=True,
+                         reply_markup=get_search_page_keyboard(len(cursors) > 1, has_next))
+
+@router.message(Command("export"))
+async def export_command(message: types.Message, command: CommandObject):
+    """Выгрузка отзывов или статистики файлом: /export [номер клиента | stats] [xlsx]."""
+    if not is_admin(message.chat.id, message.bot):
+        return
+    args = (command.args or "").lower().split()
+    fmt = "xlsx" if "xlsx" in args else "csv"
+    args = [a for a in args if a not in ("xlsx", "csv")]
+    kind, client_id, client_num = "reviews", None, None
+    if args and args[0] in ("stats", "статистика"):
+        kind = "stats"
+    elif args:
+        if not args[0].isdigit():
+            await message.answer("Использование: /export [номер клиента | stats] [xlsx]")
+            return
+        client_num = int(args[0])
+        client_record = await get_client_by_number(client_num)
+        if not client_record:
+            await message.answer("Клиент с таким номером не найден.")
+            return
+        client_id = client_record["id"]
+    from exports import export_to_file  # import here: only admins export
+    progress = await message.answer("Формируется выгрузка, ожидайте...")
+    path = None
+    try:
+        path, name, count = await export_to_file(kind, fmt, client_id=client_id, client_number=client_num)
+        await message.answer_document(FSInputFile(path, filename=name), caption=f"Строк: {count}")
+    except Exception as e:
+        logger.error(f"Export failed: {e}")
+        await message.answer("Не удалось сформировать выгрузку.")
+    finally:
+        if path and os.path.exists(path):
+            os.remove(path)
+        try:
+            await progress.delete()
+        except:
+            pass
@@ -0,0 +1,166 @@
+import html
+import asyncio
+import logging
+
+from aiogram import Router, types, F
+from aiogram.filters import Command
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import StatesGroup, State
+from database import get_pending_queue_page, decide_pending_reviews
+from google_sheets import write_review_decisions
+from handlers.admin import is_admin
+from utils import parse_review_numbers
+from keyboards import get_moderation_keyboard
+
+router = Router()
+logger = logging.getLogger(__name__)
+
+# Number of reviews shown per page of the moderation queue
+MODERATION_PAGE_SIZE = 10
+
+class ModerationStates(StatesGroup):
+    WaitingForApproveNumbers = State()
+    WaitingForRejectNumbers = State()
+
+@router.message(Command("moderation"))
+async def moderation_command(message: types.Message, state: FSMContext):
+    """Admin: show the first page of pending reviews of all clients."""
+    if not is_admin(message.chat.id, message.bot):
+        return
+    await state.clear()
+    await show_moderation_page(message, state)
+
+@router.callback_query(F.data == "admin_moderation")
+async def admin_moderation_callback(callback: types.CallbackQuery, state: FSMContext):
+    """Admin chose the moderation queue in the admin menu."""
+    if not is_admin(callback.message.chat.id, callback.bot):
+        await callback.answer("Доступ запрещен", show_alert=True)
+        return
+    await callback.answer()
+    try:
+        await callback.message.edit_reply_markup(reply_markup=None)
+    except:
+        pass
+    await state.clear()
+    await show_moderation_page(callback.message, state)
+
+async def show_moderation_page(message: types.Message, state: FSMContext, after_id: int = None, before_id: int = None):
+    """Send one page of the moderation queue and remember the IDs shown on it."""
+    rows, has_prev, has_next = await get_pending_queue_page(after_id=after_id, before_id=before_id,
+                                                            limit=MODERATION_PAGE_SIZE)
+    if not rows:
+        await state.update_data(moderation_page_ids=[])
+        await message.answer("Нет отзывов, ожидающих проверки.")
+        return
+    await state.update_data(moderation_page_ids=[r["id"] for r in rows])
+    lines = ["<b>Отзывы на проверке</b>"]
+    for i, r in enumerate(rows, start=1):
+        duplicate = " ⚠️ возможный дубль" if r["duplicate_of"] else ""
+        lines.append(f"\n{i}. Клиент {r['client_number']} · Платформа {r['platform_number']}{duplicate}\n"
+                     f"{html.escape(r['review_text'])}")
+    text = "\n".join(lines)
+    if len(text) > 4000:
+        text = text[:4000] + "…"
+    await message.answer(text, disable_web_page_preview=True,
+                         reply_markup=get_moderation_keyboard(has_prev, has_next))
+
+@router.callback_query(F.data.in_({"moderation_page_next", "moderation_page_prev", "moderation_refresh"}))
+async def moderation_page_callback(callback: types.CallbackQuery, state: FSMContext):
+    """Move through the moderation queue (or reload the current page)."""
+    if not is_admin(callback.message.chat.id, callback.bot):
+        await callback.answer("Доступ запрещен", show_alert=True)
+        return
+    await callback.answer()
+    try:
+        await callback.message.edit_reply_markup(reply_markup=None)
+    except:
+        pass
+    page_ids = (await state.get_data()).get("moderation_page_ids") or []
+    if callback.data == "moderation_page_next" and page_ids:
+        await show_moderation_page(callback.message, state, after_id=max(page_ids))
+    elif callback.data == "moderation_page_prev" and page_ids:
+        await show_moderation_page(callback.message, state, before_id=min(page_ids))
+    else:
+        await show_moderation_page(callback.message, state, after_id=min(page_ids) - 1 if page_ids else None)
+
+@router.callback_query(F.data.in_({"moderation_approve_page", "moderation_reject_page"}))
+async def moderation_decide_page_callback(callback: types.CallbackQuery, state: FSMContext):
+    """Approve or reject every review of the visible page."""
+    if not is_admin(callback.message.chat.id, callback.bot):
+        await callback.answer("Доступ запрещен", show_alert=True)
+        return
+    await callback.answer()
+    try:
+        await callback.message.edit_reply_markup(reply_markup=None)
+    except:
+        pass
+    page_ids = (await state.get_data()).get("moderation_page_ids") or []
+    status = "approved" if callback.data == "moderation_approve_page" else "rejected"
+    await _decide(callback.message, state, page_ids, status)
+
+@router.callback_query(F.data.in_({"moderation_approve_selected", "moderation_reject_selected"}))
+async def moderation_select_callback(callback: types.CallbackQuery, state: FSMContext):
+    """Ask for the numbers of the reviews to approve or reject."""
+    if not is_admin(callback.message.chat.id, callback.bot):
+        await callback.answer("Доступ запрещен", show_alert=True)
+        return
+    await callback.answer()
+    try:
+        await callback.message.edit_reply_markup(reply_markup=None)
+    except:
+        pass
+    action = "согласования" if callback.data == "moderation_approve_selected" else "отклонения"
+    await callback.message.answer(
+        f"Введите номера отзывов для {action} через запятую или диапазоны (например, 1,3,5-7):"
+    )
+    if callback.data == "moderation_approve_selected":
+        await state.set_state(ModerationStates.WaitingForApproveNumbers)
+    else:
+        await state.set_state(ModerationStates.WaitingForRejectNumbers)
+
+@router.message(ModerationStates.WaitingForApproveNumbers)
+async def process_moderation_approve(message: types.Message, state: FSMContext):
+    """Approve the reviews with the entered numbers of the visible page."""
+    if not is_admin(message.chat.id, message.bot):
+        await state.set_state(None)
+        return
+    await _decide_selected(message, state, "approved")
+
+@router.message(ModerationStates.WaitingForRejectNumbers)
+async def process_moderation_reject(message: types.Message, state: FSMContext):
+    """Reject the reviews with the entered numbers of the visible page."""
+    if not is_admin(message.chat.id, message.bot):
+        await state.set_state(None)
+        return
+    await _decide_selected(message, state, "rejected")
+
+async def _decide_selected(message: types.Message, state: FSMContext, status: str):
+    page_ids = (await state.get_data()).get("moderation_page_ids") or []
+    numbers = parse_review_numbers(message.text or "")
+    review_ids = [page_ids[n - 1] for n in sorted(numbers) if 1 <= n <= len(page_ids)]
+    await state.set_state(None)
+    if not review_ids:
+        await message.answer("Не найдено отзывов с такими номерами на текущей странице.")
+        await show_moderation_page(message, state, after_id=min(page_ids) - 1 if page_ids else None)
+        return
+    await _decide(message, state, review_ids, status)
+
+async def _decide(message: types.Message, state: FSMContext, review_ids: list, status: str):
+    """Write the decision to the DB (one statement) and to the sheets (one batch per spreadsheet)."""
+    if not is_admin(message.chat.id, message.bot):
+        return
+    page_ids = (await state.get_data()).get("moderation_page_ids") or []
+    decided = await decide_pending_reviews(review_ids, status)
+    label = "Согласовано" if status == "approved" else "Отклонено"
+    report = f"{label} отзывов: {len(decided)}."
+    if decided:
+        try:
+            written = await asyncio.to_thread(write_review_decisions, [dict(r) for r in decided])
+            if written < len(decided):
+                report += f"\nВ таблице не найдено строк: {len(decided) - written}. Проверьте их вручную."
+        except Exception as e:
+            logger.error(f"Failed to write moderation decisions to the sheet: {e}")
+            report += "\nНе удалось обновить таблицу, статусы сохранены только в базе."
+    await message.answer(report)
+    # Reload from the start of the current page: decided reviews drop out of the queue
+    await show_moderation_page(message, state, after_id=min(page_ids) - 1 if page_ids else None)
@@ -1,6 +1,4 @@
 import re
-import asyncio
-import tempfile
 import html
 
 from aiogram import Router, types, F
@@ -8,17 +6,26 @@ from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, Message, C
 from aiogram.fsm.context import FSMContext
 from aiogram.filters import Command
 from aiogram.fsm.state import StatesGroup, State
-from database import get_platforms_with_new_counts, get_new_reviews, get_platform_id
-from database import update_review_status, update_review_text, update_review_photo
+from database import get_platforms_with_new_counts, get_new_review_ids, get_new_reviews_page, get_platform_id
+from database import enqueue_upload_job, enqueue_pack_upload_job, apply_review_changes
 from database import unauthorize_client
 from database import get_client_stats
-from googleapiclient.http import MediaFileUpload
+from database import find_similar_review
 from datetime import datetime
+from fsm_storage import batched_writes
+from upload_jobs import make_job_key, make_pack_job_key
+from photo_intake import PhotoIntakeAggregator
+from session import ReviewSession, load_session, save_session, is_insert_key
+from utils import parse_review_numbers
 from keyboards import (get_pending_keyboard, get_user_menu_keyboard,
-                       get_no_new_reviews_keyboard)
+                       get_no_new_reviews_keyboard, get_reviews_page_keyboard, get_pack_photos_keyboard,
+                       get_duplicate_review_keyboard)
 
 router = Router()
 
+# Number of reviews shown per page of the review list
+REVIEWS_PAGE_SIZE = 10
+
 class ReviewsStates(StatesGroup):
     WaitingForPlatform = State()
     WaitingForMenuAction = State()
@@ -28,6 +35,7 @@ class ReviewsStates(StatesGroup):
     WaitingForNewReviewText = State()
     WaitingForPlatformAddition = State()
     WaitingForNewReviewTextAddition = State()
+    WaitingForPackPlatform = State()
     WaitingForPlatformPhotos = State()
     WaitingForReviewNumberForPhotos = State()
     WaitingForPhotosForReview = State()
@@ -44,22 +52,20 @@ async def go_to_reviews_callback(callback: CallbackQuery, state: FSMContext):
     # Loading message
     loading = await callback.message.answer("Прогружается список платформ, ожидайте...")
     # Get client_id from state or DB
-    data = await state.get_data()
-    client_id = data.get("client_id")
-    client_number = data.get("client_number")
-    if not client_id:
+    session = await load_session(state)
+    if not session.client_id:
         from database import get_authorized_client_by_chat
         client_rec = await get_authorized_client_by_chat(chat_id)
         if client_rec:
-            client_id = client_rec["id"]
-            client_number = client_rec["number"]
-            await state.update_data(client_id=client_id, client_number=client_number)
-    if not client_id:
+            session.client_id = client_rec["id"]
+            session.client_number = client_rec["number"]
+    if not session.client_id:
         await loading.edit_text("Номер клиента не найден. Используйте /start для повторной авторизации.")
         return
     # Retrieve platforms and new review counts from DB
-    rows = await get_platforms_with_new_counts(client_id)
+    rows = await get_platforms_with_new_counts(session.client_id)
     if not rows:
+        await save_session(state, session)
         await loading.edit_text("Не найдены платформы для данного клиента.")
         return
     # Format message with platform list and count of new reviews
@@ -90,7 +96,8 @@ async def go_to_reviews_callback(callback: CallbackQuery, state: FSMContext):
     platform_kb = InlineKeyboardMarkup(inline_keyboard=keyboard_buttons)
     prompt = await callback.message.answer("Выберите платформу для просмотра новых отзывов или введите её номер вручную:", reply_markup=platform_kb)
     # Save prompt message ID in state (for deletion later) and set state
-    await state.update_data(platforms_list_id=prompt.message_id)
+    session.platforms_list_id = prompt.message_id
+    await save_session(state, session)
     await state.set_state(ReviewsStates.WaitingForPlatform)
 
 @router.message(ReviewsStates.WaitingForPlatform)
@@ -103,7 +110,8 @@ async def process_platform_input(message: Message, state: FSMContext):
         return
     platform_number = int(platform_text)
     # Simulate the same actions as clicking the platform button
-    await show_reviews_for_platform(chat_id, state, platform_number)
+    session = await load_session(state)
+    await show_reviews_for_platform(chat_id, state, session, platform_number)
 
 @router.callback_query(F.data.startswith("platform_"))
 async def process_platform_selection(callback: CallbackQuery, state: FSMContext):
@@ -115,28 +123,30 @@ async def process_platform_selection(callback: CallbackQuery, state: FSMContext)
         pass
     await callback.answer()
     # Remove the platform list message if stored
-    data = await state.get_data()
-    if data.get("platforms_list_id"):
+    session = await load_session(state)
+    if session.platforms_list_id:
         try:
-            await callback.message.bot.delete_message(chat_id, data["platforms_list_id"])
+            await callback.message.bot.delete_message(chat_id, session.platforms_list_id)
         except:
             pass
+        session.platforms_list_id = None
     # Parse platform number from callback data
     platform_key = callback.data.replace("platform_", "")
     if not platform_key.isdigit():
         await callback.message.answer("Некорректный выбор платформы.")
         return
     platform_number = int(platform_key)
-    await show_reviews_for_platform(chat_id, state, platform_number)
+    await show_reviews_for_platform(chat_id, state, session, platform_number)
+
+async def show_reviews_for_platform(chat_id: int, state: FSMContext, session: ReviewSession, platform_number: int,
+                                    after_id: int = None, before_id: int = None):
+    """Display one page of new reviews for the specified platform and save the session.
 
-async def show_reviews_for_platform(chat_id: int, state: FSMContext, platform_number: int):
-    """Display the list of new reviews for the specified platform."""
+    Only the visible page is loaded from the DB; the session keeps its review IDs, so selection numbers refer to this page."""
     # Show a loading message
     wait_msg = await state.bot.send_message(chat_id, "Прогружается список отзывов, ожидайте...")
-    data = await state.get_data()
-    client_id = data.get("client_id")
-    client_number = data.get("client_number")
-    if not client_id or client_number is None:
+    client_id = session.client_id
+    if not client_id or session.client_number is None:
         await wait_msg.edit_text("Ошибка: не удалось определить вашего клиента.")
         return
     # Get platform_id from DB
@@ -144,36 +154,45 @@ async def show_reviews_for_platform(chat_id: int, state: FSMContext, platform_nu
     if not platform_id:
         await wait_msg.edit_text("Платформа не найдена.")
         return
-    # Fetch new reviews for this platform
-    rows = await get_new_reviews(client_id, platform_id)
-    current_reviews = []
-    for r in rows:
-        current_reviews.append({"id": r["id"], "review_text": r["review_text"]})
-    # Include any pending inserted reviews not yet saved (with 🆕 marker)
-    pending_changes = (await state.get_data()).get("pending_changes", [])
-    for change in pending_changes:
-        if change.get("action") == "insert":
-            # Ensure we don't duplicate if the same text already in current_reviews
-            if not any(item.get("pure_text", item["review_text"]) == change.get("review_text") for item in current_reviews):
-                display_text = change.get("review_text") + " 🆕"
-                current_reviews.append({
-                    "id": None,
-                    "review_text": display_text,
-                    "pure_text": change.get("review_text")
-                })
-    # Update FSM data for the current platform and reviews
-    await state.update_data(platform_number=platform_number, current_reviews=current_reviews)
+    # Fetch one page of new reviews for this platform
+    rows, has_prev, has_next = await get_new_reviews_page(
+        client_id, platform_id, after_id=after_id, before_id=before_id, limit=REVIEWS_PAGE_SIZE
+    )
+    page_keys = [r["id"] for r in rows]
+    page_texts = [r["review_text"] for r in rows]
+    # Include any pending inserted reviews not yet saved (with 🆕 marker) on the last page
+    if not has_next:
+        shown = set(page_texts)
+        for key, insert in session.pending_inserts().items():
+            if insert["platform_number"] == platform_number and insert["text"] not in shown:
+                page_keys.append(key)
+                page_texts.append(insert["text"] + " 🆕")
+    # Update the session for the current platform and visible page
+    session.platform_number = platform_number
+    session.page_keys = page_keys
+    session.page_first_id = rows[0]["id"] if rows else None
+    session.page_last_id = rows[-1]["id"] if rows else None
     # If no new reviews to show
-    if not current_reviews:
-        await state.clear()  # clear state as no pending actions
+    if not page_keys:
+        if after_id is not None or before_id is not None:
+            # The page emptied out while paging (its reviews were decided elsewhere): start from the first page
+            await wait_msg.delete()
+            await show_reviews_for_platform(chat_id, state, session, platform_number)
+            return
+        if session.pending:
+            # Keep the unsent changes of other platforms/pages
+            await save_session(state, session)
+        else:
+            await state.clear()  # clear state as no pending actions
         await wait_msg.delete()
         await state.bot.send_message(chat_id, "Новых отзывов пока что нет, но вы можете добавить их самостоятельно", reply_markup=get_no_new_reviews_keyboard())
         return
-    # Build the message listing all reviews
+    await save_session(state, session)
+    # Build the message listing the reviews of this page
     review_lines = []
-    for i, rev in enumerate(current_reviews, start=1):
+    for i, text in enumerate(page_texts, start=1):
         # Escape HTML in review text
-        text_safe = html.escape(rev["review_text"])
+        text_safe = html.escape(text)
         review_lines.append(f"💬 {i}. {text_safe}")
     full_msg = "<b>Список отзывов для редактирования:</b>\n" + "\n".join(review_lines)
     # Delete the loading message
@@ -181,15 +200,37 @@ async def show_reviews_for_platform(chat_id: int, state: FSMContext, platform_nu
         await wait_msg.delete()
     except:
         pass
-    # Send the review list (split into multiple messages if too long)
+    # Send the review list (a page may still exceed the message limit with very long reviews)
     parts = re.findall(r".{1,4000}(?:\s+|$)", full_msg, flags=re.DOTALL)
-    for part in parts:
-        await state.bot.send_message(chat_id, part, parse_mode="HTML", disable_web_page_preview=True)
+    page_kb = get_reviews_page_keyboard(has_prev, has_next)
+    for i, part in enumerate(parts):
+        markup = page_kb if i == len(parts) - 1 else None
+        await state.bot.send_message(chat_id, part, parse_mode="HTML", disable_web_page_preview=True,
+                                     reply_markup=markup)
     # Show action menu (approve/reject/edit/add)
-    kb = await get_pending_keyboard(state)
+    kb = get_pending_keyboard(bool(session.pending))
     await state.bot.send_message(chat_id, "Выберите дальнейшее действие:", reply_markup=kb)
     await state.set_state(ReviewsStates.WaitingForMenuAction)
 
+@router.callback_query(F.data.in_({"reviews_page_next", "reviews_page_prev"}))
+async def reviews_page_callback(callback: CallbackQuery, state: FSMContext):
+    """Move to the next or previous page of the review list."""
+    await callback.answer()
+    try:
+        await callback.message.edit_reply_markup(reply_markup=None)
+    except:
+        pass
+    session = await load_session(state)
+    if not session.platform_number:
+        await callback.message.answer("Не удалось определить платформу.")
+        return
+    if callback.data == "reviews_page_next":
+        await show_reviews_for_platform(callback.message.chat.id, state, session, session.platform_number,
+                                        after_id=session.page_last_id)
+    else:
+        await show_reviews_for_platform(callback.message.chat.id, state, session, session.platform_number,
+                                        before_id=session.page_first_id)
+
 @router.callback_query(F.data == "back_to_main_menu")
 async def back_to_main_menu_callback(callback: CallbackQuery, state: FSMContext):
     """Handle the 'В главное меню' action to return to main menu."""
@@ -199,9 +240,9 @@ async def back_to_main_menu_callback(callback: CallbackQuery, state: FSMContext)
     except:
         pass
     # Show main menu (client info and user menu keyboard)
-    data = await state.get_data()
-    client_id = data.get("client_id")
-    client_number = data.get("client_number")
+    session = await load_session(state)
+    client_id = session.client_id
+    client_number = session.client_number
     if client_id and client_number is not None:
         from database import get_client_stats
         stats = await get_client_stats(client_id)
@@ -227,8 +268,8 @@ async def add_review_callback(callback: CallbackQuery, state: FSMContext):
     except:
         pass
     # If platform already selected earlier in state, use it; else ask for platform number
-    data = await state.get_data()
-    if data.get("platform_number"):
+    session = await load_session(state)
+    if session.platform_number:
         await callback.message.answer("Введите текст вашего отзыва:")
         await state.set_state(ReviewsStates.WaitingForNewReviewTextAddition)
     else:
@@ -255,89 +296,99 @@ async def process_new_review_text_addition(message: Message, state: FSMContext):
     if review_text == "":
         await message.answer("Текст отзыва не может быть пустым. Попробуйте снова.")
         return
-    data = await state.get_data()
-    platform_number = data.get("platform_number")
-    # Prepare a new row representation (similar to sheet) but we'll store as pending change
-    # Use current timestamp for date
-    now_str = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    # Mark as pending insert
-    pending_change = {
-        "action": "insert",
-        "new_review": {
-            "platform_number": platform_number,
-            "date": now_str,
-            "review_text": review_text
-        },
-        "review_text": review_text,
-        "client_action": "добавлен (New)"
-    }
-    # Add to pending_changes in FSM
-    data_pending = await state.get_data()
-    changes = data_pending.get("pending_changes", [])
-    changes.append(pending_change)
-    await state.update_data(pending_changes=changes)
+    session = await load_session(state)
+    # Warn before adding a review that repeats an existing one of the platform
+    platform_id = await get_platform_id(session.client_id, session.platform_number)
+    similar = await find_similar_review(platform_id, review_text) if platform_id else None
+    if similar:
+        session.duplicate_text = review_text
+        await save_session(state, session)
+        await message.answer(
+            "Похожий отзыв уже есть на этой платформе:\n"
+            f"<i>{html.escape(similar['review_text'])}</i>\n"
+            f"Совпадение: {round(similar['similarity'] * 100)}%. Добавить ваш отзыв всё равно?",
+            parse_mode="HTML", reply_markup=get_duplicate_review_keyboard()
+        )
+        return
+    _add_review(session, review_text)
+    await save_session(state, session)
     # Notify user that the review is marked for addition
-    kb = await get_pending_keyboard(state)
+    kb = get_pending_keyboard(True)
     await message.answer("Ваш отзыв помечен для добавления.", reply_markup=kb)
 
-@router.callback_query(F.data == "approve_all")
-async def approve_all_callback(callback: CallbackQuery, state: FSMContext):
-    """Mark all listed new reviews as approved (pending changes)."""
+def _add_review(session: ReviewSession, review_text: str):
+    """Mark a review for addition to the selected platform, dated now."""
+    now_str = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    session.add_insert(session.platform_number, now_str, review_text)
+
+@router.callback_query(F.data.in_({"confirm_duplicate_review", "cancel_duplicate_review"}))
+async def duplicate_review_callback(callback: CallbackQuery, state: FSMContext):
+    """Add the review that looked like a duplicate anyway, or drop it."""
     await callback.answer()
     try:
         await callback.message.edit_reply_markup(reply_markup=None)
     except:
         pass
-    data = await state.get_data()
-    current_reviews = data.get("current_reviews", [])
-    platform_number = data.get("platform_number")
-    if not platform_number:
-        await callback.message.answer("Не удалось определить платформу.")
+    session = await load_session(state)
+    if not session.duplicate_text:
         return
-    # Add pending changes for each review to mark status approved
-    changes = data.get("pending_changes", [])
-    for rev in current_reviews:
-        if rev.get("id") is not None:
-            changes.append({
-                "action": "update",
-                "review_id": rev["id"],
-                "field": "status",
-                "value": "🟢",
-                "review_text": rev.get("pure_text", rev["review_text"]),
-                "client_action": "согласован"
-            })
-    await state.update_data(pending_changes=changes)
-    kb = await get_pending_keyboard(state)
-    await callback.message.answer("Все отзывы помечены как согласованные.", reply_markup=kb)
+    if callback.data == "confirm_duplicate_review":
+        _add_review(session, session.duplicate_text)
+        text = "Ваш отзыв помечен для добавления."
+    else:
+        text = "Отзыв не добавлен."
+    session.duplicate_text = None
+    await save_session(state, session)
+    await callback.message.answer(text, reply_markup=get_pending_keyboard(bool(session.pending)))
 
-@router.callback_query(F.data == "reject_all")
-async def reject_all_callback(callback: CallbackQuery, state: FSMContext):
-    """Mark all listed new reviews as rejected (pending changes)."""
+async def _mark_all_reviews(callback: CallbackQuery, state: FSMContext, new_status: str, done_text: str):
+    """Mark every new review of the selected platform with the given status (pending changes)."""
     await callback.answer()
     try:
         await callback.message.edit_reply_markup(reply_markup=None)
     except:
         pass
-    data = await state.get_data()
-    current_reviews = data.get("current_reviews", [])
-    platform_number = data.get("platform_number")
-    if not platform_number:
+    session = await load_session(state)
+    if not session.platform_number:
         await callback.message.answer("Не удалось определить платформу.")
         return
-    changes = data.get("pending_changes", [])
-    for rev in current_reviews:
-        if rev.get("id") is not None:
-            changes.append({
-                "action": "update",
-                "review_id": rev["id"],
-                "field": "status",
-                "value": "🚫",
-                "review_text": rev.get("pure_text", rev["review_text"]),
-                "client_action": "отклонен"
-            })
-    await state.update_data(pending_changes=changes)
-    kb = await get_pending_keyboard(state)
-    await callback.message.answer("Все отзывы помечены как отклонённые.", reply_markup=kb)
+    # The action covers every new review of the platform, not only the visible page
+    platform_id = await get_platform_id(session.client_id, session.platform_number)
+    review_ids = await get_new_review_ids(session.client_id, platform_id) if platform_id else []
+    for review_id in review_ids:
+        session.set_status(review_id, new_status)
+    await save_session(state, session)
+    kb = get_pending_keyboard(bool(session.pending))
+    await callback.message.answer(done_text, reply_markup=kb)
+
+@router.callback_query(F.data == "approve_all")
+async def approve_all_callback(callback: CallbackQuery, state: FSMContext):
+    """Mark all new reviews of the platform as approved (pending changes)."""
+    await _mark_all_reviews(callback, state, "approved", "Все отзывы помечены как согласованные.")
+
+@router.callback_query(F.data == "reject_all")
+async def reject_all_callback(callback: CallbackQuery, state: FSMContext):
+    """Mark all new reviews of the platform as rejected (pending changes)."""
+    await _mark_all_reviews(callback, state, "rejected", "Все отзывы помечены как отклонённые.")
+
+async def _mark_selected_reviews(message: Message, state: FSMContext, new_status: str, done_text: str):
+    """Mark the reviews with the entered numbers (on the visible page) with the given status."""
+    chat_id = message.chat.id
+    session = await load_session(state)
+    if session.prompt_id:
+        try:
+            await message.bot.delete_message(chat_id, session.prompt_id)
+        except:
+            pass
+        session.prompt_id = None
+    for n in sorted(parse_review_numbers(message.text or "")):
+        key = session.key_for_number(n)
+        if key is not None and not is_insert_key(key):
+            session.set_status(key, new_status)
+    await save_session(state, session)
+    kb = get_pending_keyboard(bool(session.pending))
+    await message.answer(done_text, reply_markup=kb)
+    await state.set_state(ReviewsStates.WaitingForMenuAction)
 
 @router.callback_query(F.data == "approve_selected")
 async def approve_selected_callback(callback: CallbackQuery, state: FSMContext):
@@ -350,51 +401,13 @@ async def approve_selected_callback(callback: CallbackQuery, state: FSMContext):
     prompt = await callback.message.answer(
         "Введите номера отзывов для согласования через запятую или диапазоны (например, 1,3,5-7):"
     )
-    await state.update_data(approve_prompt_id=prompt.message_id)
+    await state.update_data(prompt_id=prompt.message_id)
     await state.set_state(ReviewsStates.ApproveSelected)
 
 @router.message(ReviewsStates.ApproveSelected)
 async def process_approve_selected(message: Message, state: FSMContext):
     """Approve specific reviews by their numbers."""
-    chat_id = message.chat.id
-    data = await state.get_data()
-    if data.get("approve_prompt_id"):
-        try:
-            await message.bot.delete_message(chat_id, data["approve_prompt_id"])
-        except:
-            pass
-    text = message.text or ""
-    # Parse input like "1,3,5-7"
-    nums = set()
-    for part in re.split(r"[,\s]+", text.strip()):
-        if '-' in part:
-            try:
-                start, end = part.split('-')
-                for n in range(int(start), int(end)+1):
-                    nums.add(n)
-            except:
-                pass
-        elif part.isdigit():
-            nums.add(int(part))
-    current_reviews = data.get("current_reviews", [])
-    changes = data.get("pending_changes", [])
-    for n in sorted(nums):
-        idx = n - 1
-        if 0 <= idx < len(current_reviews):
-            rev = current_reviews[idx]
-            if rev.get("id") is not None:
-                changes.append({
-                    "action": "update",
-                    "review_id": rev["id"],
-                    "field": "status",
-                    "value": "🟢",
-                    "review_text": rev.get("pure_text", rev["review_text"]),
-                    "client_action": "согласован"
-                })
-    await state.update_data(pending_changes=changes)
-    kb = await get_pending_keyboard(state)
-    await message.answer("Выбранные отзывы помечены как согласованные.", reply_markup=kb)
-    await state.set_state(ReviewsStates.WaitingForMenuAction)
+    await _mark_selected_reviews(message, state, "approved", "Выбранные отзывы помечены как согласованные.")
 
 @router.callback_query(F.data == "reject_selected")
 async def reject_selected_callback(callback: CallbackQuery, state: FSMContext):
@@ -407,50 +420,13 @@ async def reject_selected_callback(callback: CallbackQuery, state: FSMContext):
     prompt = await callback.message.answer(
         "Введите номера отзывов для отклонения через запятую или диапазоны (например, 1,3,5-7):"
     )
-    await state.update_data(reject_prompt_id=prompt.message_id)
+    await state.update_data(prompt_id=prompt.message_id)
     await state.set_state(ReviewsStates.RejectSelected)
 
 @router.message(ReviewsStates.RejectSelected)
 async def process_reject_selected(message: Message, state: FSMContext):
     """Reject specific reviews by their numbers."""
-    chat_id = message.chat.id
-    data = await state.get_data()
-    if data.get("reject_prompt_id"):
-        try:
-            await message.bot.delete_message(chat_id, data["reject_prompt_id"])
-        except:
-            pass
-    text = message.text or ""
-    nums = set()
-    for part in re.split(r"[,\s]+", text.strip()):
-        if '-' in part:
-            try:
-                start, end = part.split('-')
-                for n in range(int(start), int(end)+1):
-                    nums.add(n)
-            except:
-                pass
-        elif part.isdigit():
-            nums.add(int(part))
-    current_reviews = data.get("current_reviews", [])
-    changes = data.get("pending_changes", [])
-    for n in sorted(nums):
-        idx = n - 1
-        if 0 <= idx < len(current_reviews):
-            rev = current_reviews[idx]
-            if rev.get("id") is not None:
-                changes.append({
-                    "action": "update",
-                    "review_id": rev["id"],
-                    "field": "status",
-                    "value": "🚫",
-                    "review_text": rev.get("pure_text", rev["review_text"]),
-                    "client_action": "отклонен"
-                })
-    await state.update_data(pending_changes=changes)
-    kb = await get_pending_keyboard(state)
-    await message.answer("Выбранные отзывы помечены как отклонённые.", reply_markup=kb)
-    await state.set_state(ReviewsStates.WaitingForMenuAction)
+    await _mark_selected_reviews(message, state, "rejected", "Выбранные отзывы помечены как отклонённые.")
 
 @router.callback_query(F.data == "edit_reviews")
 async def edit_reviews_callback(callback: CallbackQuery, state: FSMContext):
@@ -461,62 +437,52 @@ async def edit_reviews_callback(callback: CallbackQuery, state: FSMContext):
     except:
         pass
     prompt = await callback.message.answer("Введите номер отзыва, который вы хотите отредактировать:")
-    await state.update_data(edit_prompt_id=prompt.message_id)
+    await state.update_data(prompt_id=prompt.message_id)
     await state.set_state(ReviewsStates.WaitingForReviewNumber)
 
 @router.message(ReviewsStates.WaitingForReviewNumber)
 async def process_review_number(message: Message, state: FSMContext):
     """Process the review number to edit and prompt for new text."""
-    data = await state.get_data()
+    session = await load_session(state)
     chat_id = message.chat.id
     # Remove the edit prompt message if it exists
-    if data.get("edit_prompt_id"):
+    if session.prompt_id:
         try:
-            await message.bot.delete_message(chat_id, data["edit_prompt_id"])
+            await message.bot.delete_message(chat_id, session.prompt_id)
         except:
             pass
+        session.prompt_id = None
     if not message.text or not message.text.strip().isdigit():
+        await save_session(state, session)
         await message.answer("Пожалуйста, введите корректный номер отзыва (целое число).")
         return
     review_number = int(message.text.strip())
-    current_reviews = data.get("current_reviews", [])
-    if review_number < 1 or review_number > len(current_reviews):
+    key = session.key_for_number(review_number)
+    if key is None:
+        await save_session(state, session)
         await message.answer(f"Отзыв №{review_number} не существует или уже согласован/удалён.")
         return
-    # Store index and prompt for new text
-    await state.update_data(edit_review_index=review_number - 1)
+    # Store the selected review and prompt for new text
+    session.target_key = key
+    await save_session(state, session)
     await message.answer("Введите новый текст отзыва:")
     await state.set_state(ReviewsStates.WaitingForNewReviewText)
 
 @router.message(ReviewsStates.WaitingForNewReviewText)
 async def process_new_review_text(message: Message, state: FSMContext):
     """Receive the new text for the selected review and mark for update."""
-    data = await state.get_data()
-    idx = data.get("edit_review_index")
+    session = await load_session(state)
+    key = session.target_key
     new_text = message.text.strip() if message.text else ""
-    if idx is None or new_text == "":
+    if key is None or new_text == "":
         await message.answer("Ошибка при редактировании. Попробуйте снова.")
         await state.clear()
         return
-    current_reviews = data.get("current_reviews", [])
-    if not (0 <= idx < len(current_reviews)):
-        await message.answer("Отзыв для редактирования не найден.")
-        await state.clear()
-        return
-    rev = current_reviews[idx]
-    # Add pending change to update review text
-    changes = data.get("pending_changes", [])
-    if rev.get("id") is not None:
-        changes.append({
-            "action": "update",
-            "review_id": rev["id"],
-            "field": "text",
-            "value": new_text,
-            "review_text": new_text,
-            "client_action": "обновлён"
-        })
-    await state.update_data(pending_changes=changes)
-    kb = await get_pending_keyboard(state)
+    # Record the new text (for a review to be added, its text is replaced)
+    session.set_text(key, new_text)
+    session.target_key = None
+    await save_session(state, session)
+    kb = get_pending_keyboard(bool(session.pending))
     await message.answer("Отзыв изменён и помечен для обновления.", reply_markup=kb)
     await state.set_state(ReviewsStates.WaitingForMenuAction)
 
@@ -529,28 +495,34 @@ async def add_photos_callback(callback: CallbackQuery, state: FSMContext):
     except:
         pass
     prompt = await callback.message.answer("Введите номер отзыва, к которому хотите добавить фотографии:")
-    await state.update_data(review_number_prompt=prompt.message_id)
+    await state.update_data(prompt_id=prompt.message_id)
     await state.set_state(ReviewsStates.WaitingForReviewNumberForPhotos)
 
 @router.message(ReviewsStates.WaitingForReviewNumberForPhotos)
 async def process_review_number_for_photos(message: Message, state: FSMContext):
     """Handle the review number selection for photo attachment."""
-    data = await state.get_data()
+    session = await load_session(state)
     chat_id = message.chat.id
-    if data.get("review_number_prompt"):
+    if session.prompt_id:
         try:
-            await message.bot.delete_message(chat_id, data["review_number_prompt"])
+            await message.bot.delete_message(chat_id, session.prompt_id)
         except:
             pass
+        session.prompt_id = None
     if not message.text or not message.text.strip().isdigit():
+        await save_session(state, session)
         await message.answer("Пожалуйста, введите корректный номер отзыва (целое число).")
         return
     review_number = int(message.text.strip())
-    current_reviews = data.get("current_reviews", [])
-    if review_number < 1 or review_number > len(current_reviews):
+    key = session.key_for_number(review_number)
+    if key is None:
+        await save_session(state, session)
         await message.answer(f"Отзыв №{review_number} не найден или уже обработан.")
         return
-    await state.update_data(review_index=review_number - 1, photo_ids=[])
+    session.target_key = key
+    session.photo_ids = []
+    session.photo_unique_ids = []
+    await save_session(state, session)
     # Prompt user to send photos
     done_kb = InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="Готово", callback_data="done_adding_review_photos")],
@@ -562,38 +534,44 @@ async def process_review_number_for_photos(message: Message, state: FSMContext):
     )
     await state.set_state(ReviewsStates.WaitingForPhotosForReview)
 
+async def _on_photos_flushed(chat_id: int, items: list, context):
+    """Store a batch of received photos in the session and acknowledge it with a single message."""
+    message, state = context
+    async with batched_writes(state.storage):
+        current_state = await state.get_state()
+        if current_state not in (ReviewsStates.WaitingForPhotosForReview.state,
+                                 ReviewsStates.WaitingForPlatformPhotos.state):
+            return
+        session = await load_session(state)
+        added = session.add_photos(items)
+        total = len(session.photo_ids)
+        await save_session(state, session)
+    if not added:
+        return
+    if current_state == ReviewsStates.WaitingForPlatformPhotos.state:
+        await message.answer(
+            f"Получено фото: {added} (всего в паке: {total}). Присылайте ещё или нажмите «Готово».",
+            reply_markup=get_pack_photos_keyboard()
+        )
+        return
+    done_kb = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="Готово", callback_data="done_adding_review_photos")],
+        [InlineKeyboardButton(text="Отмена", callback_data="continue_editing")]
+    ])
+    await message.answer(
+        f"Получено фото: {added}. Если хотите добавить ещё фото — присылайте. Когда закончите, нажмите «Готово».",
+        reply_markup=done_kb
+    )
+
+# Photos are buffered per chat and album and written to the session once per batch
+photo_intake = PhotoIntakeAggregator(_on_photos_flushed)
+
 @router.message(ReviewsStates.WaitingForPhotosForReview, F.photo)
 async def accumulate_review_photos(message: Message, state: FSMContext):
     """Collect photos sent for attaching to a review."""
-    data = await state.get_data()
-    photo_ids = data.get("photo_ids", [])
     # Take the highest resolution photo
-    file_id = message.photo[-1].file_id
-    photo_ids.append(file_id)
-    await state.update_data(photo_ids=photo_ids)
-    # Notify user that photo is received (schedule a message after 1 sec)
-    scheduled_task = data.get("scheduled_review_photo_notification")
-    if scheduled_task:
-        scheduled_task.cancel()
-    async def send_notification():
-        try:
-            await asyncio.sleep(1)
-        except asyncio.CancelledError:
-            return
-        done_kb = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="Готово", callback_data="done_adding_review_photos")],
-            [InlineKeyboardButton(text="Отмена", callback_data="continue_editing")]
-        ])
-        sent_msg = await message.answer(
-            "Фото получено. Если хотите добавить ещё фото — присылайте. Когда закончите, нажмите «Готово».",
-            reply_markup=done_kb
-        )
-        await state.update_data(last_review_done_msg_id=sent_msg.message_id)
-        data2 = await state.get_data()
-        data2.pop("scheduled_review_photo_notification", None)
-        await state.set_data(data2)
-    task = asyncio.create_task(send_notification())
-    await state.update_data(scheduled_review_photo_notification=task)
+    photo = message.photo[-1]
+    photo_intake.add(message.chat.id, message.media_group_id, photo.file_id, photo.file_unique_id, (message, state))
 
 @router.message(ReviewsStates.WaitingForPhotosForReview, F.document)
 async def accumulate_review_photos_document(message: Message, state: FSMContext):
@@ -602,138 +580,46 @@ async def accumulate_review_photos_document(message: Message, state: FSMContext)
     if not doc.mime_type or not doc.mime_type.startswith("image/"):
         await message.answer("Ошибка: загруженный файл не является изображением. Пожалуйста, отправьте изображение.")
         return
-    data = await state.get_data()
-    photo_ids = data.get("photo_ids", [])
-    photo_ids.append(doc.file_id)
-    await state.update_data(photo_ids=photo_ids)
-    # Use the same notification logic as for photo
-    scheduled_task = data.get("scheduled_review_photo_notification")
-    if scheduled_task:
-        scheduled_task.cancel()
-    async def send_notification():
-        try:
-            await asyncio.sleep(1)
-        except asyncio.CancelledError:
-            return
-        done_kb = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="Готово", callback_data="done_adding_review_photos")],
-            [InlineKeyboardButton(text="Отмена", callback_data="continue_editing")]
-        ])
-        sent_msg = await message.answer(
-            "Фото получено. Если хотите добавить ещё фото — присылайте. Когда закончите, нажмите «Готово».",
-            reply_markup=done_kb
-        )
-        await state.update_data(last_review_done_msg_id=sent_msg.message_id)
-        data2 = await state.get_data()
-        data2.pop("scheduled_review_photo_notification", None)
-        await state.set_data(data2)
-    task = asyncio.create_task(send_notification())
-    await state.update_data(scheduled_review_photo_notification=task)
+    photo_intake.add(message.chat.id, message.media_group_id, doc.file_id, doc.file_unique_id, (message, state))
 
 @router.callback_query(F.data == "done_adding_review_photos")
 async def finish_adding_review_photos(callback: CallbackQuery, state: FSMContext):
-    """Finalize adding photos to a review: upload to Drive and mark pending update."""
+    """Finalize adding photos to a review: queue the Drive upload and mark pending update."""
     await callback.answer()
-    data = await state.get_data()
+    session = await load_session(state)
     chat_id = callback.message.chat.id
     # Clear intermediate messages
     try:
         await callback.message.edit_reply_markup(reply_markup=None)
     except:
         pass
+    # Take over photos that are still buffered (not yet acknowledged)
+    session.add_photos(photo_intake.drain(chat_id))
     # If no photos were sent
-    photo_ids = data.get("photo_ids", [])
+    photo_ids = session.photo_ids
     if not photo_ids:
         await callback.message.answer("Вы не отправили ни одной фотографии.")
         # Return to menu without clearing pending changes
         await state.set_state(ReviewsStates.WaitingForMenuAction)
         return
-    init_msg = await callback.message.answer("Фотографии инициализируются, ожидайте...")
-    current_reviews = data.get("current_reviews", [])
-    review_index = data.get("review_index")
-    if review_index is None or review_index < 0 or review_index >= len(current_reviews):
-        await init_msg.edit_text("Неверный номер отзыва или отзыв уже не доступен.")
+    review_id = session.target_key
+    if review_id is None:
+        await callback.message.answer("Неверный номер отзыва или отзыв уже не доступен.")
         return
-    rev = current_reviews[review_index]
-    review_id = None
-    if rev.get("id") is not None:
-        review_id = rev["id"]
-    else:
-        await init_msg.edit_text("Ошибка: отзыв для добавления фото не найден.")
-        return
-    # Check if a Drive folder already exists for this review (by checking existing photo_link in DB)
-    from database import pool
-    folder_id = None
-    folder_link = None
-    async with pool.acquire() as conn:
-        result = await conn.fetchrow("SELECT photo_link FROM reviews WHERE id=$1;", review_id)
-        if result:
-            existing_link = result["photo_link"]
-            if existing_link and "drive.google.com" in existing_link:
-                # Extract folder ID from link
-                parts = existing_link.split("/")
-                folder_id = parts[-1] if parts else None
-                folder_link = existing_link
-    # Initialize Google Drive service
-    from google_sheets import drive_service
-    if not folder_id:
-        # Create a new folder on Google Drive for this review
-        folder_metadata = {
-            "name": f"review_{review_index+1}_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
-            "mimeType": "application/vnd.google-apps.folder",
-            "parents": [callback.bot['drive_folder_id']]
-        }
-        try:
-            folder = drive_service.files().create(body=folder_metadata, fields="id").execute()
-            folder_id = folder.get("id")
-            drive_service.permissions().create(fileId=folder_id, body={"role": "reader", "type": "anyone"}).execute()
-            folder_link = f"https://drive.google.com/drive/folders/{folder_id}"
-        except Exception as e:
-            await init_msg.edit_text(f"Ошибка при создании папки на Google Диске: {str(e)}")
-            return
-    # Upload each photo to the Drive folder
-    error_messages = []
-    for idx, file_id in enumerate(photo_ids, start=1):
-        try:
-            file_info = await callback.message.bot.get_file(file_id)
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as tmp_file:
-                tmp_name = tmp_file.name
-                await callback.message.bot.download_file(file_info.file_path, tmp_name)
-            file_name = f"photo_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jpg"
-            file_metadata = {"name": file_name, "mimeType": "image/jpeg", "parents": [folder_id]}
-            media = MediaFileUpload(tmp_name, mimetype="image/jpeg")
-            drive_service.files().create(body=file_metadata, media_body=media, fields="id").execute()
-            # Remove temp file
-            import os as _os
-            if _os.path.exists(tmp_name):
-                _os.remove(tmp_name)
-        except Exception as e:
-            error_messages.append(
-                f"Ошибка при загрузке фото №{idx} (ID: {file_id}). Техническая информация: {str(e)}"
-            )
-    # Add pending change to mark the review as approved with photo link
-    changes = data.get("pending_changes", [])
-    changes.append({
-        "action": "update_multiple",
-        "review_id": review_id,
-        "updates": { "status": "🟢", "photo_link": folder_link },
-        "review_text": rev.get("pure_text", rev["review_text"]),
-        "client_action": "Фото добавлено"
-    })
-    await state.update_data(pending_changes=changes, photo_ids=[])
-    # Delete init message
-    try:
-        await init_msg.delete()
-    except:
-        pass
-    # Notify result
-    if error_messages:
-        full_error = "\n\n".join(error_messages)
-        await callback.message.answer(f"Не все фотографии были успешно загружены:\n{full_error}")
-    else:
-        await callback.message.answer("Фотографии успешно добавлены к отзыву.")
+    if is_insert_key(review_id):
+        await callback.message.answer("Ошибка: отзыв для добавления фото не найден.")
+        return
+    # Queue the upload; a background worker creates the folder, uploads the photos and reports back
+    job_key = make_job_key(review_id, session.photo_unique_ids)
+    await enqueue_upload_job(job_key, chat_id, review_id, photo_ids)
+    # Add pending change to mark the review as approved; the folder link is taken from the job
+    session.set_photos(review_id, job_key)
+    session.photo_ids = []
+    session.photo_unique_ids = []
+    await save_session(state, session)
+    await callback.message.answer("Фотографии приняты и загружаются. Мы сообщим, когда загрузка завершится.")
     # Show pending actions keyboard (now user can send report to save)
-    kb = await get_pending_keyboard(state)
+    kb = get_pending_keyboard(True)
     await callback.message.answer("Что дальше?", reply_markup=kb)
     await state.set_state(ReviewsStates.WaitingForMenuAction)
 
@@ -745,9 +631,164 @@ async def continue_editing_callback(callback: CallbackQuery, state: FSMContext):
         await callback.message.edit_reply_markup(reply_markup=None)
     except:
         pass
+    # Discard photos that are still buffered for this chat
+    photo_intake.drain(callback.message.chat.id)
     # Simply return to waiting for menu action state (pending changes remain)
     await state.set_state(ReviewsStates.WaitingForMenuAction)
 
+@router.callback_query(F.data == "add_platform_photos")
+async def add_platform_photos_callback(callback: CallbackQuery, state: FSMContext):
+    """Start collecting a photo pack for one of the client's platforms."""
+    await callback.answer()
+    try:
+        await callback.message.edit_reply_markup(reply_markup=None)
+    except:
+        pass
+    session = await load_session(state)
+    if not session.client_id:
+        from database import get_authorized_client_by_chat
+        client_rec = await get_authorized_client_by_chat(callback.message.chat.id)
+        if client_rec:
+            session.client_id = client_rec["id"]
+            session.client_number = client_rec["number"]
+    if not session.client_id:
+        await callback.message.answer("Номер клиента не найден. Используйте /start для повторной авторизации.")
+        return
+    rows = await get_platforms_with_new_counts(session.client_id)
+    if not rows:
+        await save_session(state, session)
+        await callback.message.answer("Не найдены платформы для данного клиента.")
+        return
+    buttons = [InlineKeyboardButton(text=f"Платформа {row['number']}", callback_data=f"pack_platform_{row['number']}")
+               for row in rows]
+    keyboard_buttons = [buttons[i:i+2] for i in range(0, len(buttons), 2)]
+    keyboard_buttons.append([InlineKeyboardButton(text="В главное меню", callback_data="back_to_main_menu")])
+    prompt = await callback.message.answer(
+        "Выберите платформу, для которой хотите загрузить фото, или введите её номер вручную:",
+        reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard_buttons)
+    )
+    session.platforms_list_id = prompt.message_id
+    await save_session(state, session)
+    await state.set_state(ReviewsStates.WaitingForPackPlatform)
+
+async def _start_pack_collection(message: Message, state: FSMContext, platform_number: int):
+    """Select the platform of the photo pack and ask for the photos."""
+    session = await load_session(state)
+    if session.platforms_list_id:
+        try:
+            await message.bot.delete_message(message.chat.id, session.platforms_list_id)
+        except:
+            pass
+        session.platforms_list_id = None
+    platform_id = await get_platform_id(session.client_id, platform_number)
+    if not platform_id:
+        await save_session(state, session)
+        await message.answer(f"Платформа {platform_number} не найдена. Введите другой номер.")
+        return
+    session.pack_platform_id = platform_id
+    session.photo_ids = []
+    session.photo_unique_ids = []
+    await save_session(state, session)
+    await message.answer(
+        f"Пришлите фото для платформы {platform_number} (по одной или альбомами, можно сразу много). "
+        "Когда закончите, нажмите «Готово».",
+        reply_markup=get_pack_photos_keyboard()
+    )
+    await state.set_state(ReviewsStates.WaitingForPlatformPhotos)
+
+@router.callback_query(F.data.startswith("pack_platform_"))
+async def process_pack_platform_selection(callback: CallbackQuery, state: FSMContext):
+    """User selected the platform of the photo pack from the list."""
+    await callback.answer()
+    try:
+        await callback.message.edit_reply_markup(reply_markup=None)
+    except:
+        pass
+    platform_key = callback.data.replace("pack_platform_", "")
+    if not platform_key.isdigit():
+        await callback.message.answer("Некорректный выбор платформы.")
+        return
+    await _start_pack_collection(callback.message, state, int(platform_key))
+
+@router.message(ReviewsStates.WaitingForPackPlatform)
+async def process_pack_platform_input(message: Message, state: FSMContext):
+    """Allow user to type the platform number of the photo pack."""
+    platform_text = message.text.strip() if message.text else ""
+    if not platform_text.isdigit():
+        await message.answer("Пожалуйста, введите номер платформы (числом).")
+        return
+    await _start_pack_collection(message, state, int(platform_text))
+
+@router.message(ReviewsStates.WaitingForPlatformPhotos, F.photo)
+async def accumulate_pack_photos(message: Message, state: FSMContext):
+    """Collect photos sent for a platform photo pack."""
+    photo = message.photo[-1]
+    photo_intake.add(message.chat.id, message.media_group_id, photo.file_id, photo.file_unique_id, (message, state))
+
+@router.message(ReviewsStates.WaitingForPlatformPhotos, F.document)
+async def accumulate_pack_photos_document(message: Message, state: FSMContext):
+    """Handle image files sent as documents for a platform photo pack."""
+    doc = message.document
+    if not doc.mime_type or not doc.mime_type.startswith("image/"):
+        await message.answer("Ошибка: загруженный файл не является изображением. Пожалуйста, отправьте изображение.")
+        return
+    photo_intake.add(message.chat.id, message.media_group_id, doc.file_id, doc.file_unique_id, (message, state))
+
+@router.callback_query(F.data == "done_adding_pack_photos")
+async def finish_adding_pack_photos(callback: CallbackQuery, state: FSMContext):
+    """Queue the upload of the collected photo pack and return to the main menu.
+
+    The upload itself runs in the background upload workers, so even packs of hundreds of photos
+    do not block the chat; the pack is recorded in photo_packs when it is finished."""
+    await callback.answer()
+    try:
+        await callback.message.edit_reply_markup(reply_markup=None)
+    except:
+        pass
+    chat_id = callback.message.chat.id
+    session = await load_session(state)
+    session.add_photos(photo_intake.drain(chat_id))
+    if not session.photo_ids:
+        await save_session(state, session)
+        await callback.message.answer("Вы не отправили ни одной фотографии.", reply_markup=get_pack_photos_keyboard())
+        return
+    if not session.pack_platform_id:
+        await callback.message.answer("Платформа не выбрана. Начните загрузку заново.",
+                                      reply_markup=get_user_menu_keyboard())
+        await state.set_state(None)
+        return
+    job_key = make_pack_job_key(session.pack_platform_id, session.photo_unique_ids)
+    queued = await enqueue_pack_upload_job(job_key, chat_id, session.client_id, session.pack_platform_id,
+                                           session.photo_ids)
+    count = len(session.photo_ids)
+    session.pack_platform_id = None
+    session.photo_ids = []
+    session.photo_unique_ids = []
+    await save_session(state, session)
+    if queued:
+        text = f"Фото приняты ({count} шт.) и загружаются. Мы сообщим, когда загрузка завершится."
+    else:
+        text = "Этот пак фотографий уже загружается."
+    await callback.message.answer(text, reply_markup=get_user_menu_keyboard())
+    await state.set_state(None)
+
+@router.callback_query(F.data == "cancel_pack_photos")
+async def cancel_pack_photos_callback(callback: CallbackQuery, state: FSMContext):
+    """Discard the photo pack being collected and return to the main menu."""
+    await callback.answer()
+    try:
+        await callback.message.edit_reply_markup(reply_markup=None)
+    except:
+        pass
+    photo_intake.drain(callback.message.chat.id)
+    session = await load_session(state)
+    session.pack_platform_id = None
+    session.photo_ids = []
+    session.photo_unique_ids = []
+    await save_session(state, session)
+    await callback.message.answer("Загрузка фото отменена.", reply_markup=get_user_menu_keyboard())
+    await state.set_state(None)
+
 @router.callback_query(F.data == "save_changes")
 async def save_changes_callback(callback: CallbackQuery, state: FSMContext):
     """Finalize all pending changes: apply to database and show summary."""
@@ -758,55 +799,43 @@ async def save_changes_callback(callback: CallbackQuery, state: FSMContext):
         await callback.message.edit_reply_markup(reply_markup=None)
     except:
         pass
-    data = await state.get_data()
-    pending = data.get("pending_changes", [])
-    if not pending:
+    session = await load_session(state)
+    if not session.pending:
         await callback.message.answer("Нет внесенных изменений.")
         await state.clear()
         return
-    # Apply each pending change to the database
+    # Every review appears once in the pending map with its final state; apply them in one transaction
+    pending_updates = session.pending_updates()
+    updates = [dict(entry, review_id=review_id) for review_id, entry in pending_updates.items()]
+    inserts = list(session.pending_inserts().values())
+    updated, inserted = await apply_review_changes(session.client_id, updates, inserts)
+    # Build the summary from the rows returned by the apply: one line per review
+    updated_rows = {row["id"]: row for row in updated}
     changes_lines = []
-    for change in pending:
-        action = change.get("action")
-        if action == "insert":
-            # Insert new review to DB (status pending)
-            new_review = change.get("new_review", {})
-            plat_num = new_review.get("platform_number")
-            text = new_review.get("review_text", "")
-            date_str = new_review.get("date", datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
-            # Determine platform_id
-            client_id = data.get("client_id")
-            platform_id = await get_platform_id(client_id, plat_num)
-            if platform_id:
-                from database import create_review
-                await create_review(client_id, platform_id, text, date_str, "", "pending", None)
-            changes_lines.append(f"🆕 {text} - добавлен (New)")
-        elif action == "update":
-            # Update a single field (status or text)
-            review_id = change.get("review_id")
-            val = change.get("value")
-            if review_id:
-                if val in ["🟢", "🚫"]:
-                    # Update status in DB
-                    new_status = "approved" if val == "🟢" else "rejected"
-                    await update_review_status(review_id, new_status)
-                    marker = "🟢" if val == "🟢" else "🔴"
-                    changes_lines.append(f"{marker} {change.get('review_text', '')} - {change.get('client_action', '')}")
-                else:
-                    # Update review text
-                    await update_review_text(review_id, val)
-                    changes_lines.append(f"✏️ {change.get('review_text', '')} - обновлён")
-        elif action == "update_multiple":
-            # Update status and photo_link for a review (photo added)
-            review_id = change.get("review_id")
-            updates = change.get("updates", {})
-            if review_id:
-                # Set status approved and photo_link
-                link = updates.get("photo_link")
-                await update_review_photo(review_id, link or "")
-                changes_lines.append(f"📷 {change.get('review_text', '')} - Фото добавлено")
+    for review_id, entry in pending_updates.items():
+        row = updated_rows.get(review_id)
+        if row is None:
+            continue
+        parts = []
+        if entry["status"] == "approved":
+            icon = "🟢"
+            parts.append("согласован")
+        elif entry["status"] == "rejected":
+            icon = "🔴"
+            parts.append("отклонен")
+        else:
+            icon = "✏️"
+        if entry["text"] is not None:
+            parts.append("обновлён")
+        if entry["job_key"] or entry["photo_link"]:
+            icon = "📷"
+            parts.append("Фото добавлено")
+        changes_lines.append(f"{icon} {html.escape(row['review_text'] or '')} - {', '.join(parts)}")
+    for row in inserted:
+        note = " (похож на существующий отзыв)" if row["duplicate_of"] else ""
+        changes_lines.append(f"🆕 {html.escape(row['review_text'])} - добавлен (New){note}")
     # Clear pending changes from state
-    await state.update_data(pending_changes=[])
+    await state.update_data(pending={})
     # Show summary of changes
     if changes_lines:
         summary = "Измененные отзывы:\n" + "\n".join(changes_lines)
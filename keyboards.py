@@ -14,7 +14,9 @@ def get_admin_menu_keyboard():
         [InlineKeyboardButton(text="Создать клиента", callback_data="admin_create_client")],
         [InlineKeyboardButton(text="Редактировать клиента", callback_data="admin_edit_client")],
         [InlineKeyboardButton(text="Изменить пароль клиента", callback_data="admin_edit_password")],
-        [InlineKeyboardButton(text="Просмотреть статистику", callback_data="admin_view_stats")]
+        [InlineKeyboardButton(text="Просмотреть статистику", callback_data="admin_view_stats")],
+        [InlineKeyboardButton(text="Отзывы на проверке", callback_data="admin_moderation")],
+        [InlineKeyboardButton(text="Импорт клиентов из CSV", callback_data="admin_import_clients")]
     ]
     return InlineKeyboardMarkup(inline_keyboard=kb)
 
@@ -27,6 +29,22 @@ def get_user_menu_keyboard():
     ]
     return InlineKeyboardMarkup(inline_keyboard=kb)
 
+def get_pack_photos_keyboard():
+    """Keyboard shown while the client sends photos of a platform photo pack."""
+    kb = [
+        [InlineKeyboardButton(text="Готово", callback_data="done_adding_pack_photos")],
+        [InlineKeyboardButton(text="Отмена", callback_data="cancel_pack_photos")]
+    ]
+    return InlineKeyboardMarkup(inline_keyboard=kb)
+
+def get_duplicate_review_keyboard():
+    """Keyboard shown when a review being added looks like an existing one."""
+    kb = [
+        [InlineKeyboardButton(text="Всё равно добавить", callback_data="confirm_duplicate_review")],
+        [InlineKeyboardButton(text="Не добавлять", callback_data="cancel_duplicate_review")]
+    ]
+    return InlineKeyboardMarkup(inline_keyboard=kb)
+
 def get_actions_keyboard():
     """Keyboard with actions for review management (approve/reject/edit/add)."""
     kb = [
@@ -42,10 +60,9 @@ def get_actions_keyboard():
     ]
     return InlineKeyboardMarkup(inline_keyboard=kb)
 
-async def get_pending_keyboard(state):
+def get_pending_keyboard(has_pending: bool):
     """Keyboard to show when there are pending changes (allowing send or continue editing)."""
-    data = await state.get_data()
-    if data.get("pending_changes"):
+    if has_pending:
         return InlineKeyboardMarkup(inline_keyboard=[
             [
                 InlineKeyboardButton(text="Отправить отчет", callback_data="save_changes"),
@@ -63,3 +80,42 @@ def get_no_new_reviews_keyboard():
         [InlineKeyboardButton(text="Вернуться в главное меню", callback_data="back_to_main_menu")]
     ]
     return InlineKeyboardMarkup(inline_keyboard=kb)
+
+def get_reviews_page_keyboard(has_prev: bool, has_next: bool):
+    """Keyboard with prev/next buttons for paging through the review list (None if there is a single page)."""
+    row = []
+    if has_prev:
+        row.append(InlineKeyboardButton(text="◀️ Назад", callback_data="reviews_page_prev"))
+    if has_next:
+        row.append(InlineKeyboardButton(text="Вперёд ▶️", callback_data="reviews_page_next"))
+    if not row:
+        return None
+    return InlineKeyboardMarkup(inline_keyboard=[row])
+
+def get_search_page_keyboard(has_prev: bool, has_next: bool):
+    """Keyboard with prev/next buttons for admin search results (None if there is a single page)."""
+    row = []
+    if has_prev:
+        row.append(InlineKeyboardButton(text="◀️ Назад", callback_data="search_page_prev"))
+    if has_next:
+        row.append(InlineKeyboardButton(text="Вперёд ▶️", callback_data="search_page_next"))
+    if not row:
+        return None
+    return InlineKeyboardMarkup(inline_keyboard=[row])
+
+def get_moderation_keyboard(has_prev: bool, has_next: bool):
+    """Keyboard of a moderation queue page: decisions for the page or selected reviews, and paging."""
+    kb = [
+        [InlineKeyboardButton(text="Согласовать выбранные", callback_data="moderation_approve_selected"),
+         InlineKeyboardButton(text="Отклонить выбранные", callback_data="moderation_reject_selected")],
+        [InlineKeyboardButton(text="Согласовать страницу", callback_data="moderation_approve_page"),
+         InlineKeyboardButton(text="Отклонить страницу", callback_data="moderation_reject_page")],
+    ]
+    row = []
+    if has_prev:
+        row.append(InlineKeyboardButton(text="◀️ Назад", callback_data="moderation_page_prev"))
+    row.append(InlineKeyboardButton(text="🔄", callback_data="moderation_refresh"))
+    if has_next:
+        row.append(InlineKeyboardButton(text="Вперёд ▶️", callback_data="moderation_page_next"))
+    kb.append(row)
+    return InlineKeyboardMarkup(inline_keyboard=kb)
@@ -26,20 +26,37 @@ if not API_TOKEN or not ADMIN_ID or not DRIVE_FOLDER_ID:
 # Initialize bot and dispatcher
 from aiogram.client.bot import DefaultBotProperties
 bot = Bot(token=API_TOKEN, default=DefaultBotProperties(parse_mode="HTML"))
-dp = Dispatcher()
+# FSM sessions are kept in PostgreSQL so they survive restarts and can be shared between processes
+from fsm_storage import PostgresStorage, StorageFlushMiddleware
+FSM_TTL_SECONDS = int(os.getenv("FSM_TTL_SECONDS", str(7 * 24 * 3600)))
+storage = PostgresStorage(ttl=FSM_TTL_SECONDS)
+dp = Dispatcher(storage=storage)
+# Updates run in parallel across chats but in order within a chat, with a global in-flight cap
+from middlewares import ChatSerializationMiddleware
+MAX_CONCURRENT_UPDATES = int(os.getenv("MAX_CONCURRENT_UPDATES", "32"))
+# Serialization and flush middlewares have to wrap the FSM middleware, so re-register the latter after them
+dp.update.outer_middleware.unregister(dp.fsm)
+dp.update.outer_middleware(ChatSerializationMiddleware(max_in_flight=MAX_CONCURRENT_UPDATES))
+dp.update.outer_middleware(StorageFlushMiddleware(storage))
+dp.update.outer_middleware(dp.fsm)
 
 # Store admin ID and Drive folder ID in bot object for access in handlers
 bot.admin_id = ADMIN_ID
 bot.drive_folder_id = DRIVE_FOLDER_ID
 
 # Include handlers from other modules
-from handlers import auth, reviews
+from handlers import auth, admin, reviews, moderation
 dp.include_router(auth.router)
+dp.include_router(admin.router)
+dp.include_router(moderation.router)
 dp.include_router(reviews.router)
 
 # Import and initialize Google services and database
 from google_sheets import init_google_services, import_initial_data, sync_with_google
-from database import init_db, is_clients_empty
+from database import init_db, is_clients_empty, listen_client_changes
+from db_pool import log_metrics
+from upload_jobs import start_upload_workers
+from archiver import run_archiver
 
 async def main():
     # Set bot commands for menu (optional)
@@ -50,15 +67,25 @@ async def main():
     ])
     # Initialize Google Sheets/Drive and database
     init_google_services()
-    await init_db()
+    repo = await init_db()
     # If first run, import data from Google Sheets
     if await is_clients_empty():
-        await import_initial_data()
+        await import_initial_data(repo)
+    # Periodically log connection pool usage (acquire wait, connections in use, statement latency)
+    asyncio.create_task(log_metrics(lambda: repo.pool))
+    # Keep the authorization cache in sync with changes made by other processes
+    asyncio.create_task(listen_client_changes())
     # Start background synchronization task
-    asyncio.create_task(sync_with_google())
+    asyncio.create_task(sync_with_google(repo, bot))
+    # Start background photo upload workers
+    start_upload_workers(bot, repo)
+    # Start background archiving of old decided reviews
+    asyncio.create_task(run_archiver(repo))
+    # Start background removal of idle FSM sessions
+    asyncio.create_task(storage.run_expiry())
     # Start polling updates
     try:
-        await dp.start_polling(bot)
+        await dp.start_polling(bot, handle_as_tasks=True)
     finally:
         await bot.session.close()
 
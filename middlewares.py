@@ -0,0 +1,91 @@
+"""Dispatcher middlewares controlling how updates are processed concurrently.
+
+Updates of different chats are handled in parallel, updates of the same chat strictly one after
+another in arrival order, and the total number of updates being handled at once is capped.
+Repeated clicks on the same inline button are answered and dropped instead of being handled twice."""
+import asyncio
+import time
+import logging
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import Update
+
+logger = logging.getLogger(__name__)
+
+# chat_id -> [lock, number of holders or waiters]; entries are removed when nobody uses them
+_chat_locks: Dict[int, list] = {}
+
+
+@asynccontextmanager
+async def chat_lock(chat_id: int):
+    """Hold the per-chat lock. Background tasks that touch a chat's FSM state must use it as well."""
+    slot = _chat_locks.setdefault(chat_id, [asyncio.Lock(), 0])
+    slot[1] += 1
+    try:
+        async with slot[0]:
+            yield
+    finally:
+        slot[1] -= 1
+        if slot[1] == 0:
+            _chat_locks.pop(chat_id, None)
+
+
+class ChatSerializationMiddleware(BaseMiddleware):
+    """Outer update middleware: per-chat ordering, a global in-flight limit and callback deduplication.
+
+    Must be registered before the FSM storage middlewares so that the state of a chat is loaded
+    and written back while its lock is held."""
+
+    def __init__(self, max_in_flight: int = 32, duplicate_window: float = 2.0):
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self.duplicate_window = duplicate_window
+        # (chat_id, message_id, data) of callbacks being handled or finished within the window
+        self._inflight_callbacks = set()
+        self._recent_callbacks: Dict[tuple, float] = {}
+
+    def _callback_key(self, event: Update):
+        callback = event.callback_query
+        if callback is None or callback.message is None:
+            return None
+        return callback.message.chat.id, callback.message.message_id, callback.data
+
+    def _is_duplicate(self, key) -> bool:
+        now = time.monotonic()
+        # Drop expired entries so the dict stays small
+        for old_key, finished in list(self._recent_callbacks.items()):
+            if now - finished > self.duplicate_window:
+                del self._recent_callbacks[old_key]
+        return key in self._inflight_callbacks or key in self._recent_callbacks
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any],
+    ) -> Any:
+        callback_key = self._callback_key(event)
+        if callback_key is not None:
+            if self._is_duplicate(callback_key):
+                try:
+                    await data["bot"].answer_callback_query(event.callback_query.id)
+                except Exception:
+                    pass
+                logger.info("Dropped duplicate callback %s", callback_key)
+                return None
+            self._inflight_callbacks.add(callback_key)
+        chat = data.get("event_chat")
+        chat_id = chat.id if chat else None
+        try:
+            if chat_id is None:
+                async with self._semaphore:
+                    return await handler(event, data)
+            # Take the chat lock first so a busy chat does not hold global slots while waiting
+            async with chat_lock(chat_id):
+                async with self._semaphore:
+                    return await handler(event, data)
+        finally:
+            if callback_key is not None:
+                self._inflight_callbacks.discard(callback_key)
+                self._recent_callbacks[callback_key] = time.monotonic()
@@ -0,0 +1,539 @@
+"""Versioned database schema migrations.
+
+Each migration has a number and is applied once; applied versions are recorded in the schema_version
+table. Migrations run in order, each in its own transaction, except those marked non-transactional
+(e.g. CREATE INDEX CONCURRENTLY, which cannot run inside a transaction and does not lock the table
+against writes). A session advisory lock keeps two processes from migrating at the same time.
+
+Run them with `python setup_db.py migrate` (see `python setup_db.py --help`); init_db() also applies
+pending migrations on startup unless DB_AUTO_MIGRATE=0."""
+import logging
+from dataclasses import dataclass
+from typing import Awaitable, Callable, List, Optional, Union
+
+import asyncpg
+
+from review_dates import parse_review_date
+
+logger = logging.getLogger(__name__)
+
+# Key of the advisory lock held while migrating
+MIGRATION_LOCK_KEY = 7041526
+# Rows updated per statement by data backfills
+BACKFILL_BATCH_SIZE = 5000
+
+# A step is an SQL script or an async function taking the connection
+Step = Union[str, Callable[[asyncpg.Connection], Awaitable[None]]]
+
+
+@dataclass
+class Migration:
+    """One numbered schema change."""
+    version: int
+    name: str
+    steps: List[Step]
+    # False for steps that cannot run inside a transaction (CREATE INDEX CONCURRENTLY)
+    transactional: bool = True
+
+
+def create_index_concurrently(name: str, definition: str) -> Step:
+    """Step that builds an index without blocking writes.
+
+    definition is everything after the index name, e.g. "ON reviews(client_id)". An invalid index left
+    behind by an interrupted build is dropped and built again."""
+    async def step(conn: asyncpg.Connection):
+        valid = await conn.fetchval(
+            "SELECT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid WHERE c.relname = $1;",
+            name
+        )
+        if valid:
+            return
+        if valid is False:
+            await conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name};")
+        await conn.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} {definition};")
+    return step
+
+
+def drop_index_concurrently(name: str) -> Step:
+    """Step that drops an index without blocking reads and writes."""
+    return f"DROP INDEX CONCURRENTLY IF EXISTS {name};"
+
+
+BASELINE_SQL = """
+    CREATE TABLE IF NOT EXISTS clients (
+        id SERIAL PRIMARY KEY,
+        number INTEGER UNIQUE NOT NULL,
+        password TEXT NOT NULL,
+        authorized BOOLEAN DEFAULT FALSE,
+        telegram_id BIGINT
+    );
+    CREATE TABLE IF NOT EXISTS platforms (
+        id SERIAL PRIMARY KEY,
+        client_id INTEGER NOT NULL REFERENCES clients(id) ON DELETE CASCADE,
+        number INTEGER NOT NULL,
+        url TEXT,
+        UNIQUE(client_id, number)
+    );
+    CREATE TABLE IF NOT EXISTS reviews (
+        id SERIAL PRIMARY KEY,
+        client_id INTEGER NOT NULL REFERENCES clients(id) ON DELETE CASCADE,
+        platform_id INTEGER NOT NULL REFERENCES platforms(id) ON DELETE CASCADE,
+        review_text TEXT NOT NULL,
+        review_date TEXT,
+        manager_comment TEXT,
+        status TEXT NOT NULL,
+        photo_link TEXT
+    );
+    CREATE TABLE IF NOT EXISTS photo_packs (
+        id SERIAL PRIMARY KEY,
+        client_id INTEGER NOT NULL REFERENCES clients(id) ON DELETE CASCADE,
+        platform_id INTEGER NOT NULL REFERENCES platforms(id) ON DELETE CASCADE,
+        folder_link TEXT,
+        created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+        synced BOOLEAN NOT NULL DEFAULT FALSE
+    );
+    CREATE TABLE IF NOT EXISTS fsm_storage (
+        key TEXT PRIMARY KEY,
+        state TEXT,
+        data JSONB NOT NULL DEFAULT '{}',
+        updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+    );
+    CREATE INDEX IF NOT EXISTS idx_fsm_storage_updated_at ON fsm_storage(updated_at);
+    CREATE TABLE IF NOT EXISTS photo_upload_jobs (
+        id SERIAL PRIMARY KEY,
+        job_key TEXT UNIQUE NOT NULL,
+        chat_id BIGINT NOT NULL,
+        review_id INTEGER NOT NULL REFERENCES reviews(id) ON DELETE CASCADE,
+        file_ids TEXT[] NOT NULL,
+        status TEXT NOT NULL DEFAULT 'queued',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        next_run_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+        locked_at TIMESTAMPTZ,
+        folder_id TEXT,
+        folder_link TEXT,
+        apply_on_finish BOOLEAN NOT NULL DEFAULT FALSE,
+        last_error TEXT,
+        created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+    );
+    -- Jobs either attach photos to a review or upload a platform photo pack
+    ALTER TABLE photo_upload_jobs ALTER COLUMN review_id DROP NOT NULL;
+    ALTER TABLE photo_upload_jobs ADD COLUMN IF NOT EXISTS client_id INTEGER REFERENCES clients(id) ON DELETE CASCADE;
+    ALTER TABLE photo_upload_jobs ADD COLUMN IF NOT EXISTS platform_id INTEGER REFERENCES platforms(id) ON DELETE CASCADE;
+    CREATE INDEX IF NOT EXISTS idx_photo_upload_jobs_queue ON photo_upload_jobs(next_run_at)
+        WHERE status IN ('queued', 'running');
+    CREATE TABLE IF NOT EXISTS drive_folders (
+        id SERIAL PRIMARY KEY,
+        scope TEXT NOT NULL,
+        owner_id INTEGER NOT NULL,
+        folder_id TEXT NOT NULL,
+        created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+        UNIQUE(scope, owner_id)
+    );
+    CREATE TABLE IF NOT EXISTS photo_dedup (
+        file_unique_id TEXT PRIMARY KEY,
+        content_hash TEXT NOT NULL,
+        drive_file_id TEXT NOT NULL,
+        folder_id TEXT NOT NULL,
+        created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+    );
+    CREATE INDEX IF NOT EXISTS idx_photo_dedup_content_hash ON photo_dedup(content_hash);
+    CREATE INDEX IF NOT EXISTS idx_reviews_platform_status_id ON reviews(platform_id, status, id);
+"""
+
+
+async def _review_counters(conn: asyncpg.Connection):
+    """Counter tables for client/platform stats and the triggers that keep them up to date.
+
+    Counters are adjusted by statement-level triggers on reviews (using transition tables, so a bulk
+    insert or update costs one counter update per affected client/platform) and by row triggers on
+    platforms. They are backfilled from the existing data when the tables are first created."""
+    created = await conn.fetchval("SELECT to_regclass('client_review_counters') IS NULL;")
+    await conn.execute("""
+    CREATE TABLE IF NOT EXISTS client_review_counters (
+        client_id INTEGER PRIMARY KEY,
+        platforms_count INTEGER NOT NULL DEFAULT 0,
+        total_reviews INTEGER NOT NULL DEFAULT 0,
+        approved_reviews INTEGER NOT NULL DEFAULT 0,
+        new_reviews INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE TABLE IF NOT EXISTS platform_review_counters (
+        platform_id INTEGER PRIMARY KEY,
+        client_id INTEGER NOT NULL,
+        total_reviews INTEGER NOT NULL DEFAULT 0,
+        new_reviews INTEGER NOT NULL DEFAULT 0
+    );
+
+    -- Add per-review deltas (client, platform, total, approved, new) to the counters.
+    -- Rows of clients/platforms deleted in the same statement (cascades) are skipped.
+    CREATE OR REPLACE FUNCTION apply_review_counter_deltas(
+        client_ids INTEGER[], platform_ids INTEGER[], totals INTEGER[], approved INTEGER[], fresh INTEGER[]
+    ) RETURNS void LANGUAGE sql AS $$
+        WITH d AS (
+            SELECT * FROM unnest(client_ids, platform_ids, totals, approved, fresh)
+                AS d(client_id, platform_id, total, approved, fresh)
+        ), c AS (
+            INSERT INTO client_review_counters AS t(client_id, total_reviews, approved_reviews, new_reviews)
+            SELECT client_id, SUM(total), SUM(approved), SUM(fresh) FROM d
+            WHERE EXISTS (SELECT 1 FROM clients WHERE id = d.client_id)
+            GROUP BY client_id
+            HAVING SUM(total) <> 0 OR SUM(approved) <> 0 OR SUM(fresh) <> 0
+            ON CONFLICT (client_id) DO UPDATE SET
+                total_reviews = t.total_reviews + EXCLUDED.total_reviews,
+                approved_reviews = t.approved_reviews + EXCLUDED.approved_reviews,
+                new_reviews = t.new_reviews + EXCLUDED.new_reviews
+        )
+        INSERT INTO platform_review_counters AS t(platform_id, client_id, total_reviews, new_reviews)
+        SELECT platform_id, MIN(client_id), SUM(total), SUM(fresh) FROM d
+        WHERE EXISTS (SELECT 1 FROM platforms WHERE id = d.platform_id)
+        GROUP BY platform_id
+        HAVING SUM(total) <> 0 OR SUM(fresh) <> 0
+        ON CONFLICT (platform_id) DO UPDATE SET
+            total_reviews = t.total_reviews + EXCLUDED.total_reviews,
+            new_reviews = t.new_reviews + EXCLUDED.new_reviews;
+    $$;
+
+    CREATE OR REPLACE FUNCTION reviews_counters_trigger() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+            PERFORM apply_review_counter_deltas(array_agg(client_id), array_agg(platform_id),
+                                                array_agg(1), array_agg((status = 'approved')::int),
+                                                array_agg((status = 'new')::int))
+            FROM new_rows;
+        ELSIF TG_OP = 'DELETE' THEN
+            PERFORM apply_review_counter_deltas(array_agg(client_id), array_agg(platform_id),
+                                                array_agg(-1), array_agg(-(status = 'approved')::int),
+                                                array_agg(-(status = 'new')::int))
+            FROM old_rows;
+        ELSE
+            PERFORM apply_review_counter_deltas(array_agg(client_id), array_agg(platform_id),
+                                                array_agg(total), array_agg(approved), array_agg(fresh))
+            FROM (
+                SELECT client_id, platform_id, 1 AS total, (status = 'approved')::int AS approved,
+                       (status = 'new')::int AS fresh
+                FROM new_rows
+                UNION ALL
+                SELECT client_id, platform_id, -1, -(status = 'approved')::int, -(status = 'new')::int
+                FROM old_rows
+            ) d;
+        END IF;
+        RETURN NULL;
+    END;
+    $$;
+
+    CREATE OR REPLACE FUNCTION platforms_counters_trigger() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+            INSERT INTO client_review_counters AS t(client_id, platforms_count) VALUES (NEW.client_id, 1)
+            ON CONFLICT (client_id) DO UPDATE SET platforms_count = t.platforms_count + 1;
+        ELSE
+            UPDATE client_review_counters SET platforms_count = platforms_count - 1
+            WHERE client_id = OLD.client_id;
+            DELETE FROM platform_review_counters WHERE platform_id = OLD.id;
+        END IF;
+        RETURN NULL;
+    END;
+    $$;
+    """)
+    if not created:
+        return
+    # First run: block writes while the triggers are installed and the counters are backfilled
+    await conn.execute("""
+    LOCK TABLE platforms, reviews IN SHARE ROW EXCLUSIVE MODE;
+    CREATE TRIGGER reviews_counters_insert AFTER INSERT ON reviews
+        REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION reviews_counters_trigger();
+    CREATE TRIGGER reviews_counters_update AFTER UPDATE ON reviews
+        REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION reviews_counters_trigger();
+    CREATE TRIGGER reviews_counters_delete AFTER DELETE ON reviews
+        REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION reviews_counters_trigger();
+    CREATE TRIGGER platforms_counters AFTER INSERT OR DELETE ON platforms
+        FOR EACH ROW EXECUTE FUNCTION platforms_counters_trigger();
+    INSERT INTO client_review_counters(client_id, platforms_count, total_reviews, approved_reviews, new_reviews)
+    SELECT c.id,
+           (SELECT COUNT(*) FROM platforms WHERE client_id = c.id),
+           COALESCE(r.total, 0), COALESCE(r.approved, 0), COALESCE(r.fresh, 0)
+    FROM clients c
+    LEFT JOIN (
+        SELECT client_id, COUNT(*) AS total, COUNT(*) FILTER (WHERE status = 'approved') AS approved,
+               COUNT(*) FILTER (WHERE status = 'new') AS fresh
+        FROM reviews GROUP BY client_id
+    ) r ON r.client_id = c.id;
+    INSERT INTO platform_review_counters(platform_id, client_id, total_reviews, new_reviews)
+    SELECT platform_id, MIN(client_id), COUNT(*), COUNT(*) FILTER (WHERE status = 'new')
+    FROM reviews GROUP BY platform_id;
+    """)
+
+
+CLIENT_NOTIFY_SQL = """
+    CREATE OR REPLACE FUNCTION clients_auth_notify() RETURNS trigger LANGUAGE plpgsql AS $$
+    DECLARE chats TEXT;
+    BEGIN
+        IF TG_OP = 'DELETE' THEN
+            chats := OLD.telegram_id::text;
+        ELSE
+            chats := concat_ws(',', OLD.telegram_id, NEW.telegram_id);
+        END IF;
+        IF chats <> '' THEN
+            PERFORM pg_notify('client_auth_changed', chats);
+        END IF;
+        RETURN NULL;
+    END;
+    $$;
+    DO $$
+    BEGIN
+        IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'clients_auth_notify') THEN
+            CREATE TRIGGER clients_auth_notify AFTER UPDATE OF authorized, telegram_id, number OR DELETE
+                ON clients FOR EACH ROW EXECUTE FUNCTION clients_auth_notify();
+        END IF;
+    END;
+    $$;
+"""
+
+
+async def _typed_review_date(conn: asyncpg.Connection):
+    """Keep the original date string in review_date_raw and store the parsed value in a timestamptz review_date."""
+    column_type = await conn.fetchval(
+        "SELECT data_type FROM information_schema.columns WHERE table_name='reviews' AND column_name='review_date';"
+    )
+    if column_type != "text":
+        return
+    await conn.execute("""
+    ALTER TABLE reviews RENAME COLUMN review_date TO review_date_raw;
+    ALTER TABLE reviews ADD COLUMN review_date TIMESTAMPTZ;
+    """)
+    # Parse in Python (same parser as the importer), in batches of distinct strings
+    raw_values = [r["review_date_raw"] for r in await conn.fetch(
+        "SELECT DISTINCT review_date_raw FROM reviews WHERE review_date_raw IS NOT NULL AND review_date_raw <> '';"
+    )]
+    for start in range(0, len(raw_values), 1000):
+        chunk = [(raw, parse_review_date(raw)) for raw in raw_values[start:start + 1000]]
+        chunk = [(raw, parsed) for raw, parsed in chunk if parsed is not None]
+        if chunk:
+            await conn.execute("""
+            UPDATE reviews r SET review_date = d.parsed
+            FROM unnest($1::text[], $2::timestamptz[]) AS d(raw, parsed)
+            WHERE r.review_date_raw = d.raw;
+            """, [raw for raw, _ in chunk], [parsed for _, parsed in chunk])
+
+
+async def _backfill_decided_at(conn: asyncpg.Connection):
+    """Set decided_at of already decided reviews, in id ranges of BACKFILL_BATCH_SIZE.
+
+    Runs outside a transaction, so each batch commits on its own and only holds its rows' locks briefly.
+    Only decided_at is written, which does not fire the reviews_set_decided_at trigger (UPDATE OF status)."""
+    max_id = await conn.fetchval("SELECT max(id) FROM reviews;") or 0
+    for start in range(0, max_id, BACKFILL_BATCH_SIZE):
+        await conn.execute("""
+        UPDATE reviews SET decided_at = COALESCE(review_date, NOW())
+        WHERE id > $1 AND id <= $2 AND status IN ('approved', 'rejected') AND decided_at IS NULL;
+        """, start, start + BACKFILL_BATCH_SIZE)
+
+
+REVIEWS_ARCHIVE_SQL = """
+    -- When a review was approved or rejected (the age used for archiving)
+    -- (existing decided reviews are backfilled in batches by _backfill_decided_at)
+    ALTER TABLE reviews ADD COLUMN IF NOT EXISTS decided_at TIMESTAMPTZ;
+    CREATE OR REPLACE FUNCTION reviews_set_decided_at() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        IF NEW.status NOT IN ('approved', 'rejected') THEN
+            NEW.decided_at := NULL;
+        ELSIF NEW.decided_at IS NULL OR (TG_OP = 'UPDATE' AND OLD.status IS DISTINCT FROM NEW.status) THEN
+            NEW.decided_at := NOW();
+        END IF;
+        RETURN NEW;
+    END;
+    $$;
+    DO $$
+    BEGIN
+        IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'reviews_set_decided_at') THEN
+            CREATE TRIGGER reviews_set_decided_at BEFORE INSERT OR UPDATE OF status ON reviews
+                FOR EACH ROW EXECUTE FUNCTION reviews_set_decided_at();
+        END IF;
+    END;
+    $$;
+
+    -- Decided reviews moved out of the working table (see Repository.archive_decided_reviews)
+    CREATE TABLE IF NOT EXISTS reviews_archive (
+        id INTEGER PRIMARY KEY,
+        client_id INTEGER NOT NULL REFERENCES clients(id) ON DELETE CASCADE,
+        platform_id INTEGER NOT NULL REFERENCES platforms(id) ON DELETE CASCADE,
+        review_text TEXT NOT NULL,
+        review_date_raw TEXT,
+        review_date TIMESTAMPTZ,
+        manager_comment TEXT,
+        status TEXT NOT NULL,
+        photo_link TEXT,
+        decided_at TIMESTAMPTZ,
+        archived_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+    );
+    CREATE INDEX IF NOT EXISTS idx_reviews_archive_client_date
+        ON reviews_archive(client_id, review_date DESC, id DESC);
+    -- Archived reviews keep counting in the stats: moving a review out of reviews (-1) and into the
+    -- archive (+1) nets to zero, and deleting an archived review (cascades) is subtracted
+    DO $$
+    BEGIN
+        IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'reviews_archive_counters_insert') THEN
+            CREATE TRIGGER reviews_archive_counters_insert AFTER INSERT ON reviews_archive
+                REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION reviews_counters_trigger();
+            CREATE TRIGGER reviews_archive_counters_delete AFTER DELETE ON reviews_archive
+                REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION reviews_counters_trigger();
+        END IF;
+    END;
+    $$;
+"""
+
+
+DUPLICATE_DETECTION_SQL = """
+    CREATE EXTENSION IF NOT EXISTS pg_trgm;
+    -- Earlier review that a new one most likely repeats (flagged for the managers, not enforced)
+    ALTER TABLE reviews ADD COLUMN IF NOT EXISTS duplicate_of INTEGER;
+    ALTER TABLE reviews_archive ADD COLUMN IF NOT EXISTS duplicate_of INTEGER;
+    -- Most similar working or archived review of the platform with trigram similarity >= threshold.
+    -- `%` (pg_trgm.similarity_threshold, 0.3 by default) lets the trigram indexes find the candidates;
+    -- since migration 15 they lead with platform_id, so only the platform's matches are scanned.
+    CREATE OR REPLACE FUNCTION find_duplicate_review(p_platform_id INTEGER, p_text TEXT, p_threshold REAL)
+    RETURNS INTEGER LANGUAGE sql STABLE AS $$
+        SELECT id FROM (
+            SELECT id, review_text FROM reviews WHERE platform_id = p_platform_id AND review_text % p_text
+            UNION ALL
+            SELECT id, review_text FROM reviews_archive WHERE platform_id = p_platform_id AND review_text % p_text
+        ) r
+        WHERE similarity(r.review_text, p_text) >= p_threshold
+        ORDER BY similarity(r.review_text, p_text) DESC, id
+        LIMIT 1;
+    $$;
+"""
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, "baseline schema", [BASELINE_SQL]),
+    Migration(2, "review counters", [_review_counters]),
+    Migration(3, "client change notifications", [CLIENT_NOTIFY_SQL]),
+    Migration(4, "performance indexes", [
+        # Reviews of a client by platform and status (stats, exports, sync)
+        create_index_concurrently("idx_reviews_client_platform_status",
+                                  "ON reviews(client_id, platform_id, status)"),
+        # Open reviews only: new-review pages and the moderation queue stay small and hot
+        create_index_concurrently("idx_reviews_open",
+                                  "ON reviews(platform_id, status, id) WHERE status IN ('new', 'pending')"),
+        # Superseded by idx_reviews_open
+        drop_index_concurrently("idx_reviews_platform_status_id"),
+        # Chat -> authorized client lookups
+        create_index_concurrently("idx_clients_telegram_id",
+                                  "ON clients(telegram_id) WHERE telegram_id IS NOT NULL"),
+        # Unsynced photo packs of a client (sheet sync)
+        create_index_concurrently("idx_photo_packs_unsynced",
+                                  "ON photo_packs(client_id) WHERE NOT synced"),
+    ], transactional=False),
+    Migration(5, "typed review date", [_typed_review_date]),
+    Migration(6, "review date indexes", [
+        # A client's reviews by recency, with keyset pagination on (review_date, id)
+        create_index_concurrently("idx_reviews_client_date",
+                                  "ON reviews(client_id, review_date DESC, id DESC)"),
+        # Time windows across all clients; tiny, since rows are mostly inserted in date order
+        create_index_concurrently("idx_reviews_date_brin", "ON reviews USING brin(review_date)"),
+    ], transactional=False),
+    # The script is one implicit transaction; the backfill then commits batch by batch
+    Migration(7, "reviews archive", [REVIEWS_ARCHIVE_SQL, _backfill_decided_at], transactional=False),
+    Migration(8, "archive candidates index", [
+        # Decided reviews by age, for the archiver
+        create_index_concurrently("idx_reviews_decided",
+                                  "ON reviews(decided_at) WHERE status IN ('approved', 'rejected')"),
+    ], transactional=False),
+    Migration(9, "review search index", [
+        # Full-text search of reviews (admin /search); an expression index instead of a stored tsvector
+        # column, so no table rewrite under an exclusive lock is needed
+        create_index_concurrently("idx_reviews_text_fts", "ON reviews USING gin(to_tsvector('russian', review_text))"),
+    ], transactional=False),
+    Migration(10, "archive search index", [
+        create_index_concurrently("idx_reviews_archive_text_fts",
+                                  "ON reviews_archive USING gin(to_tsvector('russian', review_text))"),
+    ], transactional=False),
+    Migration(11, "duplicate detection", [DUPLICATE_DETECTION_SQL]),
+    Migration(12, "trigram indexes", [
+        # Similar texts (duplicate detection); the platform filter is applied on top
+        create_index_concurrently("idx_reviews_text_trgm", "ON reviews USING gin(review_text gin_trgm_ops)"),
+        create_index_concurrently("idx_reviews_archive_text_trgm",
+                                  "ON reviews_archive USING gin(review_text gin_trgm_ops)"),
+    ], transactional=False),
+    Migration(13, "moderation queue index", [
+        # Pending reviews of all clients by id (admin moderation queue)
+        create_index_concurrently("idx_reviews_pending", "ON reviews(id) WHERE status = 'pending'"),
+    ], transactional=False),
+    Migration(14, "client spreadsheet routing", [
+        # Spreadsheet of a client when it is not the one given by the number range
+        "ALTER TABLE clients ADD COLUMN IF NOT EXISTS spreadsheet_id TEXT;",
+    ]),
+    Migration(15, "platform-scoped trigram indexes", [
+        # btree_gin lets one GIN index serve platform_id = ... AND review_text % ... (find_duplicate_review),
+        # so only the trigram matches of the platform are scanned
+        "CREATE EXTENSION IF NOT EXISTS btree_gin;",
+        create_index_concurrently("idx_reviews_platform_text_trgm",
+                                  "ON reviews USING gin(platform_id, review_text gin_trgm_ops)"),
+        create_index_concurrently("idx_reviews_archive_platform_text_trgm",
+                                  "ON reviews_archive USING gin(platform_id, review_text gin_trgm_ops)"),
+        # Superseded by the platform-scoped indexes
+        drop_index_concurrently("idx_reviews_text_trgm"),
+        drop_index_concurrently("idx_reviews_archive_text_trgm"),
+    ], transactional=False),
+]
+
+
+async def _ensure_version_table(conn: asyncpg.Connection):
+    await conn.execute("""
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        applied_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+    );
+    """)
+
+
+async def get_applied_versions(conn: asyncpg.Connection) -> List[int]:
+    """Versions recorded in schema_version, in ascending order."""
+    await _ensure_version_table(conn)
+    return [r["version"] for r in await conn.fetch("SELECT version FROM schema_version ORDER BY version;")]
+
+
+async def _run_step(conn: asyncpg.Connection, step: Step):
+    if isinstance(step, str):
+        await conn.execute(step)
+    else:
+        await step(conn)
+
+
+async def migrate(conn: asyncpg.Connection, target: Optional[int] = None) -> List[int]:
+    """Apply pending migrations up to `target` (all by default). Returns the versions applied."""
+    await conn.execute("SELECT pg_advisory_lock($1);", MIGRATION_LOCK_KEY)
+    try:
+        applied = set(await get_applied_versions(conn))
+        done = []
+        for migration in sorted(MIGRATIONS, key=lambda m: m.version):
+            if migration.version in applied or (target is not None and migration.version > target):
+                continue
+            logger.info("Applying migration %s: %s", migration.version, migration.name)
+            if migration.transactional:
+                async with conn.transaction():
+                    for step in migration.steps:
+                        await _run_step(conn, step)
+                    await _record(conn, migration)
+            else:
+                # Each step must be idempotent: a failed run is simply repeated
+                for step in migration.steps:
+                    await _run_step(conn, step)
+                await _record(conn, migration)
+            done.append(migration.version)
+        return done
+    finally:
+        await conn.execute("SELECT pg_advisory_unlock($1);", MIGRATION_LOCK_KEY)
+
+
+async def _record(conn: asyncpg.Connection, migration: Migration):
+    await conn.execute("INSERT INTO schema_version(version, name) VALUES($1, $2);",
+                       migration.version, migration.name)
+
+
+async def pending_migrations(conn: asyncpg.Connection) -> List[Migration]:
+    """Migrations that have not been applied yet."""
+    applied = set(await get_applied_versions(conn))
+    return [m for m in sorted(MIGRATIONS, key=lambda m: m.version) if m.version not in applied]
@@ -0,0 +1,67 @@
+"""In-process aggregation of incoming photos.
+
+Photos are buffered per chat and media group (album). A buffer is flushed once, after no new photo
+arrived for `quiet_period` seconds, so an album of N photos results in one state write and one
+acknowledgement instead of N. Duplicates are skipped by Telegram's file_unique_id."""
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from middlewares import chat_lock
+
+logger = logging.getLogger(__name__)
+
+# (file_id, file_unique_id)
+PhotoItem = Tuple[str, str]
+
+
+class PhotoIntakeAggregator:
+    """Buffers photos by (chat_id, media_group_id) and hands them over in batches.
+
+    on_flush(chat_id, items, context) is called from a background task while the chat lock is held;
+    context is whatever the last add() for that buffer passed (e.g. the message and FSM context)."""
+
+    def __init__(self, on_flush: Callable[[int, List[PhotoItem], object], Awaitable[None]],
+                 quiet_period: float = 1.0):
+        self.on_flush = on_flush
+        self.quiet_period = quiet_period
+        self._buffers: Dict[Tuple[int, Optional[str]], dict] = {}
+
+    def add(self, chat_id: int, media_group_id: Optional[str], file_id: str, file_unique_id: str, context):
+        """Buffer a photo and (re)start the quiet-period timer of its album."""
+        key = (chat_id, media_group_id)
+        buffer = self._buffers.get(key)
+        if buffer is None:
+            buffer = self._buffers[key] = {"items": [], "seen": set(), "task": None}
+        if file_unique_id not in buffer["seen"]:
+            buffer["seen"].add(file_unique_id)
+            buffer["items"].append((file_id, file_unique_id))
+        buffer["context"] = context
+        if buffer["task"]:
+            buffer["task"].cancel()
+        buffer["task"] = asyncio.create_task(self._flush_later(key))
+
+    def drain(self, chat_id: int) -> List[PhotoItem]:
+        """Take all buffered photos of a chat without flushing them (e.g. when the user presses "Готово").
+
+        Must be called while the chat lock is held, so no flush of this chat can be running."""
+        items = []
+        for key in [k for k in self._buffers if k[0] == chat_id]:
+            buffer = self._buffers.pop(key)
+            if buffer["task"]:
+                buffer["task"].cancel()
+            items.extend(buffer["items"])
+        return items
+
+    async def _flush_later(self, key):
+        try:
+            await asyncio.sleep(self.quiet_period)
+            async with chat_lock(key[0]):
+                buffer = self._buffers.pop(key, None)
+                if buffer is None or not buffer["items"]:
+                    return
+                await self.on_flush(key[0], buffer["items"], buffer["context"])
+        except asyncio.CancelledError:
+            return
+        except Exception as e:
+            logger.error(f"Failed to flush photos for chat {key[0]}: {e}")
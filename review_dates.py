@@ -0,0 +1,75 @@
+"""Parsing of review dates.
+
+Sheets contain dates typed by managers in various formats ("2024-03-12", "12.03.2024 14:30",
+"12 марта 2024", ...), and the bot writes "%Y-%m-%d %H:%M:%S". parse_review_date() turns any of
+these into an aware datetime (dates without a time zone are taken in REVIEWS_TIMEZONE) and returns
+None for anything it does not recognise; the original string is always stored next to it."""
+import os
+import re
+from datetime import datetime
+from typing import Optional
+from zoneinfo import ZoneInfo
+
+REVIEWS_TIMEZONE = ZoneInfo(os.getenv("REVIEWS_TIMEZONE", "Europe/Moscow"))
+
+_FORMATS = (
+    "%Y-%m-%d %H:%M:%S",
+    "%Y-%m-%d %H:%M",
+    "%Y-%m-%d",
+    "%d.%m.%Y %H:%M:%S",
+    "%d.%m.%Y %H:%M",
+    "%d.%m.%Y",
+    "%d.%m.%y",
+    "%d/%m/%Y %H:%M",
+    "%d/%m/%Y",
+    "%Y/%m/%d",
+)
+
+# Genitive month names as written in Russian dates ("12 марта 2024")
+_MONTHS = {
+    "январ": 1, "феврал": 2, "март": 3, "апрел": 4, "ма": 5, "июн": 6,
+    "июл": 7, "август": 8, "сентябр": 9, "октябр": 10, "ноябр": 11, "декабр": 12,
+}
+_WORDY_DATE = re.compile(r"^(\d{1,2})\s+([а-яё]+)\s+(\d{4})(?:\s*г\.?)?(?:\s+(\d{1,2}):(\d{2}))?$")
+
+
+def _month_number(word: str) -> Optional[int]:
+    # Longest stem first, so "мая" is not taken for "март"
+    for stem in sorted(_MONTHS, key=len, reverse=True):
+        if word.startswith(stem):
+            return _MONTHS[stem]
+    return None
+
+
+def parse_review_date(value: Optional[str]) -> Optional[datetime]:
+    """Parse a review date string; None if it is empty or not recognised."""
+    if not value:
+        return None
+    text = " ".join(value.strip().split())
+    if not text:
+        return None
+    parsed = None
+    for fmt in _FORMATS:
+        try:
+            parsed = datetime.strptime(text, fmt)
+            break
+        except ValueError:
+            continue
+    if parsed is None:
+        match = _WORDY_DATE.match(text.lower())
+        if match:
+            month = _month_number(match.group(2))
+            if month:
+                try:
+                    parsed = datetime(int(match.group(3)), month, int(match.group(1)),
+                                      int(match.group(4) or 0), int(match.group(5) or 0))
+                except ValueError:
+                    parsed = None
+    if parsed is None:
+        try:
+            parsed = datetime.fromisoformat(text)
+        except ValueError:
+            return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=REVIEWS_TIMEZONE)
+    return parsed
@@ -0,0 +1,147 @@
+"""Compact FSM session for the reviews flow.
+
+Only IDs, page cursors and the pending-change map are stored in FSM data; review texts are
+loaded from the database when they have to be shown. Handlers load the session once with
+load_session() and write it back once with save_session()."""
+from dataclasses import dataclass, field, fields, asdict
+from typing import Optional, Union
+from aiogram.fsm.context import FSMContext
+
+# Prefix of pending-change keys for reviews added through the bot (not yet in the DB)
+INSERT_KEY_PREFIX = "new:"
+
+
+@dataclass
+class ReviewSession:
+    """Serializable per-chat state of the reviews flow."""
+    client_id: Optional[int] = None
+    client_number: Optional[int] = None
+    platform_number: Optional[int] = None
+    # Keyset cursors of the visible page
+    page_first_id: Optional[int] = None
+    page_last_id: Optional[int] = None
+    # Keys of the visible page in display order: review IDs or pending insert keys
+    page_keys: list = field(default_factory=list)
+    # Pending changes: str(review_id) or insert key -> final intended state, in order of first change
+    pending: dict = field(default_factory=dict)
+    next_insert_seq: int = 1
+    # Review selected for editing or for attaching photos
+    target_key: Union[int, str, None] = None
+    photo_ids: list = field(default_factory=list)
+    photo_unique_ids: list = field(default_factory=list)
+    # Platform that the photo pack being collected belongs to
+    pack_platform_id: Optional[int] = None
+    # Text of a review to be added that looks like a duplicate, until the client confirms it
+    duplicate_text: Optional[str] = None
+    # Message IDs that are removed when the next step starts
+    prompt_id: Optional[int] = None
+    platforms_list_id: Optional[int] = None
+
+    @classmethod
+    def from_data(cls, data: dict) -> "ReviewSession":
+        """Build a session from FSM data, ignoring unrelated keys."""
+        names = {f.name for f in fields(cls)}
+        session = cls(**{k: v for k, v in data.items() if k in names})
+        # Sessions saved before compaction keep a list of operations per review
+        for key, value in list(session.pending.items()):
+            if isinstance(value, list):
+                session.pending[key] = _fold_operations(value)
+        return session
+
+    def to_data(self) -> dict:
+        """Return the session as a JSON-serializable dict."""
+        return asdict(self)
+
+    def key_for_number(self, number: int):
+        """Map a 1-based selection number on the visible page to its review key (or None)."""
+        if 1 <= number <= len(self.page_keys):
+            return self.page_keys[number - 1]
+        return None
+
+    def _review_entry(self, review_id: int) -> dict:
+        """Pending state of an existing review, created on its first change."""
+        return self.pending.setdefault(str(review_id), _empty_review_entry())
+
+    def set_status(self, review_id: int, status: str):
+        """Mark an existing review as approved or rejected (the latest choice wins)."""
+        self._review_entry(review_id)["status"] = status
+
+    def set_text(self, key, text: str):
+        """Set the new text of an existing review or of a review to be added."""
+        if is_insert_key(key):
+            if key in self.pending:
+                self.pending[key]["text"] = text
+            return
+        self._review_entry(key)["text"] = text
+
+    def set_photos(self, review_id: int, job_key: str):
+        """Attach the photos of an upload job to a review; this also approves it."""
+        entry = self._review_entry(review_id)
+        entry["status"] = "approved"
+        entry["job_key"] = job_key
+
+    def add_insert(self, platform_number: int, date: str, text: str) -> str:
+        """Register a review to be added on save. Returns its temporary key."""
+        key = f"{INSERT_KEY_PREFIX}{self.next_insert_seq}"
+        self.next_insert_seq += 1
+        self.pending[key] = {"insert": True, "platform_number": platform_number, "date": date, "text": text}
+        return key
+
+    def add_photos(self, items: list) -> int:
+        """Add (file_id, file_unique_id) pairs, skipping photos already collected. Returns the number added."""
+        seen = set(self.photo_unique_ids)
+        added = 0
+        for file_id, unique_id in items:
+            if unique_id in seen:
+                continue
+            seen.add(unique_id)
+            self.photo_ids.append(file_id)
+            self.photo_unique_ids.append(unique_id)
+            added += 1
+        return added
+
+    def pending_inserts(self) -> dict:
+        """Return pending inserts as {key: insert state}."""
+        return {k: v for k, v in self.pending.items() if is_insert_key(k)}
+
+    def pending_updates(self) -> dict:
+        """Return pending changes of existing reviews as {review_id: final state}."""
+        return {int(k): v for k, v in self.pending.items() if not is_insert_key(k)}
+
+
+def _empty_review_entry() -> dict:
+    return {"status": None, "text": None, "photo_link": None, "job_key": None}
+
+
+def _fold_operations(ops: list) -> dict:
+    """Merge an old-style list of operations into one final state."""
+    if ops and ops[0].get("action") == "insert":
+        insert = ops[0]
+        return {"insert": True, "platform_number": insert["platform_number"],
+                "date": insert["date"], "text": insert["text"]}
+    entry = _empty_review_entry()
+    for op in ops:
+        if op["action"] == "status":
+            entry["status"] = op["value"]
+        elif op["action"] == "text":
+            entry["text"] = op["value"]
+        elif op["action"] == "photo":
+            entry["status"] = "approved"
+            entry["photo_link"] = op["value"] or entry["photo_link"]
+            entry["job_key"] = op.get("job_key") or entry["job_key"]
+    return entry
+
+
+def is_insert_key(key) -> bool:
+    """Check whether a key refers to a review that is not yet in the DB."""
+    return isinstance(key, str) and key.startswith(INSERT_KEY_PREFIX)
+
+
+async def load_session(state: FSMContext) -> ReviewSession:
+    """Load the reviews session from FSM data (a single storage read)."""
+    return ReviewSession.from_data(await state.get_data())
+
+
+async def save_session(state: FSMContext, session: ReviewSession):
+    """Write the reviews session back to FSM data (a single storage write)."""
+    await state.update_data(**session.to_data())
@@ -1,5 +1,6 @@
 import os
 import asyncio
+import argparse
 import asyncpg
 from dotenv import load_dotenv
 
@@ -79,7 +80,7 @@ async def create_database():
             await conn.close()
 
 
-async def main():
+async def setup():
     # Сначала создаем нужную роль (если она отсутствует)
     await create_role_if_not_exists()
     # Затем создаем базу данных, если её ещё не существует
@@ -91,15 +92,70 @@ async def main():
 
     # Инициализируем Google сервисы (Sheets/Drive)
     init_google_services()
-    # Инициализируем базу данных: создаются все таблицы, если их еще нет
-    await init_db()
+    # Инициализируем базу данных: применяются все миграции схемы, которые ещё не применены
+    repo = await init_db()
     # Если таблица клиентов пуста — считаем, что это первый запуск и импортируем данные из Google Sheets
     if await is_clients_empty():
-        await import_initial_data()
+        await import_initial_data(repo)
         print("Initial data imported from Google Sheets successfully.")
     else:
         print("Database already contains data; no import needed.")
 
 
+async def connect_target():
+    """Подключение к целевой базе данных от имени DB_USER."""
+    return await asyncpg.connect(
+        host=DB_HOST,
+        port=int(DB_PORT),
+        user=DB_USER,
+        password=DB_PASSWORD,
+        database=DB_NAME
+    )
+
+
+async def run_migrations(target=None):
+    """Применяет ещё не применённые миграции (до версии target включительно, если она задана)."""
+    import migrations
+    conn = await connect_target()
+    try:
+        applied = await migrations.migrate(conn, target)
+        if applied:
+            print(f"Applied migrations: {', '.join(map(str, applied))}.")
+        else:
+            print("Schema is up to date.")
+    finally:
+        await conn.close()
+
+
+async def show_status():
+    """Печатает список миграций и отмечает, какие из них уже применены."""
+    import migrations
+    conn = await connect_target()
+    try:
+        applied = set(await migrations.get_applied_versions(conn))
+    finally:
+        await conn.close()
+    for migration in sorted(migrations.MIGRATIONS, key=lambda m: m.version):
+        mark = "x" if migration.version in applied else " "
+        print(f"[{mark}] {migration.version:04d} {migration.name}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Настройка базы данных бота отзывов.")
+    commands = parser.add_subparsers(dest="command")
+    commands.add_parser("setup", help="создать роль и базу, применить миграции и импортировать данные (по умолчанию)")
+    migrate_parser = commands.add_parser("migrate", help="применить ещё не применённые миграции схемы")
+    migrate_parser.add_argument("--to", type=int, default=None, help="применить миграции только до этой версии")
+    commands.add_parser("status", help="показать применённые и ожидающие миграции")
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        asyncio.run(run_migrations(args.to))
+    elif args.command == "status":
+        asyncio.run(show_status())
+    else:
+        asyncio.run(setup())
+
+
 if __name__ == "__main__":
-    asyncio.run(main())
+    main()
@@ -0,0 +1,137 @@
+"""Background workers for durable photo upload jobs.
+
+Jobs are rows of photo_upload_jobs, claimed with FOR UPDATE SKIP LOCKED so any number of workers
+(in one or several bot processes) can run side by side. A job survives restarts: jobs left in
+'running' by a crashed process are picked up again. Failed uploads are retried with exponential
+backoff; when a job finishes, its folder link is written to the review (if the client already sent
+the report) and the client is notified.
+
+Jobs without a review upload a platform photo pack: the photos go into a new "Пак фото" folder
+inside the platform folder and the pack is recorded in photo_packs once the upload is finished."""
+import os
+import asyncio
+import hashlib
+import logging
+
+from database import (claim_upload_jobs, set_upload_job_folder, retry_upload_job, finish_upload_job,
+                      update_review_photo, create_photo_pack)
+from drive_folders import DriveFolderManager, folder_link
+from drive_uploads import upload_photos, get_dedup_stats
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_WORKERS = int(os.getenv("UPLOAD_WORKERS", "2"))
+MAX_ATTEMPTS = 5
+# Jobs claimed by a worker at once; their missing review folders are created in one Drive batch
+JOBS_PER_CLAIM = 5
+# Seconds to wait between polls when the queue is empty
+POLL_INTERVAL = 2
+
+
+def make_job_key(review_id: int, unique_ids: list) -> str:
+    """Idempotency key of an upload: the same photos for the same review map to the same job."""
+    digest = hashlib.sha1("|".join(sorted(unique_ids)).encode()).hexdigest()
+    return f"review:{review_id}:{digest}"
+
+
+def make_pack_job_key(platform_id: int, unique_ids: list) -> str:
+    """Idempotency key of a platform photo pack upload."""
+    digest = hashlib.sha1("|".join(sorted(unique_ids)).encode()).hexdigest()
+    return f"pack:{platform_id}:{digest}"
+
+
+def backoff_delay(attempts: int) -> int:
+    """Delay before the next attempt: 30s, 60s, 120s, ... capped at 30 minutes."""
+    return min(30 * 2 ** (attempts - 1), 1800)
+
+
+async def process_job(bot, job, folder_id: str):
+    """Run one claimed job: upload the files into its folder and record the outcome."""
+    job_id = job["id"]
+    if job["folder_id"] != folder_id:
+        await set_upload_job_folder(job_id, folder_id, folder_link(folder_id))
+    results = await upload_photos(bot, list(job["file_ids"]), folder_id)
+    failed = [r for r in results if not r.ok]
+    logger.info("Upload job %s: %s photos, %s reused, %s failed; dedup totals %s", job_id, len(results),
+                sum(1 for r in results if r.deduplicated), len(failed), get_dedup_stats())
+    if failed and job["attempts"] < MAX_ATTEMPTS:
+        await retry_upload_job(job_id, [r.file_id for r in failed], backoff_delay(job["attempts"]), failed[0].error)
+        return
+    row = await finish_upload_job(job_id, "failed" if failed else "done", failed[0].error if failed else None)
+    if row["review_id"] is None:
+        # Photo pack: record it if at least part of the photos made it to Drive
+        if len(failed) < len(results):
+            await create_photo_pack(row["client_id"], row["platform_id"], row["folder_link"])
+        if failed:
+            text = f"Пак фотографий загружен не полностью: {len(failed)} из {len(results)} фото не удалось загрузить."
+        else:
+            text = f"Пак фотографий загружен ({len(results)} фото): {row['folder_link']}"
+    else:
+        if row["apply_on_finish"] and row["folder_link"]:
+            await update_review_photo(row["review_id"], row["folder_link"])
+        if failed:
+            text = f"Не удалось загрузить {len(failed)} фото к отзыву. Попробуйте добавить их ещё раз."
+        else:
+            text = "Фотографии к отзыву загружены."
+    try:
+        await bot.send_message(job["chat_id"], text)
+    except Exception as e:
+        logger.error(f"Failed to notify chat {job['chat_id']} about upload job {job_id}: {e}")
+
+
+async def _record_failure(job, error: str):
+    """Retry a job that crashed, or give up on it after MAX_ATTEMPTS."""
+    try:
+        if job["attempts"] < MAX_ATTEMPTS:
+            await retry_upload_job(job["id"], list(job["file_ids"]), backoff_delay(job["attempts"]), error)
+        else:
+            await finish_upload_job(job["id"], "failed", error)
+    except Exception as db_error:
+        logger.error(f"Failed to record the outcome of upload job {job['id']}: {db_error}")
+
+
+async def process_jobs(bot, jobs, folders: DriveFolderManager):
+    """Resolve the folders of several jobs at once, then run the jobs concurrently."""
+    review_ids = [job["review_id"] for job in jobs if not job["folder_id"] and job["review_id"] is not None]
+    pack_jobs = [job for job in jobs if not job["folder_id"] and job["review_id"] is None]
+    try:
+        review_folders = await folders.get_review_folders(review_ids)
+        pack_folders = dict(zip([job["id"] for job in pack_jobs],
+                                await folders.create_pack_folders([job["platform_id"] for job in pack_jobs])))
+    except Exception as e:
+        logger.error(f"Failed to prepare Drive folders for upload jobs: {e}")
+        for job in jobs:
+            await _record_failure(job, str(e))
+        return
+
+    async def run(job):
+        folder_id = job["folder_id"] or review_folders.get(job["review_id"]) or pack_folders.get(job["id"])
+        try:
+            if not folder_id:
+                raise RuntimeError(f"review {job['review_id']} not found")
+            await process_job(bot, job, folder_id)
+        except Exception as e:
+            logger.error(f"Upload job {job['id']} failed: {e}")
+            await _record_failure(job, str(e))
+
+    await asyncio.gather(*(run(job) for job in jobs))
+
+
+async def upload_worker(bot, folders: DriveFolderManager):
+    """Claim and process upload jobs forever."""
+    while True:
+        try:
+            jobs = await claim_upload_jobs(JOBS_PER_CLAIM)
+        except Exception as e:
+            logger.error(f"Failed to claim upload jobs: {e}")
+            jobs = []
+        if not jobs:
+            await asyncio.sleep(POLL_INTERVAL)
+            continue
+        await process_jobs(bot, jobs, folders)
+
+
+def start_upload_workers(bot, repo, count: int = UPLOAD_WORKERS) -> list:
+    """Start the background upload workers. Returns their tasks."""
+    folders = DriveFolderManager(bot.drive_folder_id, repo)
+    return [asyncio.create_task(upload_worker(bot, folders)) for _ in range(count)]
@@ -2,43 +2,17 @@
 """Utility functions for the Telegram bot.
 
 Включает вспомогательные функции:
-- загрузка и сохранение данных клиентов из файла JSON,
-- поиск клиентов по номеру,
 - экранирование HTML в тексте,
 - разбиение длинных сообщений,
 - проверка URL,
-- отслеживание отправленных сообщений и их очистка."""
-import json
+- разбор номеров отзывов, выбранных пользователем,
+- отслеживание отправленных сообщений и их очистка.
+
+Данные клиентов хранятся только в базе данных (см. database.py)."""
 import html
 import re
 from urllib.parse import urlparse
 from aiogram.fsm.context import FSMContext
-import config
-
-def load_clients() -> dict:
-    """Загрузить словарь клиентов из файла clients.json (если файл отсутствует, вернуть пустой словарь)."""
-    try:
-        with open("clients.json", "r", encoding="utf-8") as file:
-            return json.load(file)
-    except FileNotFoundError:
-        return {}
-
-def save_clients(clients_data: dict) -> None:
-    """Сохранить текущий словарь клиентов в файл clients.json."""
-    with open("clients.json", "w", encoding="utf-8") as file:
-        json.dump(clients_data, file, indent=4, ensure_ascii=False)
-
-# Глобальный словарь клиентов, загружается при импорте модуля
-clients = load_clients()
-
-def find_client_key(client_number: str):
-    """Найти идентификатор клиента (ключ словаря) по номеру клиента. Если не найдено, вернуть None."""
-    pattern = re.compile(r"КЛИЕНТ\s+(\d+)", re.IGNORECASE)
-    for key in clients.keys():
-        m = pattern.search(key)
-        if m and m.group(1) == str(client_number):
-            return key
-    return None
 
 def escape_html_text(text: str) -> str:
     """Экранировать текст для безопасного отображения в HTML-сообщениях."""
@@ -56,8 +30,24 @@ def is_valid_url(url: str) -> bool:
     except Exception:
         return False
 
+def parse_review_numbers(text: str) -> set:
+    """Разобрать ввод вида "1,3,5-7" в множество номеров отзывов."""
+    nums = set()
+    for part in re.split(r"[,\s]+", text.strip()):
+        if '-' in part:
+            try:
+                start, end = part.split('-')
+                for n in range(int(start), int(end)+1):
+                    nums.add(n)
+            except:
+                pass
+        elif part.isdigit():
+            nums.add(int(part))
+    return nums
+
 async def send_and_track(chat_id: int, text: str, state: FSMContext, **kwargs):
     """Отправить сообщение и сохранить его message_id в состоянии FSM для последующей очистки."""
+    import config  # импорт здесь: config проверяет переменные окружения и создаёт бота
     if not text or not text.strip():
         return None
     msg = await config.bot.send_message(chat_id, text, **kwargs)
@@ -69,6 +59,7 @@ async def send_and_track(chat_id: int, text: str, state: FSMContext, **kwargs):
 
 async def clear_all_messages(chat_id: int, state: FSMContext):
     """Удалить все сохранённые ботом сообщения в данном чате, кроме текущего выбранного отзыва (если такой есть)."""
+    import config  # импорт здесь: config проверяет переменные окружения и создаёт бота
     data = await state.get_data()
     selected_review_msg_id = data.get("selected_review_msg_id")
     print(f"DEBUG: Сообщение с отзывом (ID: {selected_review_msg_id}) должно остаться.")
@@ -112,11 +103,3 @@ async def clear_all_messages(chat_id: int, state: FSMContext):
     if selected_review_msg_id:
         new_data["selected_review_msg_id"] = selected_review_msg_id
     await state.set_data(new_data)
-
-async def add_pending_change(state: FSMContext, change: dict):
-    """Добавить отложенное изменение (непосредственно не сохранённое в таблице) в состояние FSM."""
-    data = await state.get_data()
-    pending = data.get("pending_changes", [])
-    pending.append(change)
-    await state.update_data(pending_changes=pending)
-